@@ -1,13 +1,28 @@
-from flask import Flask
+from flask import Flask, Request
 from flask_login import LoginManager
 from config import get_config
 from .models.database import db, init_database, init_database_docker
 from .models import User
+from .utils.metrics import init_metrics
+from .services.outbox import init_outbox
+from .services.job_queue import init_job_queue
+from io import BytesIO
 import os
 
+class InMemoryUploadRequest(Request):
+    """Request that keeps file uploads in memory instead of spooling them to disk.
+
+    Upload size is already bounded by MAX_CONTENT_LENGTH, so the parser can
+    read the buffer directly without a temp file round trip.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
 def create_app(config_name=None):
     """Application factory pattern."""
     app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
     
     # Load configuration
     if config_name is None:
@@ -30,6 +45,15 @@ def create_app(config_name=None):
     def load_user(user_id):
         return User.query.get(int(user_id))
     
+    # Request timing, Server-Timing headers and /metrics histograms
+    init_metrics(app)
+    
+    # Background delivery of queued emails
+    init_outbox(app)
+    
+    # Pick up audit jobs queued before a restart
+    init_job_queue(app)
+    
     # Register blueprints
     from .web import web_bp
     from .api import api_bp
@@ -1,39 +1,138 @@
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, url_for, g
 from flask_login import login_required, current_user
 from datetime import datetime
-import tempfile
-import os
+import calendar
 import json
+import zipfile
+from itertools import chain
 from . import api_bp
-from ..models import User, EmailAudit
+from ..models import User, AuditJob
 from ..models.database import db
-from ..services.audit_service import AuditService
+from ..services.audit_service import AuditService, AUDIT_MODES, DEFAULT_AUDIT_FIELDS
+from ..services.email_parser import iter_mbox, count_mbox_messages
+from ..services.job_queue import enqueue_audit
+from ..services.health import get_health_monitor
+from ..services.rollups import get_user_stats
 from ..utils.rate_limiter import RateLimiter
+from ..utils.metrics import timed
+from ..utils.api_key_cache import ApiIdentity, get_api_key_cache
 import secrets
-import tempfile
 
-@api_bp.route('/audit', methods=['POST'])
-def audit_email():
-    """API endpoint to audit an email file."""
-    # Check API key
+def _authenticate_api_request():
+    """Resolve the X-API-Key header to an ApiIdentity, or an error response."""
     api_key = request.headers.get('X-API-Key')
     if not api_key:
-        return jsonify({'error': 'API key required'}), 401
+        return None, (jsonify({'error': 'API key required'}), 401)
     
-    user = User.query.filter_by(api_key=api_key).first()
-    if not user:
-        return jsonify({'error': 'Invalid API key'}), 401
+    api_key_cache = get_api_key_cache()
+    identity = api_key_cache.get(api_key)
+    if identity is None:
+        row = db.session.query(User.id, User.subscription_tier).filter_by(api_key=api_key).first()
+        if not row:
+            return None, (jsonify({'error': 'Invalid API key'}), 401)
+        identity = ApiIdentity(row.id, row.subscription_tier)
+        api_key_cache.put(api_key, identity)
     
-    # Check rate limit
+    return identity, None
+
+def _reserve_rate_limit(user, amount: int = 1) -> bool:
+    """Reserve `amount` audits against the daily limit and keep the figures for the X-RateLimit-* headers.
+
+    The day of the reservation is kept in g.reserved_on, for the save or refund that releases it.
+    """
     rate_limiter = RateLimiter()
-    if not rate_limiter.check_limit(user.id):
-        return jsonify({'error': 'Daily limit exceeded'}), 429
+    g.reserved_on = rate_limiter.reserve(user.id, amount, subscription_tier=user.subscription_tier)
+    g.rate_limit = rate_limiter.get_usage(user.id, subscription_tier=user.subscription_tier)
+    return g.reserved_on is not None
+
+def _refund_rate_limit(user, amount: int = 1):
+    """Give back reserved audits that were not saved, in the limit and this request's headers."""
+    if amount <= 0:
+        return
+    try:
+        RateLimiter().release(user.id, amount, g.reserved_on)
+    except Exception as e:
+        current_app.logger.error(f"Error refunding {amount} audits to user {user.id}: {str(e)}")
+        return
+    usage = g.get('rate_limit')
+    if usage:
+        usage['today_usage'] -= amount
+        usage['remaining'] = max(0, usage['daily_limit'] - usage['today_usage'])
+
+@api_bp.after_request
+def add_rate_limit_headers(response):
+    usage = g.get('rate_limit')
+    if usage:
+        response.headers['X-RateLimit-Limit'] = str(usage['daily_limit'])
+        response.headers['X-RateLimit-Remaining'] = str(usage['remaining'])
+        response.headers['X-RateLimit-Reset'] = str(calendar.timegm(RateLimiter.reset_time().utctimetuple()))
+    return response
+
+def _iter_mbox_upload(name: str, stream):
+    for i, message in enumerate(iter_mbox(stream)):
+        yield f"{name}#{i + 1}", message
+
+def _iter_zip_members(archive: zipfile.ZipFile, members: list):
+    with archive:
+        for info in members:
+            yield info.filename, archive.read(info)
+
+def _collect_batch_files():
+    """Validate uploaded .eml files, .zip or .mbox archives.
     
-    # Get email content
-    if 'file' not in request.files:
+    Returns the number of messages and a lazy iterator of (name, bytes)
+    pairs, so archives are read one message at a time.
+    """
+    max_size = current_app.config['MAX_CONTENT_LENGTH']
+    count = 0
+    sources = []
+    for upload in request.files.getlist('files') + request.files.getlist('file'):
+        name = upload.filename or ''
+        lower_name = name.lower()
+        if lower_name.endswith('.eml'):
+            count += 1
+            sources.append([(name, upload.read())])
+        elif lower_name.endswith('.mbox'):
+            count += count_mbox_messages(upload.stream)
+            upload.stream.seek(0)
+            sources.append(_iter_mbox_upload(name, upload.stream))
+        elif lower_name.endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                raise ValueError(f"{name} is not a valid zip archive")
+            members = []
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith('.eml'):
+                    continue
+                if info.file_size > max_size:
+                    raise ValueError(f"Archive member {info.filename} is too large")
+                members.append(info)
+            count += len(members)
+            sources.append(_iter_zip_members(archive, members))
+        elif name:
+            raise ValueError(f"Unsupported file type: {name}")
+    return count, chain.from_iterable(sources)
+
+@api_bp.route('/audit', methods=['POST'])
+def audit_email():
+    """API endpoint to audit an email file."""
+    user, error = _authenticate_api_request()
+    if error:
+        return error
+    
+    run_async = request.args.get('async', '').lower() in ('1', 'true', 'yes')
+    mode = request.args.get('mode', 'message').lower()
+    if mode not in AUDIT_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(AUDIT_MODES)}"}), 400
+    
+    # Get email content (reading the multipart body is the upload I/O)
+    with timed('upload'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'error': 'No file provided'}), 400
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
@@ -41,42 +140,141 @@ def audit_email():
     if not file.filename.lower().endswith('.eml'):
         return jsonify({'error': 'Only .eml files are allowed'}), 400
     
-    # Save file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.eml') as tmp:
-        file.save(tmp.name)
-        tmp_path = tmp.name
+    # Reserve the audit up front; a queued job holds its reservation until it finishes
+    if not _reserve_rate_limit(user):
+        return jsonify({'error': 'Daily limit exceeded'}), 429
+    
+    if run_async:
+        try:
+            job = enqueue_audit(user.id, file.filename, file.stream.read(), mode=mode, reserved_on=g.reserved_on)
+        except Exception as e:
+            current_app.logger.error(f"Error queueing audit: {str(e)}")
+            _refund_rate_limit(user)
+            return jsonify({'error': 'Internal server error'}), 500
+        
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('api.get_audit_job', job_id=job.id)
+        }), 202
     
     try:
-        # Audit email
+        # Audit straight from the upload stream; no temp file round trip
         audit_service = AuditService()
-        result = audit_service.audit_email_file(tmp_path, user.id)
-        
-        # Clean up temp file
-        os.unlink(tmp_path)
+        result = audit_service.audit_email_source(
+            file.stream, user.id, file_name=file.filename, mode=mode, reserved_on=g.reserved_on
+        )
         
         return jsonify(result)
         
     except Exception as e:
-        # Clean up temp file on error
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        
         current_app.logger.error(f"Error auditing email: {str(e)}")
+        _refund_rate_limit(user)
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/audit/jobs/<job_id>')
+def get_audit_job(job_id):
+    """Get the status, and once finished the result, of an asynchronous audit."""
+    user, error = _authenticate_api_request()
+    if error:
+        return error
+    
+    job = AuditJob.query.filter_by(id=job_id, user_id=user.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = job.to_dict()
+    if job.status == AuditJob.COMPLETED and job.result:
+        response['result'] = json.loads(job.result)
+    return jsonify(response)
+
+@api_bp.route('/audit/batch', methods=['POST'])
+def audit_email_batch():
+    """API endpoint to audit many email files (.eml uploads, a .zip or an .mbox)."""
+    user, error = _authenticate_api_request()
+    if error:
+        return error
+    
+    try:
+        file_count, files = _collect_batch_files()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not file_count:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    max_files = current_app.config.get('BATCH_MAX_FILES', 1000)
+    if file_count > max_files:
+        return jsonify({'error': f'Batch exceeds the limit of {max_files} files'}), 400
+    
+    # Reserve the whole batch at once; files that fail are given back
+    if not _reserve_rate_limit(user, amount=file_count):
+        return jsonify({'error': 'Daily limit exceeded'}), 429
+    
+    try:
+        audit_service = AuditService()
+        result = audit_service.audit_batch(files, user.id, reserved_on=g.reserved_on)
+    except Exception as e:
+        current_app.logger.error(f"Error auditing batch: {str(e)}")
+        _refund_rate_limit(user, file_count)
         return jsonify({'error': 'Internal server error'}), 500
+    _refund_rate_limit(user, file_count - result['succeeded'])
+    return jsonify(result)
+
+@api_bp.route('/audits')
+def list_audits():
+    """Page through the caller's audits, newest first."""
+    user, error = _authenticate_api_request()
+    if error:
+        return error
+    
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else DEFAULT_AUDIT_FIELDS
+    max_limit = current_app.config.get('AUDIT_PAGE_MAX_SIZE', 100)
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= max_limit:
+        return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+    
+    try:
+        page = AuditService().get_audit_page(user.id, fields, limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if page['next_cursor']:
+        page['next_url'] = url_for(
+            'api.list_audits', cursor=page['next_cursor'], limit=limit, fields=','.join(fields)
+        )
+    return jsonify(page)
+
+@api_bp.route('/stats')
+def get_stats():
+    """Audit counts, average scores and per-rule pass rates of the caller, from the rollup tables."""
+    user, error = _authenticate_api_request()
+    if error:
+        return error
+    
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    if not 1 <= days <= 366:
+        return jsonify({'error': 'days must be between 1 and 366'}), 400
+    
+    return jsonify(get_user_stats(user.id, days))
 
 @api_bp.route('/usage')
 def get_usage():
     """Get current usage statistics."""
-    api_key = request.headers.get('X-API-Key')
-    if not api_key:
-        return jsonify({'error': 'API key required'}), 401
-    
-    user = User.query.filter_by(api_key=api_key).first()
-    if not user:
-        return jsonify({'error': 'Invalid API key'}), 401
+    user, error = _authenticate_api_request()
+    if error:
+        return error
     
     rate_limiter = RateLimiter()
-    usage = rate_limiter.get_usage(user.id)
+    usage = rate_limiter.get_usage(user.id, subscription_tier=user.subscription_tier)
+    g.rate_limit = usage
     
     return jsonify(usage)
 
@@ -86,63 +284,44 @@ def manage_api_key():
     """Get or regenerate API key."""
     if request.method == 'POST':
         # Regenerate API key
+        old_api_key = current_user.api_key
         current_user.api_key = secrets.token_urlsafe(32)
         db.session.commit()
+        get_api_key_cache().invalidate(old_api_key)
         return jsonify({'api_key': current_user.api_key})
     else:
         return jsonify({'api_key': current_user.api_key})
 
 @api_bp.route('/health')
 def api_health_check():
-    """Detailed health check endpoint for API monitoring."""
-    try:
-        # Check database connection
-        db.session.execute(text('SELECT 1'))
-        
-        # Check if services can be imported
-        from ..services.email_service import EmailService
-        from ..services.audit_service import AuditService
-        
-        # Get basic stats
-        user_count = User.query.count()
-        audit_count = EmailAudit.query.count()
-        
-        health_status = {
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '2.0.0',
-            'environment': current_app.config.get('FLASK_ENV', 'development'),
-            'services': {
-                'database': {
-                    'status': 'connected',
-                    'users': user_count,
-                    'audits': audit_count
-                },
-                'email_service': 'available',
-                'audit_service': 'available',
-                'rate_limiter': 'available'
-            },
-            'limits': {
-                'free_tier_daily': current_app.config.get('FREE_TIER_DAILY_LIMIT', 5),
-                'premium_tier_daily': current_app.config.get('PREMIUM_TIER_DAILY_LIMIT', 100)
-            }
-        }
-        
-        return jsonify(health_status), 200
-        
-    except Exception as e:
-        health_status = {
-            'status': 'unhealthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '2.0.0',
-            'environment': current_app.config.get('FLASK_ENV', 'development'),
-            'error': str(e),
-            'services': {
-                'database': 'error',
-                'email_service': 'unknown',
-                'audit_service': 'unknown',
-                'rate_limiter': 'unknown'
-            }
+    """Detailed health check endpoint for API monitoring.
+    
+    Serves the worker's background health snapshot; see /health/ready for live checks.
+    """
+    snapshot = get_health_monitor(current_app._get_current_object()).snapshot()
+    healthy = snapshot['status'] == 'healthy'
+    health_status = {
+        'status': snapshot['status'],
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '2.0.0',
+        'environment': current_app.config.get('FLASK_ENV', 'development'),
+        'checked_at': snapshot['checked_at'],
+        'age_seconds': snapshot['age_seconds'],
+        'pid': snapshot['pid'],
+        'services': {
+            'database': snapshot['database'],
+            'email_service': 'available' if healthy else 'unknown',
+            'audit_service': 'available' if healthy else 'unknown',
+            'rate_limiter': 'available' if healthy else 'unknown',
+            'queue': snapshot.get('queue'),
+            'audit_cache': snapshot.get('audit_cache'),
+            'api_key_cache': snapshot.get('api_key_cache')
+        },
+        'limits': {
+            'free_tier_daily': current_app.config.get('FREE_TIER_DAILY_LIMIT', 5),
+            'premium_tier_daily': current_app.config.get('PREMIUM_TIER_DAILY_LIMIT', 100)
         }
-        
-        return jsonify(health_status), 503 
\ No newline at end of file
+    }
+    if not healthy:
+        health_status['error'] = snapshot.get('error')
+    return jsonify(health_status), 200 if healthy else 503 
\ No newline at end of file
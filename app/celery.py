@@ -0,0 +1,57 @@
+"""
+Celery application for asynchronous audits.
+
+Start a worker with: celery -A app.celery worker --loglevel=info
+
+Importing this module does not create the Flask app; each worker process
+creates its own when it starts (worker_process_init), or with its first task
+under pools that do not fork.
+"""
+
+import threading
+from typing import Optional
+from celery import Celery
+from celery.signals import worker_process_init
+from flask import Flask
+from config import get_config
+from .services.job_queue import AUDIT_JOB_TASK
+
+_config = get_config()
+
+celery = Celery(
+    'email_auditor',
+    broker=_config.CELERY_BROKER_URL,
+    backend=_config.CELERY_BROKER_URL
+)
+celery.conf.update(task_acks_late=True, worker_prefetch_multiplier=1)
+
+_flask_app: Optional[Flask] = None
+_flask_app_lock = threading.Lock()
+
+def get_flask_app() -> Flask:
+    """The Flask app of this worker process, created on first use."""
+    global _flask_app
+    if _flask_app is None:
+        with _flask_app_lock:
+            if _flask_app is None:
+                from . import create_app
+                _flask_app = create_app()
+    return _flask_app
+
+@worker_process_init.connect
+def _create_flask_app(**kwargs):
+    get_flask_app()
+
+class AppContextTask(celery.Task):
+    """Run every task inside the Flask application context."""
+
+    def __call__(self, *args, **kwargs):
+        with get_flask_app().app_context():
+            return self.run(*args, **kwargs)
+
+celery.Task = AppContextTask
+
+@celery.task(name=AUDIT_JOB_TASK)
+def process_audit_job_task(job_id: str):
+    from .services.job_queue import process_audit_job
+    process_audit_job(job_id)
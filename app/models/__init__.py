@@ -1,5 +1,12 @@
 from .user import User
 from .otp import OTPCode
 from .audit import EmailAudit
+from .audit_cache import AuditCacheEntry
+from .audit_job import AuditJob
+from .usage import UsageCounter
+from .interned_text import InternedText
+from .audit_rule_result import AuditRuleResult
+from .rule_daily_stat import RuleDailyStat
+from .outbox import OutboxMessage
 
-__all__ = ['User', 'OTPCode', 'EmailAudit'] 
\ No newline at end of file
+__all__ = ['User', 'OTPCode', 'EmailAudit', 'AuditCacheEntry', 'AuditJob', 'UsageCounter', 'InternedText', 'AuditRuleResult', 'RuleDailyStat', 'OutboxMessage'] 
\ No newline at end of file
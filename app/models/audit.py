@@ -3,11 +3,20 @@ from datetime import datetime
 
 class EmailAudit(db.Model):
     __tablename__ = 'email_audits'
+    __table_args__ = (
+        # Per-user history and daily usage scans
+        db.Index('ix_email_audits_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     email_content = db.Column(db.Text, nullable=False)
+    # Full body, zlib-compressed, so the audit can be re-run when the rules change
+    source_text = db.Column(db.LargeBinary)
+    # JSON report; empty when its rule results are kept in audit_rule_results
     audit_result = db.Column(db.Text, nullable=False)
+    score = db.Column(db.Integer)
+    rules_version = db.Column(db.String(32))
     file_name = db.Column(db.String(255))
     file_size = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -21,6 +30,7 @@ class EmailAudit(db.Model):
             'user_id': self.user_id,
             'email_content': self.email_content,
             'audit_result': self.audit_result,
+            'score': self.score,
             'file_name': self.file_name,
             'file_size': self.file_size,
             'created_at': self.created_at.isoformat() if self.created_at else None
@@ -0,0 +1,21 @@
+from .database import db
+from datetime import datetime
+
+class AuditCacheEntry(db.Model):
+    __tablename__ = 'audit_cache'
+    __table_args__ = (
+        db.UniqueConstraint('message_hash', 'rules_version', name='uq_audit_cache_key'),
+        # Expiry sweep
+        db.Index('ix_audit_cache_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    message_hash = db.Column(db.String(64), nullable=False)
+    rules_version = db.Column(db.String(32), nullable=False)
+    email_content = db.Column(db.Text, nullable=False)
+    source_text = db.Column(db.LargeBinary)
+    report = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AuditCacheEntry {self.message_hash[:12]} rules {self.rules_version}>'
@@ -0,0 +1,47 @@
+from .database import db
+from datetime import datetime
+import uuid
+
+class AuditJob(db.Model):
+    __tablename__ = 'audit_jobs'
+    __table_args__ = (
+        # Queue polling and per-user pending counts
+        db.Index('ix_audit_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_audit_jobs_user_status', 'user_id', 'status'),
+    )
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    mode = db.Column(db.String(16), nullable=False, default='message', server_default='message')
+    file_name = db.Column(db.String(255))
+    file_size = db.Column(db.Integer)
+    payload = db.Column(db.LargeBinary)  # Raw message, cleared once processed
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    reserved_on = db.Column(db.Date)  # Day of its rate limit reservation, released when the job finishes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed by the worker while the job runs
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<AuditJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'mode': self.mode,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
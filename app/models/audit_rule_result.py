@@ -0,0 +1,21 @@
+from .database import db
+
+class AuditRuleResult(db.Model):
+    """One rule's outcome within a message audit; its strings live in interned_texts."""
+    __tablename__ = 'audit_rule_results'
+    __table_args__ = (
+        # Per-rule score aggregations
+        db.Index('ix_audit_rule_results_rule', 'rule_text_id'),
+    )
+    
+    audit_id = db.Column(db.Integer, db.ForeignKey('email_audits.id'), primary_key=True)
+    rule_index = db.Column(db.SmallInteger, primary_key=True)
+    rule_text_id = db.Column(db.Integer, db.ForeignKey('interned_texts.id'), nullable=False)
+    description_text_id = db.Column(db.Integer, db.ForeignKey('interned_texts.id'), nullable=False)
+    justification_text_id = db.Column(db.Integer, db.ForeignKey('interned_texts.id'), nullable=False)
+    justification_args = db.Column(db.Text)  # Comma-separated numbers of a justification template; NULL when literal
+    score = db.Column(db.Integer)
+    passed = db.Column(db.Boolean, nullable=False)
+    
+    def __repr__(self):
+        return f'<AuditRuleResult audit {self.audit_id} rule {self.rule_index}: {self.score}>'
@@ -10,6 +10,18 @@ db = SQLAlchemy()
 _db_init_lock = threading.Lock()
 _db_initialized = False
 
+def _create_schema(app, fresh: bool):
+    """Create missing tables; a database created from nothing is already at the latest migration.
+
+    Tables added to a database that already had some still go through
+    `manage_db.py migrate`, which adds the columns and indexes create_all skips.
+    """
+    from .migrations import stamp_migrations
+    db.create_all()
+    app.logger.info("Database tables created successfully.")
+    if fresh:
+        stamp_migrations()
+
 def init_database(app):
     """Safely initialize database tables with concurrency handling."""
     global _db_initialized
@@ -26,7 +38,7 @@ def init_database(app):
                 inspector = inspect(db.engine)
                 existing_tables = inspector.get_table_names()
                 
-                if 'users' in existing_tables and 'otp_codes' in existing_tables:
+                if set(db.metadata.tables).issubset(existing_tables):
                     app.logger.info("Database tables already exist, skipping creation.")
                     _db_initialized = True
                     return True
@@ -36,8 +48,7 @@ def init_database(app):
                 max_retries = 3
                 for attempt in range(max_retries):
                     try:
-                        db.create_all()
-                        app.logger.info("Database tables created successfully.")
+                        _create_schema(app, fresh=not existing_tables)
                         _db_initialized = True
                         return True
                     except Exception as create_error:
@@ -88,7 +99,7 @@ def init_database_docker(app):
                 inspector = inspect(db.engine)
                 existing_tables = inspector.get_table_names()
                 
-                if 'users' in existing_tables and 'otp_codes' in existing_tables:
+                if set(db.metadata.tables).issubset(existing_tables):
                     app.logger.info("Database tables already exist, skipping creation.")
                     return True
                 
@@ -96,8 +107,7 @@ def init_database_docker(app):
                 max_retries = 5
                 for attempt in range(max_retries):
                     try:
-                        db.create_all()
-                        app.logger.info("Database tables created successfully.")
+                        _create_schema(app, fresh=not existing_tables)
                         return True
                     except Exception as create_error:
                         error_msg = str(create_error).lower()
@@ -127,8 +137,10 @@ def reset_database(app):
     """Reset database by dropping and recreating all tables."""
     with app.app_context():
         try:
+            from .migrations import stamp_migrations
             db.drop_all()
             db.create_all()
+            stamp_migrations()
             app.logger.info("Database reset successfully.")
             return True
         except Exception as e:
@@ -0,0 +1,12 @@
+from .database import db
+
+class InternedText(db.Model):
+    """A string stored once and referenced by id, such as a rule description."""
+    __tablename__ = 'interned_texts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    
+    def __repr__(self):
+        return f'<InternedText {self.id}: {self.text[:30]!r}>'
@@ -0,0 +1,303 @@
+import json
+from collections import defaultdict
+from .database import db
+from .audit import EmailAudit
+from .otp import OTPCode
+from .audit_job import AuditJob
+from .audit_cache import AuditCacheEntry
+from .usage import UsageCounter
+from .outbox import OutboxMessage
+from .audit_rule_result import AuditRuleResult
+from .interned_text import InternedText
+from .rule_daily_stat import RuleDailyStat
+from datetime import datetime, time, timedelta
+from sqlalchemy import inspect, select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from typing import List, Tuple, Callable
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    id = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.id}>'
+
+def _create_missing_tables():
+    """Create tables added to the models since the database was initialized."""
+    db.create_all()
+
+def _create_indexes(*tables) -> Callable[[], None]:
+    """Create every index declared on the given models' tables, skipping existing ones."""
+    def migrate():
+        for table in tables:
+            for index in table.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+    return migrate
+
+def add_column(table: str, column: str, ddl: str):
+    """Add a column in place if it is not there yet."""
+    existing = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column not in existing:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+def _add_audit_source_columns():
+    """Full text and rules version of each audit, for re-running it under newer rules."""
+    blob = db.LargeBinary().compile(dialect=db.engine.dialect)
+    add_column('email_audits', 'source_text', blob)
+    add_column('email_audits', 'rules_version', 'VARCHAR(32)')
+    add_column('audit_cache', 'source_text', blob)
+
+def _add_audit_score():
+    """Copy each report's overall score into its own column, so listings skip the JSON."""
+    add_column('email_audits', 'score', 'INTEGER')
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(EmailAudit.id, EmailAudit.audit_result)
+            .where(EmailAudit.id > last_id, EmailAudit.score.is_(None))
+            .order_by(EmailAudit.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            try:
+                updates.append({'id': row.id, 'score': json.loads(row.audit_result).get('score')})
+            except (ValueError, AttributeError):
+                continue
+        if updates:
+            db.session.execute(update(EmailAudit), updates)
+        db.session.commit()
+        last_id = rows[-1].id
+
+def _normalize_audit_results():
+    """Move the rule results of message audits out of their JSON reports into rule rows."""
+    from ..services.audit_store import is_normalized, prepare_reports, save_rule_results
+    db.create_all()
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(EmailAudit.id, EmailAudit.audit_result)
+            .where(EmailAudit.id > last_id, EmailAudit.audit_result != '')
+            .order_by(EmailAudit.id).limit(500)
+        ).all()
+        db.session.rollback()
+        if not rows:
+            break
+        reports = []
+        for row in rows:
+            try:
+                report = json.loads(row.audit_result)
+            except ValueError:
+                continue
+            if isinstance(report, dict) and is_normalized(report):
+                reports.append((row.id, report))
+        prepare_reports(report for _, report in reports)
+        if reports:
+            save_rule_results(reports)
+            db.session.execute(update(EmailAudit), [{'id': audit_id, 'audit_result': ''} for audit_id, _ in reports])
+        db.session.commit()
+        last_id = rows[-1].id
+
+def _add_rollups():
+    """Score sums on the daily usage counters and per-rule daily stats, filled from all audits."""
+    from ..services.rollups import rebuild_rollups
+    add_column('usage_counters', 'score_sum', 'BIGINT NOT NULL DEFAULT 0')
+    # rebuild_rollups keeps reservations, which have their own column since 0014
+    add_column('usage_counters', 'reserved', 'INTEGER NOT NULL DEFAULT 0')
+    db.create_all()
+    _create_indexes(UsageCounter)()
+    rebuild_rollups()
+
+def _separate_reservations():
+    """Rate limit reservations of unfinished jobs in their own column, apart from the audits saved.
+
+    For each user and day with queued or running jobs, the saved count is
+    recounted from email_audits and the jobs are reserved on that day.
+    """
+    add_column('usage_counters', 'reserved', 'INTEGER NOT NULL DEFAULT 0')
+    add_column('audit_jobs', 'reserved_on', 'DATE')
+    pending = db.session.query(AuditJob.id, AuditJob.user_id, AuditJob.created_at).filter(
+        AuditJob.status.in_([AuditJob.QUEUED, AuditJob.RUNNING]), AuditJob.created_at.isnot(None)
+    ).all()
+    reservations = defaultdict(list)
+    for job in pending:
+        reservations[job.user_id, job.created_at.date()].append(job.id)
+    for (user_id, day), job_ids in reservations.items():
+        start = datetime.combine(day, time.min)
+        saved = db.session.query(func.count(EmailAudit.id)).filter(
+            EmailAudit.user_id == user_id, EmailAudit.created_at >= start, EmailAudit.created_at < start + timedelta(days=1)
+        ).scalar()
+        updated = UsageCounter.query.filter_by(user_id=user_id, day=day)\
+            .update({'count': saved, 'reserved': len(job_ids)}, synchronize_session=False)
+        if not updated:
+            db.session.add(UsageCounter(user_id=user_id, day=day, count=saved, score_sum=0, reserved=len(job_ids)))
+        AuditJob.query.filter(AuditJob.id.in_(job_ids)).update({'reserved_on': day}, synchronize_session=False)
+    db.session.commit()
+
+def _template_justifications():
+    """Store justifications with numbers as one interned template each, the numbers going to the rule rows.
+
+    The old per-message strings are deleted once nothing refers to them, so
+    run this before starting workers of the new version (startup.py does).
+    """
+    from ..services.audit_store import intern_texts, split_justification
+    add_column('audit_rule_results', 'justification_args', 'TEXT')
+    literal = select(AuditRuleResult.justification_text_id).where(AuditRuleResult.justification_args.is_(None))
+    splits = {}
+    for text_id, text in db.session.execute(
+        select(InternedText.id, InternedText.text).where(InternedText.id.in_(literal.distinct()))
+    ):
+        template, args = split_justification(text)
+        if args is not None:
+            splits[text_id] = (template, args)
+    db.session.rollback()
+    if not splits:
+        return
+    ids = intern_texts(template for template, _ in splits.values())
+    for text_id, (template, args) in splits.items():
+        db.session.execute(
+            update(AuditRuleResult)
+            .where(AuditRuleResult.justification_text_id == text_id, AuditRuleResult.justification_args.is_(None))
+            .values(justification_text_id=ids[template], justification_args=args)
+        )
+    old_ids = list(splits)
+    for i in range(0, len(old_ids), 500):
+        orphaned = delete(InternedText).where(InternedText.id.in_(old_ids[i:i + 500]))
+        for column in (AuditRuleResult.rule_text_id, AuditRuleResult.description_text_id,
+                       AuditRuleResult.justification_text_id, RuleDailyStat.rule_text_id):
+            orphaned = orphaned.where(InternedText.id.notin_(select(column)))
+        db.session.execute(orphaned)
+    db.session.commit()
+
+def _rebuild_otp_codes():
+    """Recreate otp_codes as one hashed code per user.
+
+    Old rows hold plaintext codes valid for minutes at most, so they are
+    dropped rather than converted; users with a pending login request a new code.
+    """
+    inspector = inspect(db.engine)
+    if 'otp_codes' in inspector.get_table_names():
+        if 'code_hash' in {c['name'] for c in inspector.get_columns('otp_codes')}:
+            return
+        OTPCode.__table__.drop(db.engine)
+    OTPCode.__table__.create(db.engine)
+
+def _backfill_usage_counters():
+    """Seed today's usage counters from email_audits for users with no counter yet."""
+    start = datetime.combine(datetime.utcnow().date(), time.min)
+    counted = {user_id for (user_id,) in db.session.query(UsageCounter.user_id).filter_by(day=start.date())}
+    rows = db.session.query(EmailAudit.user_id, func.count(EmailAudit.id))\
+        .filter(EmailAudit.created_at >= start, EmailAudit.created_at < start + timedelta(days=1))\
+        .group_by(EmailAudit.user_id)
+    for user_id, count in rows:
+        if user_id not in counted:
+            db.session.add(UsageCounter(user_id=user_id, day=start.date(), count=count))
+    db.session.commit()
+
+# Ordered; append new steps, never reorder or rename applied ones
+MIGRATIONS: List[Tuple[str, str, Callable[[], None]]] = [
+    ('0001_create_missing_tables', 'Create tables missing from the database', _create_missing_tables),
+    ('0002_hot_path_indexes', 'Composite indexes for audit history, OTP and job lookups',
+     _create_indexes(EmailAudit, OTPCode, AuditJob)),
+    ('0003_backfill_usage_counters', "Seed today's usage counters from existing audits", _backfill_usage_counters),
+    ('0004_audit_job_mode', 'Audit mode (message or thread) of queued jobs',
+     lambda: add_column('audit_jobs', 'mode', "VARCHAR(16) NOT NULL DEFAULT 'message'")),
+    ('0005_audit_source_text', 'Compressed full text and rules version of audits, for re-audits',
+     _add_audit_source_columns),
+    ('0006_audit_score', 'Overall score of audits as a column, backfilled from their reports', _add_audit_score),
+    ('0007_audit_rule_results', 'Per-rule results of message audits as rows with interned texts',
+     _normalize_audit_results),
+    ('0008_rollups', 'Daily score sums per user and per rule, rebuilt from existing audits', _add_rollups),
+    ('0009_outbox_messages', 'Outbox of emails delivered by the background sender', _create_missing_tables),
+    ('0010_otp_store', 'One hashed OTP per user with attempt counts, replacing plaintext codes', _rebuild_otp_codes),
+    ('0011_audit_cache_expiry_index', 'Index on audit cache row age for the expiry sweep',
+     _create_indexes(AuditCacheEntry)),
+    ('0012_outbox_retention_index', 'Index on outbox status and age for the retention purge',
+     _create_indexes(OutboxMessage)),
+    ('0013_justification_templates', 'Justifications interned as templates, with their numbers in the rule rows',
+     _template_justifications),
+    ('0014_usage_reservations', 'Rate limit reservations apart from the count of saved audits', _separate_reservations),
+    ('0015_audit_job_heartbeat', 'Heartbeat of running audit jobs',
+     lambda: add_column('audit_jobs', 'heartbeat_at', 'TIMESTAMP')),
+]
+
+def applied_migrations() -> set:
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {row.id for row in SchemaMigration.query.all()}
+
+def stamp_migrations():
+    """Record every migration as applied, for a schema just created from the current models."""
+    applied = applied_migrations()
+    db.session.add_all([SchemaMigration(id=migration_id) for migration_id, _, _ in MIGRATIONS if migration_id not in applied])
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stamped the same schema
+        db.session.rollback()
+
+def pending_migrations() -> List[Tuple[str, str, Callable[[], None]]]:
+    applied = applied_migrations()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def run_migrations(app) -> List[str]:
+    """Apply pending migrations in order and return their ids."""
+    done = []
+    for migration_id, description, migrate in pending_migrations():
+        app.logger.info(f"Applying migration {migration_id}: {description}")
+        migrate()
+        db.session.add(SchemaMigration(id=migration_id))
+        db.session.commit()
+        done.append(migration_id)
+    return done
+
+def hot_queries() -> List[Tuple[str, object]]:
+    """The statements on the request path whose plans should use indexes."""
+    now = datetime.utcnow()
+    return [
+        ('audit history', select(EmailAudit).where(EmailAudit.user_id == 1)
+            .order_by(EmailAudit.created_at.desc()).limit(10)),
+        ('audit history page', select(EmailAudit.id, EmailAudit.created_at, EmailAudit.score).where(
+            EmailAudit.user_id == 1, EmailAudit.created_at <= now,
+            (EmailAudit.created_at < now) | (EmailAudit.id < 1)
+        ).order_by(EmailAudit.created_at.desc(), EmailAudit.id.desc()).limit(21)),
+        ('daily usage', select(UsageCounter.count).where(UsageCounter.user_id == 1, UsageCounter.day == now.date())),
+        ('user stats', select(UsageCounter.day, UsageCounter.count, UsageCounter.score_sum).where(
+            UsageCounter.user_id == 1, UsageCounter.day >= now.date()
+        ).order_by(UsageCounter.day)),
+        ('recent audits', select(func.sum(UsageCounter.count)).where(UsageCounter.day >= now.date() - timedelta(days=29))),
+        ('otp verification', select(OTPCode).where(OTPCode.user_id == 1)),
+        ('otp expiry sweep', select(OTPCode.user_id).where(OTPCode.expires_at <= now)),
+        ('audit cache lookup', select(AuditCacheEntry).where(
+            AuditCacheEntry.message_hash == '0' * 64, AuditCacheEntry.rules_version == '0' * 16
+        ).limit(1)),
+        ('audit cache expiry sweep', select(AuditCacheEntry.id).where(
+            AuditCacheEntry.created_at <= now - timedelta(days=30)
+        )),
+        ('job queue poll', select(AuditJob.id).where(AuditJob.status == AuditJob.QUEUED)
+            .order_by(AuditJob.created_at).limit(1)),
+        ('outbox poll', select(OutboxMessage.id).where(
+            OutboxMessage.status == OutboxMessage.QUEUED, OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.next_attempt_at).limit(1)),
+        ('outbox purge', select(OutboxMessage.id).where(
+            OutboxMessage.status.in_(OutboxMessage.FINISHED), OutboxMessage.created_at <= now - timedelta(days=7)
+        )),
+        ('pending jobs', select(func.count()).select_from(AuditJob).where(
+            AuditJob.user_id == 1, AuditJob.status.in_([AuditJob.QUEUED, AuditJob.RUNNING])
+        )),
+    ]
+
+def explain(statement) -> List[str]:
+    """Query plan of a statement as reported by the database."""
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={'render_postcompile': True})
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + compiled.string, params).fetchall()
+    return [' | '.join(str(value) for value in row) for row in rows]
@@ -1,28 +1,48 @@
 from .database import db
 from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
 
 class OTPCode(db.Model):
     __tablename__ = 'otp_codes'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    code = db.Column(db.String(6), nullable=False)
+    __table_args__ = (
+        # Expiry sweep
+        db.Index('ix_otp_codes_expires_at', 'expires_at'),
+    )
+
+    # One live code per user; issuing a new one replaces it
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    code_hash = db.Column(db.String(64), nullable=False)  # HMAC-SHA256 of the code, never the code itself
+    attempts = db.Column(db.Integer, nullable=False, default=0)
     expires_at = db.Column(db.DateTime, nullable=False)
-    is_used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+
     def __repr__(self):
-        return f'<OTPCode {self.code} for user {self.user_id}>'
-    
+        return f'<OTPCode for user {self.user_id}>'
+
     def is_expired(self):
         return datetime.utcnow() > self.expires_at
-    
+
+    @classmethod
+    def replace(cls, user_id, code_hash, expires_at):
+        """Store a user's new code over any previous one, within the current transaction."""
+        values = {'code_hash': code_hash, 'attempts': 0, 'expires_at': expires_at, 'created_at': datetime.utcnow()}
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(cls).values(user_id=user_id, **values)
+            stmt = stmt.on_conflict_do_update(index_elements=[cls.user_id], set_=values)
+            db.session.execute(stmt)
+            return
+
+        updated = cls.query.filter_by(user_id=user_id).update(values, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(user_id=user_id, **values))
+            db.session.flush()
+
     def to_dict(self):
         return {
-            'id': self.id,
             'user_id': self.user_id,
-            'code': self.code,
+            'attempts': self.attempts,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
-            'is_used': self.is_used,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        } 
\ No newline at end of file
+        }
@@ -0,0 +1,47 @@
+from .database import db
+from datetime import datetime
+import uuid
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox_messages'
+    __table_args__ = (
+        # Sender polling for due messages
+        db.Index('ix_outbox_messages_status_next', 'status', 'next_attempt_at'),
+        # Retention purge of finished messages
+        db.Index('ix_outbox_messages_status_created', 'status', 'created_at'),
+    )
+
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+    FINISHED = (SENT, FAILED, EXPIRED)
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)  # Encrypted with a key derived from SECRET_KEY; cleared once finished with
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)  # Not worth delivering after this, e.g. an OTP past its validity
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'delivery_id': self.id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.status == self.QUEUED and self.next_attempt_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
@@ -0,0 +1,49 @@
+from .database import db
+from sqlalchemy.dialects import postgresql, sqlite
+
+class RuleDailyStat(db.Model):
+    """Per-user, per-day, per-rule totals of message audits, kept up to date on every insert."""
+    __tablename__ = 'rule_daily_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    rule_text_id = db.Column(db.Integer, db.ForeignKey('interned_texts.id'), primary_key=True)
+    evaluated = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RuleDailyStat user {self.user_id} rule {self.rule_text_id} on {self.day}: {self.passed}/{self.evaluated}>'
+    
+    @classmethod
+    def increment(cls, user_id, day, rule_text_id, evaluated, passed, score_sum):
+        """Atomically add to one rule's daily totals within the current transaction."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(cls).values(
+                user_id=user_id, day=day, rule_text_id=rule_text_id,
+                evaluated=evaluated, passed=passed, score_sum=score_sum
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.day, cls.rule_text_id],
+                set_={
+                    'evaluated': cls.evaluated + stmt.excluded.evaluated,
+                    'passed': cls.passed + stmt.excluded.passed,
+                    'score_sum': cls.score_sum + stmt.excluded.score_sum
+                }
+            )
+            db.session.execute(stmt)
+            return
+        
+        updated = cls.query.filter_by(user_id=user_id, day=day, rule_text_id=rule_text_id).update({
+            cls.evaluated: cls.evaluated + evaluated,
+            cls.passed: cls.passed + passed,
+            cls.score_sum: cls.score_sum + score_sum
+        }, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(
+                user_id=user_id, day=day, rule_text_id=rule_text_id,
+                evaluated=evaluated, passed=passed, score_sum=score_sum
+            ))
+            db.session.flush()
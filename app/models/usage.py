@@ -0,0 +1,83 @@
+from .database import db
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+
+class UsageCounter(db.Model):
+    __tablename__ = 'usage_counters'
+    __table_args__ = (
+        # Totals over all users for a day
+        db.Index('ix_usage_counters_day', 'day'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)  # Audits saved
+    score_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Audits accepted but not saved yet
+    
+    def __repr__(self):
+        return f'<UsageCounter user {self.user_id} on {self.day}: {self.count}>'
+    
+    @classmethod
+    def get_count(cls, user_id, day) -> int:
+        """Primary key lookup of a user's usage for one day: audits saved plus those reserved."""
+        used = db.session.query(cls.count + cls.reserved).filter_by(user_id=user_id, day=day).scalar()
+        return used or 0
+    
+    @classmethod
+    def increment(cls, user_id, day, amount=1, score_sum=0):
+        """Atomically add to a user's daily count and score sum within the current transaction."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(cls).values(user_id=user_id, day=day, count=amount, score_sum=score_sum)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.day],
+                set_={'count': cls.count + stmt.excluded.count, 'score_sum': cls.score_sum + stmt.excluded.score_sum}
+            )
+            db.session.execute(stmt)
+            return
+        
+        updated = cls.query.filter_by(user_id=user_id, day=day)\
+            .update({cls.count: cls.count + amount, cls.score_sum: cls.score_sum + score_sum}, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(user_id=user_id, day=day, count=amount, score_sum=score_sum))
+            db.session.flush()
+    
+    @classmethod
+    def reserve(cls, user_id, day, amount, limit) -> bool:
+        """Atomically reserve `amount` audits for a user's day unless usage would exceed `limit`.
+
+        Runs in the current transaction; the caller commits straight away so
+        concurrent requests see the reservation.
+        """
+        if amount > limit:
+            return False
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(cls).values(user_id=user_id, day=day, count=0, score_sum=0, reserved=amount)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.day],
+                set_={'reserved': cls.reserved + stmt.excluded.reserved},
+                where=cls.count + cls.reserved + stmt.excluded.reserved <= limit
+            )
+            return db.session.execute(stmt).rowcount == 1
+        
+        updated = cls.query.filter(cls.user_id == user_id, cls.day == day, cls.count + cls.reserved + amount <= limit)\
+            .update({cls.reserved: cls.reserved + amount}, synchronize_session=False)
+        if updated:
+            return True
+        if db.session.query(cls.count).filter_by(user_id=user_id, day=day).scalar() is not None:
+            return False
+        db.session.add(cls(user_id=user_id, day=day, count=0, score_sum=0, reserved=amount))
+        db.session.flush()
+        return True
+    
+    @classmethod
+    def release(cls, user_id, day, amount):
+        """Drop `amount` of a day's reservations, once their audits are saved or have failed."""
+        cls.query.filter_by(user_id=user_id, day=day).update(
+            {cls.reserved: case((cls.reserved > amount, cls.reserved - amount), else_=0)},
+            synchronize_session=False
+        )
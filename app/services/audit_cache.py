@@ -0,0 +1,213 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from ..models import AuditCacheEntry
+from ..models.database import db
+
+def message_hash(raw: bytes, namespace: str = '') -> str:
+    """Content address of a raw message, optionally namespaced (e.g. by audit mode)."""
+    digest = hashlib.sha256()
+    if namespace:
+        digest.update(namespace.encode() + b'\0')
+    digest.update(raw)
+    return digest.hexdigest()
+
+class AuditCache:
+    """Audit results keyed by message hash and rules version.
+
+    An in-process LRU tier with size and TTL eviction sits in front of the
+    audit_cache table. The rules version is part of the key, so editing
+    rules.json makes every older entry unreachable.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 3600, db_ttl: int = 30 * 86400, persist: bool = True,
+                 sweep_interval: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.persist = persist
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._rules_version: Optional[str] = None
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _check_rules_version(self, rules_version: str):
+        """Drop in-memory entries for older rules once per change.
+
+        Persisted rows of other versions stay: during a rolling deploy old
+        and new workers share the table, and the db_ttl sweep removes rows
+        no version reads any more.
+        """
+        if rules_version == self._rules_version:
+            return
+        with self._lock:
+            if rules_version == self._rules_version:
+                return
+            self._entries.clear()
+            self._rules_version = rules_version
+
+    def sweep(self) -> int:
+        """Delete persisted rows older than db_ttl; returns how many were removed."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.db_ttl)
+        try:
+            removed = AuditCacheEntry.query.filter(AuditCacheEntry.created_at <= cutoff)\
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not sweep expired audit cache rows: {e}")
+            return 0
+        return removed
+
+    def _sweep_if_due(self):
+        """Run sweep at most once per sweep_interval in this process, after a store."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def _remember(self, key: tuple, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, digest: str, rules_version: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached {'report', 'email_content', 'source_text'} entry."""
+        self._check_rules_version(rules_version)
+        key = (digest, rules_version)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                expires_at, entry = cached
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry
+                del self._entries[key]
+
+        if self.persist:
+            row = AuditCacheEntry.query.filter_by(message_hash=digest, rules_version=rules_version).first()
+            if row is not None and row.created_at > datetime.utcnow() - timedelta(seconds=self.db_ttl):
+                entry = {'report': json.loads(row.report), 'email_content': row.email_content, 'source_text': row.source_text}
+                self._remember(key, entry)
+                with self._lock:
+                    self.db_hits += 1
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, digest: str, rules_version: str, report: Dict[str, Any], email_content: str,
+            source_text: Optional[bytes] = None):
+        """Store an audit result in both tiers."""
+        entry = {'report': report, 'email_content': email_content, 'source_text': source_text}
+        self._remember((digest, rules_version), entry)
+        if not self.persist:
+            return
+        try:
+            existing = AuditCacheEntry.query.filter_by(message_hash=digest, rules_version=rules_version).first()
+            if existing is not None:
+                existing.report = json.dumps(report)
+                existing.email_content = email_content
+                existing.source_text = source_text
+                existing.created_at = datetime.utcnow()
+            else:
+                db.session.add(AuditCacheEntry(
+                    message_hash=digest,
+                    rules_version=rules_version,
+                    email_content=email_content,
+                    source_text=source_text,
+                    report=json.dumps(report)
+                ))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker cached the same message first
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not persist audit cache entry: {e}")
+        self._sweep_if_due()
+
+    def put_many(self, rules_version: str, entries: Dict[str, Dict[str, Any]]):
+        """Store many {digest: {'report', 'email_content', 'source_text'}} results with one commit."""
+        for digest, entry in entries.items():
+            self._remember((digest, rules_version), entry)
+        if not self.persist or not entries:
+            return
+        try:
+            digests = list(entries)
+            existing = set()
+            for i in range(0, len(digests), 500):
+                existing.update(digest for (digest,) in db.session.query(AuditCacheEntry.message_hash).filter(
+                    AuditCacheEntry.rules_version == rules_version,
+                    AuditCacheEntry.message_hash.in_(digests[i:i + 500])
+                ))
+            db.session.add_all([
+                AuditCacheEntry(
+                    message_hash=digest,
+                    rules_version=rules_version,
+                    email_content=entry['email_content'],
+                    source_text=entry.get('source_text'),
+                    report=json.dumps(entry['report'])
+                )
+                for digest, entry in entries.items() if digest not in existing
+            ])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not persist audit cache entries: {e}")
+        self._sweep_if_due()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
+
+_cache: Optional[AuditCache] = None
+_cache_lock = threading.Lock()
+
+def get_audit_cache() -> AuditCache:
+    """Get the per-process audit cache, configured from the current app."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = current_app.config
+                _cache = AuditCache(
+                    max_entries=config.get('AUDIT_CACHE_SIZE', 1024),
+                    ttl=config.get('AUDIT_CACHE_TTL', 3600),
+                    db_ttl=config.get('AUDIT_CACHE_DB_TTL', 30 * 86400),
+                    persist=config.get('AUDIT_CACHE_PERSIST', True),
+                    sweep_interval=config.get('AUDIT_CACHE_SWEEP_INTERVAL', 3600.0)
+                )
+    return _cache
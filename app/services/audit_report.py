@@ -30,4 +30,23 @@ class AuditReport:
             'score': self.score,
             'rules': self.rule_results,
             'summary': self.summary
-        } 
\ No newline at end of file
+        } 
+
+class ThreadAuditReport:
+    def __init__(self, message_reports: List[Dict[str, Any]]):
+        self.message_reports = message_reports
+        self.score = self._calculate_score()
+
+    def _calculate_score(self) -> int:
+        scores = [report['score'] for report in self.message_reports]
+        return int(sum(scores) / len(scores)) if scores else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'mode': 'thread',
+            'score': self.score,
+            'lowest_score': min((report['score'] for report in self.message_reports), default=0),
+            'message_count': len(self.message_reports),
+            'evaluated_count': sum(1 for report in self.message_reports if 'duplicate_of' not in report),
+            'messages': self.message_reports
+        }
@@ -1,13 +1,53 @@
+import base64
+import binascii
 import json
 import os
-from typing import Dict, Any
+import time
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from flask import current_app
-from .email_parser import EmailParser
-from .rules_engine import RulesEngine
+from sqlalchemy import insert, select, or_
+from .email_parser import EmailParser, EmailSource
+from .rules_engine import RulesEngine, get_rules_engine
 from .audit_report import AuditReport
-from . import rules_impl
+from .batch_audit import audit_messages, compress_text
+from .thread_audit import audit_thread
+from .audit_cache import get_audit_cache, message_hash
+from .audit_store import prepare_reports, save_rule_results, stored_result, load_reports
+from .rollups import record_audits
 from ..models import EmailAudit, User
 from ..models.database import db
+from ..utils.metrics import timed, record_rule
+
+AUDIT_MODES = ('message', 'thread')
+
+# Fields of /api/audits and the columns each one reads
+AUDIT_FIELDS = {
+    'id': EmailAudit.id,
+    'created_at': EmailAudit.created_at,
+    'file_name': EmailAudit.file_name,
+    'file_size': EmailAudit.file_size,
+    'score': EmailAudit.score,
+    'rules_version': EmailAudit.rules_version,
+    'email_content': EmailAudit.email_content,
+    'report': EmailAudit.audit_result,
+}
+DEFAULT_AUDIT_FIELDS = ('id', 'created_at', 'file_name', 'file_size', 'score')
+
+def encode_cursor(created_at: datetime, audit_id: int) -> str:
+    """Opaque position after an audit in newest-first order."""
+    raw = json.dumps([created_at.isoformat(), audit_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """The (created_at, id) of a cursor; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, audit_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(audit_id)
+    except (binascii.Error, TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
 
 class AuditService:
     """Service for email auditing operations."""
@@ -15,52 +55,106 @@ class AuditService:
     def __init__(self):
         self.rules_path = os.path.join(current_app.root_path, 'rules.json')
     
+    @property
+    def rules_engine(self) -> RulesEngine:
+        """Compiled rule pipeline shared by every audit in this process."""
+        return get_rules_engine(self.rules_path)
+    
+    @property
+    def rules_version(self) -> str:
+        """Version identifier of the active rules file."""
+        return self.rules_engine.version
+    
     def audit_email_content(self, content: Dict[str, Any]) -> Dict[str, Any]:
-        """Audit a single email content."""
-        rules_engine = RulesEngine(self.rules_path)
-        rule_results = []
-        
-        for rule in rules_engine.rules:
-            func = getattr(rules_impl, rule['function'], None)
-            if func:
-                result = func(content['text'])
-                rule_results.append({
-                    'rule_id': rule['id'],
-                    'description': rule['description'],
-                    **result
-                })
-            else:
-                rule_results.append({
-                    'rule_id': rule['id'],
-                    'description': rule['description'],
-                    'passed': False,
-                    'score': 0,
-                    'justification': f"Rule function {rule['function']} not implemented."
-                })
-        
-        return rule_results
+        """Audit a single email content, timing every rule."""
+        with timed('rules'):
+            return self.rules_engine.evaluate(content, on_rule=record_rule)
     
     def audit_email_file(self, file_path: str, user_id: int) -> Dict[str, Any]:
         """Audit an email file and save results."""
+        return self.audit_email_source(file_path, user_id, file_name=os.path.basename(file_path))
+    
+    def audit_email_source(self, source: EmailSource, user_id: int,
+                           file_name: Optional[str] = None, file_size: Optional[int] = None,
+                           mode: str = 'message', reserved_on: Optional[date] = None) -> Dict[str, Any]:
+        """Audit an email given as a path, bytes, memoryview or stream, and save results.
+        
+        mode='message' audits the first message; mode='thread' audits every
+        message of the thread and aggregates a thread score. reserved_on is
+        the day the audit was reserved against the rate limit, released as it
+        is saved.
+        """
+        if mode not in AUDIT_MODES:
+            raise ValueError(f"Unknown audit mode: {mode}")
         try:
-            # Parse email
-            email_parser = EmailParser(file_path)
-            content = email_parser.get_content()
+            with timed('read'):
+                raw = EmailParser.read_source(source)
             
-            # Audit content
-            rule_results = self.audit_email_content(content)
-            report = AuditReport(rule_results).to_dict()
+            # Identical messages under the same rules skip parsing entirely
+            with timed('cache_lookup'):
+                cache = get_audit_cache()
+                digest = message_hash(raw, namespace='' if mode == 'message' else mode)
+                rules_version = self.rules_version
+                cached = cache.get(digest, rules_version)
+            
+            if cached is not None:
+                report = cached['report']
+                email_content = cached['email_content']
+                source_text = cached.get('source_text')
+            else:
+                # Parse email
+                with timed('parse'):
+                    email_parser = EmailParser(raw)
+                with timed('extract'):
+                    content = email_parser.get_content()
+                current_app.logger.debug(
+                    f"Parsed {len(email_parser.messages)} message(s) with "
+                    f"{email_parser.stats['walks']} walks and {email_parser.stats['decodes']} decodes"
+                )
+                
+                # Audit content
+                if mode == 'thread':
+                    with timed('extract'):
+                        thread_content = email_parser.get_thread_content()
+                    # Thread reports span every message, so they are not kept for re-audits
+                    source_text = None
+                    with timed('rules'):
+                        report = audit_thread(
+                            self.rules_path,
+                            thread_content,
+                            max_workers=current_app.config.get('AUDIT_POOL_WORKERS', 1),
+                            min_parallel=current_app.config.get('AUDIT_POOL_MIN_BATCH', 2)
+                        )
+                else:
+                    rule_results = self.audit_email_content(content)
+                    with timed('report'):
+                        report = AuditReport(rule_results).to_dict()
+                    source_text = compress_text(content['text'])
+                email_content = content['text'][:500]  # Store first 500 chars
             
             # Save audit result
+            with timed('intern_texts'):
+                prepare_reports([report])
             audit = EmailAudit(
                 user_id=user_id,
-                email_content=content['text'][:500],  # Store first 500 chars
-                audit_result=json.dumps(report),
-                file_name=os.path.basename(file_path),
-                file_size=os.path.getsize(file_path)
+                email_content=email_content,
+                source_text=source_text,
+                audit_result=stored_result(report),
+                score=report['score'],
+                rules_version=rules_version,
+                file_name=file_name,
+                file_size=file_size if file_size is not None else len(raw)
             )
-            db.session.add(audit)
-            db.session.commit()
+            with timed('db_commit'):
+                db.session.add(audit)
+                db.session.flush()
+                save_rule_results([(audit.id, report)])
+                record_audits(user_id, [report], reserved_on)
+                db.session.commit()
+            
+            if cached is None:
+                with timed('cache_store'):
+                    cache.put(digest, rules_version, report, email_content, source_text)
             
             current_app.logger.info(f"Email audited successfully for user {user_id}")
             return report
@@ -69,6 +163,160 @@ class AuditService:
             current_app.logger.error(f"Error auditing email: {str(e)}")
             raise
     
+    def audit_batch(self, files: Iterable[Tuple[str, bytes]], user_id: int,
+                    reserved_on: Optional[date] = None) -> Dict[str, Any]:
+        """Audit many raw messages and save all results in one bulk insert.
+        
+        `files` may be a lazy iterable (such as a streamed mbox); it is consumed
+        in windows of AUDIT_BATCH_WINDOW messages so raw bytes are never all held at once.
+        The reservations (made on reserved_on) of the saved messages are released with them.
+        """
+        start = time.perf_counter()
+        cache = get_audit_cache()
+        rules_version = self.rules_version
+        window_size = current_app.config.get('AUDIT_BATCH_WINDOW', 64)
+        
+        results: List[Dict[str, Any]] = []
+        fresh: Dict[str, Dict[str, Any]] = {}
+        files = iter(files)
+        while True:
+            window = list(islice(files, window_size))
+            if not window:
+                break
+            digests = [message_hash(data) for _, data in window]
+            
+            # Only cache misses are sent to the process pool
+            window_results: List[Optional[Dict[str, Any]]] = []
+            pending = []
+            for (name, data), digest in zip(window, digests):
+                cached = cache.get(digest, rules_version)
+                if cached is not None:
+                    window_results.append({
+                        'file_name': name,
+                        'file_size': len(data),
+                        'email_content': cached['email_content'],
+                        'source_text': cached.get('source_text'),
+                        'report': cached['report']
+                    })
+                else:
+                    window_results.append(None)
+                    pending.append(len(window_results) - 1)
+            
+            with timed('batch_audit'):
+                audited = audit_messages(
+                    self.rules_path,
+                    [window[i] for i in pending],
+                    max_workers=current_app.config.get('AUDIT_POOL_WORKERS', 1),
+                    min_parallel=current_app.config.get('AUDIT_POOL_MIN_BATCH', 2)
+                )
+            for i, result in zip(pending, audited):
+                window_results[i] = result
+                if 'error' not in result:
+                    fresh[digests[i]] = {
+                        'report': result['report'],
+                        'email_content': result['email_content'],
+                        'source_text': result['source_text']
+                    }
+            results.extend(window_results)
+        
+        saved = [result for result in results if 'error' not in result]
+        rows = [{
+            'user_id': user_id,
+            'email_content': result['email_content'],
+            'source_text': result['source_text'],
+            'audit_result': stored_result(result['report']),
+            'score': result['report']['score'],
+            'rules_version': rules_version,
+            'file_name': result['file_name'],
+            'file_size': result['file_size']
+        } for result in saved]
+        
+        try:
+            if rows:
+                with timed('intern_texts'):
+                    prepare_reports(result['report'] for result in saved)
+                with timed('db_commit'):
+                    audit_ids = db.session.execute(
+                        insert(EmailAudit).returning(EmailAudit.id, sort_by_parameter_order=True), rows
+                    ).scalars().all()
+                    save_rule_results([(audit_id, result['report']) for audit_id, result in zip(audit_ids, saved)])
+                    record_audits(user_id, [result['report'] for result in saved], reserved_on)
+                    db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error saving batch audit: {str(e)}")
+            raise
+        
+        cache.put_many(rules_version, fresh)
+        
+        reports = []
+        for result in results:
+            if 'error' in result:
+                reports.append({'file_name': result['file_name'], 'error': result['error']})
+            else:
+                reports.append({'file_name': result['file_name'], 'file_size': result['file_size'], **result['report']})
+        
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        current_app.logger.info(f"Batch of {len(results)} emails audited for user {user_id} in {elapsed_ms:.1f}ms")
+        return {
+            'total': len(results),
+            'succeeded': len(rows),
+            'failed': len(results) - len(rows),
+            'processing_time_ms': round(elapsed_ms, 2),
+            'results': reports
+        }
+    
+    def get_audit_page(self, user_id: int, fields: Iterable[str] = DEFAULT_AUDIT_FIELDS,
+                       limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """One page of a user's audits, newest first.
+        
+        Pages continue from a (created_at, id) cursor rather than an offset,
+        so every page is an index range scan however deep it is. Only the
+        columns behind the requested fields are read.
+        """
+        fields = list(dict.fromkeys(fields))
+        unknown = [field for field in fields if field not in AUDIT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        
+        columns = [EmailAudit.id, EmailAudit.created_at] + [
+            AUDIT_FIELDS[field] for field in fields if field not in ('id', 'created_at')
+        ]
+        query = select(*columns).where(EmailAudit.user_id == user_id)
+        if cursor:
+            created_at, audit_id = decode_cursor(cursor)
+            # The redundant upper bound lets the (user_id, created_at) index seek to the cursor
+            query = query.where(
+                EmailAudit.created_at <= created_at,
+                or_(EmailAudit.created_at < created_at, EmailAudit.id < audit_id)
+            )
+        rows = db.session.execute(
+            query.order_by(EmailAudit.created_at.desc(), EmailAudit.id.desc()).limit(limit + 1)
+        ).all()
+        
+        reports = load_reports((row.id, row.audit_result) for row in rows[:limit]) if 'report' in fields else {}
+        audits = []
+        for row in rows[:limit]:
+            values = row._mapping
+            audit = {}
+            for field in fields:
+                if field == 'report':
+                    audit[field] = reports[row.id]
+                    continue
+                value = values[AUDIT_FIELDS[field]]
+                if field == 'created_at':
+                    value = value.isoformat() if value else None
+                audit[field] = value
+            audits.append(audit)
+        
+        has_more = len(rows) > limit
+        last = rows[limit - 1] if has_more else None
+        return {
+            'audits': audits,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(last.created_at, last.id) if last is not None else None
+        }
+    
     def get_user_audit_history(self, user_id: int, limit: int = 10) -> list:
         """Get user's audit history."""
         audits = EmailAudit.query.filter_by(user_id=user_id)\
@@ -76,4 +324,5 @@ class AuditService:
             .limit(limit)\
             .all()
         
-        return [audit.to_dict() for audit in audits] 
\ No newline at end of file
+        reports = load_reports((audit.id, audit.audit_result) for audit in audits)
+        return [{**audit.to_dict(), 'audit_result': json.dumps(reports[audit.id])} for audit in audits] 
\ No newline at end of file
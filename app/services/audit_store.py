@@ -0,0 +1,164 @@
+import hashlib
+import json
+import re
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from .audit_report import AuditReport
+from ..models import AuditRuleResult, InternedText
+from ..models.database import db
+
+# Interned ids never change once committed, so every process keeps what it has seen
+_ids: Dict[str, int] = {}
+_texts: Dict[int, str] = {}
+_lock = threading.Lock()
+
+# Counts in justifications vary per message, so they are kept in the rule row instead
+_NUMBER_RE = re.compile(r'[0-9]+')
+
+def split_justification(text: str) -> Tuple[str, Optional[str]]:
+    """Template and comma-separated numbers of a justification; (text, None) when it has no numbers."""
+    numbers = _NUMBER_RE.findall(text)
+    if not numbers:
+        return text, None
+    template = _NUMBER_RE.sub('{}', text.replace('{', '{{').replace('}', '}}'))
+    return template, ','.join(numbers)
+
+def join_justification(template: str, args: Optional[str]) -> str:
+    return template if args is None else template.format(*args.split(','))
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _remember(rows):
+    with _lock:
+        for text_id, text in rows:
+            _ids[text] = text_id
+            _texts[text_id] = text
+
+def intern_texts(texts: Iterable[str]) -> Dict[str, int]:
+    """Ids of the given strings, storing the new ones.
+
+    New strings are committed straight away, so call this before staging
+    other changes in the session.
+    """
+    texts = set(texts)
+    missing = [text for text in texts if text not in _ids]
+    if missing:
+        digests = {_digest(text): text for text in missing}
+        rows = [{'digest': digest, 'text': text} for digest, text in digests.items()]
+        dialect = db.session.get_bind().dialect.name
+        try:
+            if dialect in ('sqlite', 'postgresql'):
+                dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+                db.session.execute(dialect_insert(InternedText).on_conflict_do_nothing(index_elements=['digest']), rows)
+            else:
+                existing = {digest for (digest,) in db.session.query(InternedText.digest)
+                            .filter(InternedText.digest.in_(list(digests)))}
+                new_rows = [row for row in rows if row['digest'] not in existing]
+                if new_rows:
+                    db.session.execute(insert(InternedText), new_rows)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker interned the same strings first
+            db.session.rollback()
+        _remember(db.session.execute(
+            select(InternedText.id, InternedText.text).where(InternedText.digest.in_(list(digests)))
+        ).all())
+    return {text: _ids[text] for text in texts}
+
+def texts_by_id(text_ids: Iterable[int]) -> Dict[int, str]:
+    text_ids = set(text_ids)
+    missing = [text_id for text_id in text_ids if text_id not in _texts]
+    if missing:
+        _remember(db.session.execute(
+            select(InternedText.id, InternedText.text).where(InternedText.id.in_(missing))
+        ).all())
+    return {text_id: _texts[text_id] for text_id in text_ids}
+
+def is_normalized(report: Dict[str, Any]) -> bool:
+    """Whether a report is stored as rule rows; thread reports stay JSON."""
+    return 'rules' in report and report.get('mode') is None
+
+def stored_result(report: Dict[str, Any]) -> str:
+    """Value of EmailAudit.audit_result for a report; empty when it is kept as rule rows."""
+    return '' if is_normalized(report) else json.dumps(report)
+
+def _report_texts(report: Dict[str, Any]) -> List[str]:
+    texts = []
+    for rule in report['rules']:
+        texts.extend((rule['rule_id'], rule['description'], split_justification(rule['justification'])[0]))
+    return texts
+
+def save_rule_results(audits: List[Tuple[int, Dict[str, Any]]]):
+    """Stage the rule rows of (audit id, report) pairs; the caller commits.
+
+    Run prepare_reports on the reports before staging anything else, so
+    that no interning commit lands in the middle of the caller's transaction.
+    """
+    audits = [(audit_id, report) for audit_id, report in audits if is_normalized(report)]
+    if not audits:
+        return
+    ids = intern_texts(text for _, report in audits for text in _report_texts(report))
+    rows = []
+    for audit_id, report in audits:
+        for index, rule in enumerate(report['rules']):
+            template, args = split_justification(rule['justification'])
+            rows.append({
+                'audit_id': audit_id,
+                'rule_index': index,
+                'rule_text_id': ids[rule['rule_id']],
+                'description_text_id': ids[rule['description']],
+                'justification_text_id': ids[template],
+                'justification_args': args,
+                'score': rule['score'],
+                'passed': bool(rule['passed']),
+            })
+    if rows:
+        db.session.execute(insert(AuditRuleResult), rows)
+
+def prepare_reports(reports: Iterable[Dict[str, Any]]):
+    """Intern the strings of reports about to be saved, before the session has pending changes."""
+    intern_texts(text for report in reports if is_normalized(report) for text in _report_texts(report))
+
+def delete_rule_results(audit_ids: List[int]):
+    if audit_ids:
+        db.session.execute(delete(AuditRuleResult).where(AuditRuleResult.audit_id.in_(audit_ids)))
+
+def load_reports(audits: Iterable[Tuple[int, Optional[str]]]) -> Dict[int, Dict[str, Any]]:
+    """Reports of (audit id, audit_result) pairs, rebuilding rule-row reports in one query."""
+    reports: Dict[int, Dict[str, Any]] = {}
+    normalized = []
+    for audit_id, audit_result in audits:
+        if audit_result:
+            reports[audit_id] = json.loads(audit_result)
+        else:
+            normalized.append(audit_id)
+    if not normalized:
+        return reports
+
+    rows = []
+    for i in range(0, len(normalized), 500):
+        rows.extend(db.session.execute(
+            select(AuditRuleResult).where(AuditRuleResult.audit_id.in_(normalized[i:i + 500]))
+            .order_by(AuditRuleResult.audit_id, AuditRuleResult.rule_index)
+        ).scalars())
+    texts = texts_by_id(
+        text_id for row in rows
+        for text_id in (row.rule_text_id, row.description_text_id, row.justification_text_id)
+    )
+    rules: Dict[int, List[Dict[str, Any]]] = {audit_id: [] for audit_id in normalized}
+    for row in rows:
+        # Same key order as RulesEngine.evaluate, so the JSON matches the original
+        rules[row.audit_id].append({
+            'rule_id': texts[row.rule_text_id],
+            'description': texts[row.description_text_id],
+            'passed': row.passed,
+            'score': row.score,
+            'justification': join_justification(texts[row.justification_text_id], row.justification_args),
+        })
+    for audit_id, rule_results in rules.items():
+        reports[audit_id] = AuditReport(rule_results).to_dict()
+    return reports
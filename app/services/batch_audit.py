@@ -0,0 +1,110 @@
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import List, Dict, Any, Tuple, Optional
+from .email_parser import EmailParser
+from .rules_engine import get_rules_engine
+from .audit_report import AuditReport
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def compress_text(text: str) -> bytes:
+    """Stored form of a full email body."""
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+def audit_message(rules_path: str, file_name: str, data: bytes) -> Dict[str, Any]:
+    """Parse and evaluate one raw message. Runs inside pool workers, so no app context."""
+    try:
+        email_parser = EmailParser(data)
+        content = email_parser.get_content()
+        report = AuditReport(get_rules_engine(rules_path).evaluate(content)).to_dict()
+        return {
+            'file_name': file_name,
+            'file_size': len(data),
+            'email_content': content['text'][:500],
+            'source_text': compress_text(content['text']),
+            'report': report
+        }
+    except Exception as e:
+        return {'file_name': file_name, 'file_size': len(data), 'error': str(e)}
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Get the per-process pool, created lazily so it is forked after gunicorn's workers."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=max_workers)
+            _executor_workers = max_workers
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+def audit_messages(rules_path: str, files: List[Tuple[str, bytes]],
+                   max_workers: int = 1, min_parallel: int = 2) -> List[Dict[str, Any]]:
+    """Audit many raw messages, fanning out across a process pool when worthwhile."""
+    if max_workers <= 1 or len(files) < min_parallel:
+        return [audit_message(rules_path, name, data) for name, data in files]
+
+    names = [name for name, _ in files]
+    payloads = [data for _, data in files]
+    chunksize = max(1, len(files) // (max_workers * 4))
+    try:
+        executor = _get_executor(max_workers)
+        return list(executor.map(audit_message, repeat(rules_path), names, payloads, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died; drop the pool and finish the batch in-process
+        _reset_executor()
+        return [audit_message(rules_path, name, data) for name, data in files]
+
+def evaluate_text(rules_path: str, text: str) -> Dict[str, Any]:
+    """Evaluate the rules on one text. Runs inside pool workers, so no app context."""
+    return AuditReport(get_rules_engine(rules_path).evaluate(text)).to_dict()
+
+def evaluate_texts(rules_path: str, texts: List[str],
+                   max_workers: int = 1, min_parallel: int = 2) -> List[Dict[str, Any]]:
+    """Evaluate many texts, fanning out across the process pool when worthwhile."""
+    if max_workers <= 1 or len(texts) < min_parallel:
+        return [evaluate_text(rules_path, text) for text in texts]
+
+    chunksize = max(1, len(texts) // (max_workers * 4))
+    try:
+        executor = _get_executor(max_workers)
+        return list(executor.map(evaluate_text, repeat(rules_path), texts, chunksize=chunksize))
+    except BrokenProcessPool:
+        _reset_executor()
+        return [evaluate_text(rules_path, text) for text in texts]
+
+def evaluate_source(rules_path: str, source_text: bytes) -> Dict[str, Any]:
+    """Evaluate the rules on a stored, compressed body. Runs inside pool workers."""
+    try:
+        return evaluate_text(rules_path, decompress_text(source_text))
+    except Exception as e:
+        return {'error': str(e)}
+
+def evaluate_sources(rules_path: str, sources: List[bytes],
+                     max_workers: int = 1, min_parallel: int = 2) -> List[Dict[str, Any]]:
+    """Re-evaluate many stored bodies; compressed bytes are what crosses to the pool."""
+    if max_workers <= 1 or len(sources) < min_parallel:
+        return [evaluate_source(rules_path, source) for source in sources]
+
+    chunksize = max(1, len(sources) // (max_workers * 4))
+    try:
+        executor = _get_executor(max_workers)
+        return list(executor.map(evaluate_source, repeat(rules_path), sources, chunksize=chunksize))
+    except BrokenProcessPool:
+        _reset_executor()
+        return [evaluate_source(rules_path, source) for source in sources]
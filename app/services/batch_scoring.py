@@ -0,0 +1,221 @@
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Iterable, List, Optional
+import numpy as np
+from . import rules_impl
+from .batch_audit import _get_executor, _reset_executor
+from .text_analysis import analyze
+
+# Per-email numeric features, in column order
+FEATURES = (
+    'is_blank',
+    'word_count',
+    'total_word_length',
+    'sentence_count',
+    'incomplete_sentences',
+    'grammar_mistakes',
+    'paragraph_count',
+    'has_action_words',
+    'has_professional_closing',
+    'exclamation_count',
+    'all_caps_count',
+    'has_greeting',
+)
+
+# Tunable thresholds; the defaults are the ones the scalar rules apply
+DEFAULT_THRESHOLDS = {
+    'pass_score': rules_impl.PASS_SCORE,
+    'max_grammar_penalty': rules_impl.MAX_GRAMMAR_PENALTY,
+    'max_avg_word_length': rules_impl.MAX_AVG_WORD_LENGTH,
+    'max_avg_sentence_length': rules_impl.MAX_AVG_SENTENCE_LENGTH,
+    'min_word_count': rules_impl.MIN_WORD_COUNT,
+    'max_word_count': rules_impl.MAX_WORD_COUNT,
+    'min_paragraphs': rules_impl.MIN_PARAGRAPHS,
+    'max_exclamations': rules_impl.MAX_EXCLAMATIONS,
+    'max_all_caps_words': 0,
+}
+
+# Rule functions scored here, in the order of rules.json
+SCORED_FUNCTIONS = ('check_greeting', 'check_grammar', 'check_clarity')
+
+# (flag, penalty, issue text) of every clarity check, in the order check_clarity reports them
+_CLARITY_CHECKS = (
+    ('too_short', 3, "Email is too short - may lack necessary detail"),
+    ('too_long', 2, "Email is very long - consider breaking into smaller parts"),
+    ('no_paragraphs', 2, "Email lacks clear paragraph structure"),
+    ('no_action', 1, "Email may lack clear purpose or action items"),
+    ('no_closing', 1, "Email may benefit from a professional closing"),
+    ('exclamations', 2, "Too many exclamation marks - may appear unprofessional"),
+    ('all_caps', 2, "Avoid using ALL CAPS - it appears as shouting"),
+)
+
+def text_features(text: str) -> tuple:
+    """The FEATURES of one email body. The text scans are the same ones the scalar rules run."""
+    analysis = analyze(text)
+    if analysis.is_blank:
+        return (1,) + (0,) * (len(FEATURES) - 1)
+    lower = analysis.lower
+    return (
+        0,
+        analysis.word_count,
+        analysis.total_word_length,
+        analysis.sentence_count,
+        sum(1 for s in analysis.sentences if not s.endswith(('.', '!', '?'))),
+        len(rules_impl._grammar_catalogue.scan(analysis.text)),
+        len(analysis.paragraphs),
+        any(word in lower for word in rules_impl.ACTION_WORDS),
+        any(indicator in lower for indicator in rules_impl.PROFESSIONAL_INDICATORS),
+        analysis.text.count('!'),
+        len(rules_impl._ALL_CAPS_RE.findall(analysis.text)),
+        rules_impl._greeting_matcher.search(analysis.head_lower(3)),
+    )
+
+def extract_features(texts: Iterable[str], max_workers: int = 1, min_parallel: int = 256) -> Dict[str, np.ndarray]:
+    """Feature columns of many emails, one int64 array per feature.
+
+    The text scans dominate, so large batches fan out across the process pool.
+    """
+    texts = list(texts)
+    rows: List[tuple] = []
+    if max_workers > 1 and len(texts) >= min_parallel:
+        try:
+            rows = list(_get_executor(max_workers).map(
+                text_features, texts, chunksize=max(1, len(texts) // (max_workers * 4))
+            ))
+        except BrokenProcessPool:
+            _reset_executor()
+            rows = []
+    if not rows:
+        rows = [text_features(text) for text in texts]
+    matrix = np.array(rows, dtype=np.int64).reshape(len(rows), len(FEATURES))
+    return {name: matrix[:, i] for i, name in enumerate(FEATURES)}
+
+def concat_features(parts: Iterable[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Join feature columns extracted chunk by chunk."""
+    parts = list(parts)
+    if not parts:
+        return extract_features([])
+    return {name: np.concatenate([part[name] for part in parts]) for name in FEATURES}
+
+def save_features(path: str, features: Dict[str, np.ndarray], ids: Optional[np.ndarray] = None):
+    """Cache feature columns (and the row ids they belong to) in an .npz file."""
+    columns = dict(features)
+    if ids is not None:
+        columns['ids'] = ids
+    np.savez_compressed(path, **columns)
+
+def load_features(path: str) -> Dict[str, np.ndarray]:
+    """Feature columns saved by save_features, plus 'ids' if they were saved."""
+    with np.load(path) as data:
+        missing = set(FEATURES) - set(data.files)
+        if missing:
+            raise ValueError(f"{path} lacks features: {', '.join(sorted(missing))}")
+        return {name: data[name] for name in data.files}
+
+class BatchScores:
+    """Scores of the greeting, grammar and clarity rules over a feature matrix.
+
+    Every threshold check is one array operation over all emails. With the
+    default thresholds scores, pass flags and justifications are identical
+    to calling the rules_impl functions on each email.
+    """
+
+    def __init__(self, features: Dict[str, np.ndarray], thresholds: Optional[Dict[str, Any]] = None):
+        unknown = set(thresholds or ()) - set(DEFAULT_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown thresholds: {', '.join(sorted(unknown))}")
+        self.features = features
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.blank = features['is_blank'].astype(bool)
+        self.flags: Dict[str, np.ndarray] = {}
+        self.scores: Dict[str, np.ndarray] = {}
+        self.passed: Dict[str, np.ndarray] = {}
+
+        has_greeting = features['has_greeting'].astype(bool)
+        self.scores['check_greeting'] = np.where(has_greeting, 10, 0)
+        self.passed['check_greeting'] = has_greeting
+        self._score_grammar()
+        self._score_clarity()
+
+    def __len__(self) -> int:
+        return len(self.blank)
+
+    def _finish(self, function_name: str, raw: np.ndarray):
+        pass_score = self.thresholds['pass_score']
+        self.scores[function_name] = np.where(self.blank, 0, np.maximum(raw, 0))
+        self.passed[function_name] = ~self.blank & (raw >= pass_score)
+
+    def _score_grammar(self):
+        f, t = self.features, self.thresholds
+        words, sentences = f['word_count'], f['sentence_count']
+        # True division like the scalar rule, so fractional thresholds compare the same way
+        avg_word_length = np.divide(f['total_word_length'], words, out=np.zeros(len(words)), where=words > 0)
+        avg_sentence_length = np.divide(words, sentences, out=np.zeros(len(words)), where=sentences > 0)
+        self.flags['incomplete'] = f['incomplete_sentences'] > 0
+        self.flags['mistakes'] = f['grammar_mistakes'] > 0
+        self.flags['long_words'] = (words > 0) & (avg_word_length > t['max_avg_word_length'])
+        self.flags['long_sentences'] = (words > 0) & (sentences > 0) & (avg_sentence_length > t['max_avg_sentence_length'])
+        raw = (
+            10
+            - 2 * self.flags['incomplete']
+            - np.minimum(t['max_grammar_penalty'], f['grammar_mistakes'])
+            - self.flags['long_words']
+            - self.flags['long_sentences']
+        )
+        self._finish('check_grammar', raw)
+
+    def _score_clarity(self):
+        f, t = self.features, self.thresholds
+        words = f['word_count']
+        self.flags['too_short'] = words < t['min_word_count']
+        self.flags['too_long'] = ~self.flags['too_short'] & (words > t['max_word_count'])
+        self.flags['no_paragraphs'] = f['paragraph_count'] < t['min_paragraphs']
+        self.flags['no_action'] = f['has_action_words'] == 0
+        self.flags['no_closing'] = f['has_professional_closing'] == 0
+        self.flags['exclamations'] = f['exclamation_count'] > t['max_exclamations']
+        self.flags['all_caps'] = f['all_caps_count'] > t['max_all_caps_words']
+        raw = np.full(len(words), 10, dtype=np.int64)
+        for flag, penalty, _ in _CLARITY_CHECKS:
+            raw -= penalty * self.flags[flag]
+        self._finish('check_clarity', raw)
+
+    def overall(self, function_names: Iterable[str] = SCORED_FUNCTIONS) -> np.ndarray:
+        """Report scores, truncated averages of the rule scores like AuditReport."""
+        function_names = list(function_names)
+        total = sum(self.scores[name] for name in function_names)
+        return total // len(function_names)
+
+    def rule_result(self, function_name: str, i: int) -> Dict[str, Any]:
+        """The result of one rule for the i-th email, as the rules_impl function returns it."""
+        if function_name not in self.scores:
+            raise KeyError(f"Rule function {function_name} is not batch scored")
+        result = {'passed': bool(self.passed[function_name][i]), 'score': int(self.scores[function_name][i])}
+        if function_name == 'check_greeting':
+            result['justification'] = (
+                'Professional greeting found.' if result['passed']
+                else 'No appropriate greeting detected. Consider adding a professional greeting.'
+            )
+        elif self.blank[i]:
+            result['justification'] = 'Email content is empty.'
+        elif function_name == 'check_grammar':
+            issues = []
+            if self.flags['incomplete'][i]:
+                issues.append(f"Found {self.features['incomplete_sentences'][i]} incomplete sentences")
+            if self.flags['mistakes'][i]:
+                issues.append(f"Found {self.features['grammar_mistakes'][i]} potential grammar issues")
+            if self.flags['long_words'][i]:
+                issues.append("Text might be too complex (long average word length)")
+            if self.flags['long_sentences'][i]:
+                issues.append("Sentences are too long - consider breaking them up")
+            result['justification'] = (
+                "Grammar quality is good." if not issues else f"Grammar issues found: {'; '.join(issues)}"
+            )
+        else:
+            issues = [issue for flag, _, issue in _CLARITY_CHECKS if self.flags[flag][i]]
+            result['justification'] = (
+                "Email is clear and well-structured." if not issues else f"Clarity issues: {'; '.join(issues)}"
+            )
+        return result
+
+def score_texts(texts: Iterable[str], thresholds: Optional[Dict[str, Any]] = None) -> BatchScores:
+    """Extract features from many email bodies and score them in one pass."""
+    return BatchScores(extract_features(texts), thresholds)
@@ -1,97 +1,244 @@
 import email
 from email import policy
-from email.parser import BytesParser
-from bs4 import BeautifulSoup
-from typing import Dict, Any, List
+from email.parser import BytesFeedParser, Parser
+from typing import Dict, Any, List, Iterator, Optional, Tuple, Union, BinaryIO
 import os
-import re
 from io import BytesIO
+from .html_text import html_to_text
+from ..utils.metrics import timed
+from .thread_scanner import split_thread, iter_boundaries, iter_blocks
+
+def _is_blank_line(line: bytes) -> bool:
+    return line in (b'\n', b'\r\n')
+
+def iter_mbox(stream: BinaryIO) -> Iterator[bytes]:
+    """Yield raw messages from an mbox stream, holding only one message at a time."""
+    lines: List[bytes] = []
+    started = False
+    previous_blank = True
+    for line in stream:
+        # A From_ line only starts a message at the top or after a blank line
+        if previous_blank and line.startswith(b'From '):
+            if lines:
+                message = b''.join(lines)
+                lines = []
+                if message.strip():
+                    yield message
+            started = True
+            previous_blank = False
+            continue
+        previous_blank = _is_blank_line(line)
+        if not started:
+            continue
+        if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+            line = line[1:]
+        lines.append(line)
+    if lines:
+        message = b''.join(lines)
+        if message.strip():
+            yield message
+
+def count_mbox_messages(stream: BinaryIO) -> int:
+    """Count the messages in an mbox stream without keeping any of them."""
+    count = 0
+    previous_blank = True
+    for line in stream:
+        if previous_blank and line.startswith(b'From '):
+            count += 1
+            previous_blank = False
+            continue
+        previous_blank = _is_blank_line(line)
+    return count
+
+def split_mbox(content: bytes) -> List[bytes]:
+    """Split an mbox archive into raw messages."""
+    return list(iter_mbox(BytesIO(content)))
+
+def _parse_bytes(data) -> email.message.Message:
+    """Parse raw message bytes, or a memoryview slice of them, as BytesParser.parse would."""
+    text = str(data, 'ascii', 'surrogateescape')
+    if '\r' in text:
+        # BytesParser.parse reads through a text wrapper with universal newlines
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return Parser(policy=policy.default).parsestr(text)
+
+def iter_thread_messages(stream: BinaryIO) -> Iterator[email.message.Message]:
+    """Yield the messages of an .eml thread one at a time.
+
+    The stream is read in blank-line separated blocks and each block is
+    fed to the MIME parser as soon as the boundary scanner has looked at
+    it, so only the message being parsed is held in memory. Messages come
+    out exactly as `EmailParser` parses the whole buffer.
+    """
+    parser = BytesFeedParser(policy=policy.default)
+    seen_content = False
+    # The line ending before a boundary is held back: a bare '\n' there is
+    # dropped, while the '\r' of a '\r\n' survives as a newline
+    held_ending = b''
+
+    def feed(data: bytes):
+        nonlocal held_ending, seen_content
+        if not data:
+            return
+        if held_ending:
+            parser.feed(b'\n')
+        if data.endswith(b'\r\n'):
+            held_ending, data = b'\r\n', data[:-2]
+        elif data.endswith(b'\n'):
+            held_ending, data = b'\n', data[:-1]
+        else:
+            held_ending = b''
+        parser.feed(data.replace(b'\r\n', b'\n').replace(b'\r', b'\n'))
+        seen_content = seen_content or bool(data.strip())
+
+    for block in iter_blocks(stream):
+        position = 0
+        for boundary in iter_boundaries(block):
+            feed(block[position:boundary.line_start])
+            if held_ending == b'\r\n':
+                parser.feed(b'\n')
+            held_ending = b''
+            if seen_content:
+                yield parser.close()
+                parser = BytesFeedParser(policy=policy.default)
+                seen_content = False
+            position = boundary.message_start
+        feed(block[position:])
+    if held_ending:
+        parser.feed(b'\n')
+    if seen_content:
+        yield parser.close()
+
+EmailSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
 
 class EmailParser:
-    def __init__(self, eml_path: str):
-        self.eml_path = eml_path
-        self.messages = self._load_eml_thread()
+    def __init__(self, source: EmailSource):
+        """Parse an email from a file path, raw bytes, a memoryview or a binary stream."""
+        self.eml_path = source if isinstance(source, str) else None
+        content = self.read_source(source)
+        self.size = len(content)
+        self.messages = self._load_eml_thread(content)
+        # Per-message extraction, filled in lazily and shared by all accessors
+        self._extracted: List[Optional[Tuple[Dict[str, Any], bool]]] = [None] * len(self.messages)
+        self.stats = {'walks': 0, 'decodes': 0}
+
+    @staticmethod
+    def open_source(source: EmailSource) -> BinaryIO:
+        """Get a binary stream over a source without reading it into memory."""
+        if isinstance(source, str):
+            return open(source, 'rb')
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return BytesIO(source)
+        return source
+
+    @classmethod
+    def iter_content(cls, source: EmailSource, mbox: bool = False) -> Iterator[Dict[str, Any]]:
+        """Stream extracted content one message at a time.
+
+        Reads an .eml thread (or an mbox archive with mbox=True)
+        incrementally and drops each message tree once its content has
+        been extracted, so peak memory follows the largest single message.
+        """
+        stream = cls.open_source(source)
+        try:
+            if mbox:
+                for raw in iter_mbox(stream):
+                    message = _parse_bytes(raw)
+                    del raw
+                    yield cls._extract_content_from_message(message)
+            else:
+                for message in iter_thread_messages(stream):
+                    yield cls._extract_content_from_message(message)
+        finally:
+            if isinstance(source, str):
+                stream.close()
 
-    def _load_eml_thread(self) -> List[email.message.Message]:
+    @staticmethod
+    def read_source(source: EmailSource) -> bytes:
+        """Get the raw message bytes without touching disk unless given a path."""
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return f.read()
+        if isinstance(source, bytes):
+            return source
+        if isinstance(source, (bytearray, memoryview)):
+            return bytes(source)
+        if hasattr(source, 'getvalue'):
+            # In-memory streams (BytesIO) hand back their buffer directly
+            return source.getvalue()
+        return source.read()
+
+    def _load_eml_thread(self, content: bytes) -> List[email.message.Message]:
         """Load email thread - handles both single emails and email threads."""
-        with open(self.eml_path, 'rb') as f:
-            content = f.read()
-        
-        # Try to detect if this is a thread with multiple emails
-        # Look for common email thread markers
-        thread_markers = [
-            b'From: ',
-            b'\nFrom: ',
-            b'\r\nFrom: ',
-            b'Subject: ',
-            b'\nSubject: ',
-            b'\r\nSubject: '
-        ]
-        
-        # Count potential email starts
-        email_count = 0
-        for marker in thread_markers:
-            email_count += content.count(marker)
-        
-        if email_count > 2:  # Likely a thread
-            return self._parse_email_thread(content)
-        else:
-            # Single email
-            return [BytesParser(policy=policy.default).parse(BytesIO(content))]
+        # One scan finds where each message starts
+        parts = split_thread(content)
+        if len(parts) > 1:
+            return self._parse_email_thread(content, parts)
+        # Single email
+        return [_parse_bytes(content)]
 
-    def _parse_email_thread(self, content: bytes) -> List[email.message.Message]:
-        """Parse multiple emails from a thread."""
+    def _parse_email_thread(self, content: bytes, parts: List[memoryview]) -> List[email.message.Message]:
+        """Parse multiple emails from a thread, slicing each out of the buffer."""
         messages = []
+        for part in parts:
+            try:
+                messages.append(_parse_bytes(part))
+            except Exception as e:
+                # Skip malformed parts
+                print(f"Warning: Skipping malformed email part: {e}")
+                continue
         
-        # Split by common email boundaries
-        # This is a simplified approach - real email threads can be complex
-        email_parts = re.split(b'\n(?=From: )', content)
-        
-        for part in email_parts:
-            if part.strip():
-                try:
-                    message = BytesParser(policy=policy.default).parse(BytesIO(part))
-                    messages.append(message)
-                except Exception as e:
-                    # Skip malformed parts
-                    print(f"Warning: Skipping malformed email part: {e}")
-                    continue
-        
-        return messages if messages else [BytesParser(policy=policy.default).parse(BytesIO(content))]
+        return messages if messages else [_parse_bytes(content)]
+
+    def _extract(self, index: int) -> Tuple[Dict[str, Any], bool]:
+        """Content and image-attachment flag of one message, extracted once."""
+        extracted = self._extracted[index]
+        if extracted is None:
+            extracted = self._extract_message(self.messages[index], self.stats)
+            self._extracted[index] = extracted
+        return extracted
 
     def get_content(self) -> Dict[str, Any]:
         """Get content from the first email in the thread."""
         if not self.messages:
             return {'text': '', 'html': '', 'attachments': []}
         
-        return self._extract_content_from_message(self.messages[0])
+        return self._extract(0)[0]
 
     def get_thread_content(self) -> List[Dict[str, Any]]:
         """Get content from all emails in the thread."""
-        thread_content = []
-        for message in self.messages:
-            thread_content.append(self._extract_content_from_message(message))
-        return thread_content
+        return [self._extract(i)[0] for i in range(len(self.messages))]
 
-    def _extract_content_from_message(self, message: email.message.Message) -> Dict[str, Any]:
-        """Extract content from a single email message."""
+    @staticmethod
+    def _extract_message(message: email.message.Message,
+                         stats: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, Any], bool]:
+        """Extract content from a single email message in one walk over its parts.
+        
+        Returns the content and whether any attachment is an image, and
+        counts the walk and the part decodes in `stats` when given.
+        """
         text = ""
         html = ""
         attachments = []
+        has_image = False
+        decodes = 0
         
         for part in message.walk():
             content_type = part.get_content_type()
             if content_type == 'text/plain':
+                decodes += 1
                 try:
                     text += part.get_content()
                 except Exception:
                     text += str(part.get_payload(decode=True), 'utf-8', errors='ignore')
             elif content_type == 'text/html':
+                decodes += 1
                 try:
                     html += part.get_content()
                 except Exception:
                     html += str(part.get_payload(decode=True), 'utf-8', errors='ignore')
             elif part.get_content_disposition() == 'attachment':
+                has_image = has_image or content_type.startswith('image/')
                 filename = part.get_filename()
                 if filename:
                     attachments.append({
@@ -100,24 +247,27 @@ class EmailParser:
                     })
         
         if html and not text:
-            soup = BeautifulSoup(html, 'html.parser')
-            text = soup.get_text()
+            with timed('html_to_text'):
+                text = html_to_text(html)
         
-        return {'text': text, 'html': html, 'attachments': attachments}
+        if stats is not None:
+            stats['walks'] += 1
+            stats['decodes'] += decodes
+        return {'text': text, 'html': html, 'attachments': attachments}, has_image
+
+    @staticmethod
+    def _extract_content_from_message(message: email.message.Message) -> Dict[str, Any]:
+        """Extract content from a single email message."""
+        return EmailParser._extract_message(message)[0]
 
     def has_image_attachment(self) -> bool:
         """Check if any email in the thread has image attachments."""
-        for message in self.messages:
-            for part in message.walk():
-                if part.get_content_disposition() == 'attachment':
-                    if part.get_content_type().startswith('image/'):
-                        return True
-        return False
+        return any(self._extract(i)[1] for i in range(len(self.messages)))
 
     def get_thread_summary(self) -> Dict[str, Any]:
         """Get summary information about the email thread."""
         return {
             'email_count': len(self.messages),
             'has_image_attachment': self.has_image_attachment(),
-            'total_attachments': sum(len(self._extract_content_from_message(msg)['attachments']) for msg in self.messages)
-        } 
\ No newline at end of file
+            'total_attachments': sum(len(content['attachments']) for content in self.get_thread_content())
+        }
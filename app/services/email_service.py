@@ -1,58 +1,43 @@
-import smtplib
 import secrets
-from datetime import datetime, timedelta
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from datetime import datetime
+from typing import Optional
 from flask import current_app
-from ..models import OTPCode
 from ..models.database import db
+from .outbox import enqueue_email
+from .otp_store import get_otp_store
 
 class EmailService:
     """Service for handling email operations including OTP."""
     
     def __init__(self):
-        self.smtp_server = current_app.config['SMTP_SERVER']
-        self.smtp_port = current_app.config['SMTP_PORT']
-        self.smtp_username = current_app.config['SMTP_USERNAME']
-        self.smtp_password = current_app.config['SMTP_PASSWORD']
-        self.smtp_use_tls = current_app.config.get('SMTP_USE_TLS', True)
+        # Outbox id of the last email queued, for delivery status lookups
+        self.delivery_id = None
     
     def generate_otp(self) -> str:
         """Generate a 6-digit OTP."""
         return ''.join([str(secrets.randbelow(10)) for _ in range(6)])
     
-    def send_otp_email(self, email: str, otp_code: str) -> bool:
-        """Send OTP code via email."""
+    def send_otp_email(self, email: str, otp_code: str, user_id: Optional[int] = None,
+                       expires_at: Optional[datetime] = None) -> bool:
+        """Queue the OTP email; the outbox sender delivers it in the background."""
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.smtp_username
-            msg['To'] = email
-            msg['Subject'] = 'Email Auditor - OTP Code'
-            
             body = f"""
             Your OTP code is: {otp_code}
             
-            This code will expire in 10 minutes.
+            This code will expire in {current_app.config.get('OTP_TTL', 600) // 60} minutes.
             
             If you didn't request this code, please ignore this email.
             """
             
-            msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            if self.smtp_use_tls:
-                server.starttls()
-            
-            server.login(self.smtp_username, self.smtp_password)
-            text = msg.as_string()
-            server.sendmail(self.smtp_username, email, text)
-            server.quit()
+            message = enqueue_email(email, 'Email Auditor - OTP Code', body, user_id=user_id, expires_at=expires_at)
+            self.delivery_id = message.id
             
-            current_app.logger.info(f"OTP email sent to {email}")
+            current_app.logger.info(f"OTP email to {email} queued as {message.id}")
             return True
             
         except Exception as e:
-            current_app.logger.error(f"Error sending email to {email}: {e}")
+            db.session.rollback()
+            current_app.logger.error(f"Error queueing email to {email}: {e}")
             return False
     
     def send_otp_sms(self, mobile: str, otp_code: str) -> bool:
@@ -66,20 +51,14 @@ class EmailService:
         """Send OTP to user via email or SMS."""
         otp_code = self.generate_otp()
         
-        # Create OTP record
-        otp = OTPCode(
-            user_id=user.id,
-            code=otp_code,
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
-        )
-        db.session.add(otp)
-        db.session.commit()
+        # Replaces any code the user already has; only its hash is stored
+        expires_at = get_otp_store().issue(user.id, otp_code, current_app.config.get('OTP_TTL', 600))
         
         # Send OTP
         success = False
         if user.email:
-            success = self.send_otp_email(user.email, otp_code)
+            success = self.send_otp_email(user.email, otp_code, user_id=user.id, expires_at=expires_at)
         if user.mobile and not success:
             success = self.send_otp_sms(user.mobile, otp_code)
         
-        return success 
\ No newline at end of file
+        return success
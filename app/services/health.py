@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+from sqlalchemy import text
+from ..models.database import db
+
+def _approximate_count(table: str) -> Optional[int]:
+    """Row count from planner statistics or the primary key, never a table scan."""
+    if db.engine.dialect.name == 'postgresql':
+        value = db.session.execute(
+            text('SELECT reltuples FROM pg_class WHERE relname = :table'), {'table': table}
+        ).scalar()
+        return max(0, int(value)) if value is not None else None
+    # Highest id: an index lookup, off only by deleted rows
+    return db.session.execute(text(f'SELECT MAX(id) FROM {table}')).scalar() or 0
+
+class HealthMonitor:
+    """Health snapshot of one worker process, refreshed by a background thread.
+
+    Probes read the last snapshot instead of querying the database, so
+    their cost does not depend on how often they come. The thread is
+    started on first use, after gunicorn has forked the worker.
+    """
+
+    def __init__(self, app, interval: float = 5.0, stale_after: float = 30.0):
+        self.app = app
+        self.interval = interval
+        self.stale_after = stale_after
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            # A forked worker inherits the parent's snapshot but not its thread
+            if self._pid != os.getpid():
+                self._snapshot = None
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self) -> Dict[str, Any]:
+        """Take a new snapshot now."""
+        from .audit_cache import get_audit_cache
+        from .job_queue import pending_job_count
+        from .outbox import pending_message_count
+        from .rollups import get_audit_totals
+        from ..utils.api_key_cache import get_api_key_cache
+
+        with self.app.app_context():
+            started = time.perf_counter()
+            try:
+                db.session.execute(text('SELECT 1'))
+                latency_ms = (time.perf_counter() - started) * 1000
+                snapshot = {
+                    'status': 'healthy',
+                    'database': {
+                        'status': 'connected',
+                        'latency_ms': round(latency_ms, 3),
+                        'users': _approximate_count('users'),
+                        **get_audit_totals(self.app.config.get('HEALTH_AUDIT_DAYS', 30))
+                    },
+                    'queue': {
+                        'backend': self.app.config.get('AUDIT_QUEUE_BACKEND', 'inprocess'),
+                        'pending_jobs': pending_job_count(),
+                        'pending_emails': pending_message_count()
+                    },
+                    'audit_cache': get_audit_cache().stats(),
+                    'api_key_cache': get_api_key_cache().stats(),
+                }
+            except Exception as e:
+                db.session.rollback()
+                snapshot = {
+                    'status': 'unhealthy',
+                    'error': str(e),
+                    'database': {'status': 'error'},
+                }
+            finally:
+                db.session.remove()
+        snapshot['checked_at'] = datetime.utcnow().isoformat()
+        snapshot['check_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        with self._lock:
+            self._snapshot = snapshot
+            self._refreshed_at = time.monotonic()
+        return snapshot
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The latest snapshot with its age; unhealthy once the refresher has fallen behind."""
+        self._ensure_thread()
+        with self._lock:
+            snapshot, refreshed_at = self._snapshot, self._refreshed_at
+        if snapshot is None:
+            # Nothing taken yet in this worker
+            snapshot = self.refresh()
+            refreshed_at = time.monotonic()
+        age = time.monotonic() - refreshed_at
+        result = {**snapshot, 'age_seconds': round(age, 3), 'pid': os.getpid()}
+        if age > self.stale_after and result['status'] == 'healthy':
+            result['status'] = 'unhealthy'
+            result['error'] = f'Health snapshot is {age:.0f}s old'
+        return result
+
+def check_readiness(app) -> Dict[str, Any]:
+    """Check now, without the snapshot, everything a worker needs to serve audits."""
+    from .rules_engine import get_rules_engine
+    from ..models.migrations import pending_migrations
+
+    checks: Dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 3)}
+    except Exception as e:
+        db.session.rollback()
+        checks['database'] = {'ok': False, 'error': str(e)}
+
+    if checks['database']['ok']:
+        try:
+            pending = [migration_id for migration_id, _, _ in pending_migrations()]
+            checks['migrations'] = {'ok': not pending, 'pending': pending}
+        except Exception as e:
+            db.session.rollback()
+            checks['migrations'] = {'ok': False, 'error': str(e)}
+
+    try:
+        engine = get_rules_engine(os.path.join(app.root_path, 'rules.json'))
+        missing = [rule.rule_id for rule in engine.compiled_rules if rule.func is None]
+        checks['rules'] = {
+            'ok': bool(engine.compiled_rules) and not missing,
+            'version': engine.version,
+            'count': len(engine.compiled_rules),
+            'not_implemented': missing
+        }
+    except Exception as e:
+        checks['rules'] = {'ok': False, 'error': str(e)}
+
+    return {
+        'status': 'ready' if all(check['ok'] for check in checks.values()) else 'not_ready',
+        'timestamp': datetime.utcnow().isoformat(),
+        'checks': checks,
+    }
+
+_monitor: Optional[HealthMonitor] = None
+_monitor_lock = threading.Lock()
+
+def get_health_monitor(app) -> HealthMonitor:
+    """Get the per-process health monitor, configured from the app."""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = HealthMonitor(
+                    app,
+                    interval=app.config.get('HEALTH_REFRESH_INTERVAL', 5.0),
+                    stale_after=app.config.get('HEALTH_STALE_AFTER', 30.0)
+                )
+    return _monitor
@@ -0,0 +1,90 @@
+import re
+from html.parser import HTMLParser
+from typing import List
+
+# Elements whose text never reaches the reader
+SKIPPED_TAGS = frozenset({'head', 'script', 'style', 'noscript', 'template', 'title'})
+
+# Elements rendered as separate paragraphs, and those that only break a line
+PARAGRAPH_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'dl', 'div', 'fieldset', 'figure', 'footer',
+    'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'main', 'nav', 'ol', 'p',
+    'pre', 'section', 'table', 'ul'
+})
+LINE_TAGS = frozenset({'br', 'dd', 'dt', 'li', 'tr'})
+CELL_TAGS = frozenset({'td', 'th'})
+
+_SPACES = re.compile(r'[ \t\r\n\f\v]+')
+_BLANK_RUNS = re.compile(r'\n{3,}')
+
+# Markers for breaks, resolved once all text has been collected
+_LINE = '\x00'
+_PARAGRAPH = '\x01'
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text from parser events without building a tree."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'pre':
+            self._pre_depth += 1
+        self._break(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags (<br/>, <img/>) never open a skipped region
+        self._break(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'pre':
+            self._pre_depth = max(0, self._pre_depth - 1)
+        if tag != 'br':
+            self._break(tag)
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._pre_depth:
+            self.chunks.append(data.replace('\n', _LINE))
+        else:
+            self.chunks.append(_SPACES.sub(' ', data))
+
+    def _break(self, tag: str):
+        if tag in PARAGRAPH_TAGS:
+            self.chunks.append(_PARAGRAPH)
+        elif tag in LINE_TAGS:
+            self.chunks.append(_LINE)
+        elif tag in CELL_TAGS:
+            self.chunks.append(' ')
+
+    def text(self) -> str:
+        text = ''.join(self.chunks)
+        lines = [
+            _SPACES.sub(' ', line).strip()
+            for line in text.replace(_PARAGRAPH, '\n\n').replace(_LINE, '\n').split('\n')
+        ]
+        return _BLANK_RUNS.sub('\n\n', '\n'.join(lines)).strip('\n')
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML body, with paragraphs separated by blank lines.
+
+    Streams the markup through the stdlib parser and skips style, script
+    and head content. Falls back to BeautifulSoup if the parser gives up
+    on malformed input.
+    """
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, 'html.parser').get_text()
+    return extractor.text()
@@ -0,0 +1,309 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Optional
+from flask import current_app
+from sqlalchemy import func
+from ..models import AuditJob, UsageCounter
+from ..models.database import db
+
+# Name of the Celery task that runs a job (app.celery)
+AUDIT_JOB_TASK = 'audits.process_job'
+
+class JobBroker(ABC):
+    """Delivers queued audit jobs to whatever runs them."""
+
+    name = 'base'
+
+    @abstractmethod
+    def submit(self, job_id: str):
+        """Hand over a committed, queued job."""
+
+    def start(self):
+        """Called with every request of the web worker; nothing to do unless the broker runs jobs itself."""
+
+class InProcessBroker(JobBroker):
+    """Runs jobs on a background thread pool inside the web worker.
+
+    Jobs live only in the pool of the process that accepted them, so on
+    its first request a worker picks up jobs still queued from before a
+    restart, and fails jobs left running longer than job_timeout. It
+    repeats this every sweep_interval, for jobs lost by other workers.
+    """
+
+    name = 'inprocess'
+
+    def __init__(self, app, max_workers: int = 2, job_timeout: float = 600.0, sweep_interval: float = 60.0):
+        self.app = app
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.sweep_interval = sweep_interval
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # A forked worker inherits the parent's executor but not its threads
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='audit-job')
+                    self._pid = os.getpid()
+                    self._last_sweep = 0.0
+        return self._executor
+
+    def submit(self, job_id: str):
+        self._ensure_executor().submit(self._run, job_id)
+
+    def start(self):
+        executor = self._ensure_executor()
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sweep and now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        # Off the request thread
+        executor.submit(self.recover)
+
+    def recover(self):
+        """Fail stale running jobs and dispatch every queued one; claiming keeps duplicates harmless."""
+        with self.app.app_context():
+            try:
+                fail_stale_jobs(self.job_timeout)
+                job_ids = [job_id for (job_id,) in db.session.query(AuditJob.id)
+                           .filter_by(status=AuditJob.QUEUED).order_by(AuditJob.created_at)]
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error recovering audit jobs: {e}")
+                return
+            finally:
+                db.session.remove()
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    def _run(self, job_id: str):
+        with self.app.app_context():
+            try:
+                process_audit_job(job_id)
+            finally:
+                db.session.remove()
+
+class DatabaseBroker(JobBroker):
+    """Uses the audit_jobs table itself as the queue; `manage_db.py worker` drains it."""
+
+    name = 'database'
+
+    def submit(self, job_id: str):
+        # The committed row is the message; workers poll for it
+        pass
+
+class CeleryBroker(JobBroker):
+    """Hands jobs to the Celery worker defined in app.celery.
+
+    Submits by task name through a bare Celery client, so the web worker
+    never imports the task module or the worker's Flask app.
+    """
+
+    name = 'celery'
+
+    def __init__(self, broker_url: str):
+        from celery import Celery
+        self.client = Celery('email_auditor', broker=broker_url)
+
+    def submit(self, job_id: str):
+        self.client.send_task(AUDIT_JOB_TASK, args=[job_id])
+
+_broker: Optional[JobBroker] = None
+_broker_lock = threading.Lock()
+
+def get_broker() -> JobBroker:
+    """Get the per-process broker selected by AUDIT_QUEUE_BACKEND."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = current_app.config.get('AUDIT_QUEUE_BACKEND', 'inprocess')
+                if backend == 'celery':
+                    _broker = CeleryBroker(current_app.config['CELERY_BROKER_URL'])
+                elif backend == 'database':
+                    _broker = DatabaseBroker()
+                else:
+                    _broker = InProcessBroker(
+                        current_app._get_current_object(),
+                        max_workers=current_app.config.get('AUDIT_QUEUE_THREADS', 2),
+                        job_timeout=current_app.config.get('AUDIT_JOB_TIMEOUT', 600.0),
+                        sweep_interval=current_app.config.get('AUDIT_JOB_SWEEP_INTERVAL', 60.0)
+                    )
+    return _broker
+
+def enqueue_audit(user_id: int, file_name: str, data: bytes, mode: str = 'message',
+                  reserved_on: Optional[date] = None) -> AuditJob:
+    """Store an audit job, reserved against the rate limit on reserved_on, and hand it to the broker."""
+    job = AuditJob(
+        user_id=user_id,
+        reserved_on=reserved_on,
+        status=AuditJob.QUEUED,
+        mode=mode,
+        file_name=file_name,
+        file_size=len(data),
+        payload=data
+    )
+    db.session.add(job)
+    db.session.commit()
+    get_broker().submit(job.id)
+    return job
+
+def init_job_queue(app):
+    """Start the worker's broker with its first request, so jobs queued before a restart still run."""
+
+    @app.before_request
+    def _start_job_broker():
+        get_broker().start()
+
+def _stale(now: datetime, timeout: float):
+    """Running jobs whose worker has not sent a heartbeat within the timeout, presumably lost with it."""
+    last_seen = func.coalesce(AuditJob.heartbeat_at, AuditJob.started_at)
+    return (AuditJob.status == AuditJob.RUNNING) & (last_seen < now - timedelta(seconds=timeout))
+
+def fail_stale_jobs(timeout: float) -> int:
+    """Mark stale running jobs failed and give back their reserved audits; returns how many."""
+    now = datetime.utcnow()
+    stale = db.session.query(AuditJob.id, AuditJob.user_id, AuditJob.reserved_on).filter(_stale(now, timeout)).all()
+    refunds = Counter()
+    for job in stale:
+        # Conditional, in case the job finishes meanwhile
+        failed = AuditJob.query.filter(AuditJob.id == job.id, _stale(now, timeout)).update({
+            'status': AuditJob.FAILED,
+            'error': f'No heartbeat from its worker for {timeout:.0f}s',
+            'payload': None,
+            'finished_at': now
+        }, synchronize_session=False)
+        if failed:
+            refunds[job.user_id, job.reserved_on] += 1
+    for (user_id, day), amount in refunds.items():
+        if day is not None:
+            UsageCounter.release(user_id, day, amount)
+    db.session.commit()
+    return sum(refunds.values())
+
+def pending_job_count(user_id: Optional[int] = None) -> int:
+    """Jobs accepted but not finished, optionally for one user; stale running jobs are not counted."""
+    timeout = current_app.config.get('AUDIT_JOB_TIMEOUT', 600.0)
+    query = AuditJob.query.filter(
+        (AuditJob.status == AuditJob.QUEUED)
+        | ((AuditJob.status == AuditJob.RUNNING) & ~_stale(datetime.utcnow(), timeout))
+    )
+    if user_id is not None:
+        query = query.filter(AuditJob.user_id == user_id)
+    return query.count()
+
+def _claim(job_id: str) -> bool:
+    """Atomically move a queued job to running; False if someone else got it."""
+    now = datetime.utcnow()
+    claimed = AuditJob.query.filter_by(id=job_id, status=AuditJob.QUEUED).update(
+        {'status': AuditJob.RUNNING, 'started_at': now, 'heartbeat_at': now},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return claimed == 1
+
+def claim_next_job() -> Optional[str]:
+    """Claim the oldest queued job, if any."""
+    while True:
+        row = db.session.query(AuditJob.id)\
+            .filter_by(status=AuditJob.QUEUED)\
+            .order_by(AuditJob.created_at)\
+            .first()
+        if row is None:
+            return None
+        if _claim(row.id):
+            return row.id
+
+class _Heartbeat:
+    """Refreshes a running job's heartbeat_at from a background thread until stopped."""
+
+    def __init__(self, app, job_id: str, interval: float):
+        self.app = app
+        self.job_id = job_id
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name='audit-job-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stopped.wait(self.interval):
+            # Own app context, so its own session next to the job's
+            with self.app.app_context():
+                try:
+                    AuditJob.query.filter_by(id=self.job_id, status=AuditJob.RUNNING)\
+                        .update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.warning(f"Heartbeat of audit job {self.job_id} failed: {e}")
+                finally:
+                    db.session.remove()
+
+def process_audit_job(job_id: str, claimed: bool = False):
+    """Run one audit job. Needs an app context."""
+    from .audit_service import AuditService
+
+    if not claimed and not _claim(job_id):
+        return
+
+    job = AuditJob.query.get(job_id)
+    if job is None:
+        return
+
+    heartbeat = _Heartbeat(
+        current_app._get_current_object(), job_id, current_app.config.get('AUDIT_JOB_HEARTBEAT_INTERVAL', 30.0)
+    )
+    try:
+        with heartbeat:
+            report = AuditService().audit_email_source(
+                job.payload, job.user_id, file_name=job.file_name, file_size=job.file_size, mode=job.mode,
+                reserved_on=job.reserved_on
+            )
+        job.status = AuditJob.COMPLETED
+        job.result = json.dumps(report)
+        job.error = None
+    except Exception as e:
+        db.session.rollback()
+        job = AuditJob.query.get(job_id)
+        if job.status != AuditJob.FAILED and job.reserved_on is not None:
+            # Not failed as stale meanwhile, which released it already
+            UsageCounter.release(job.user_id, job.reserved_on, 1)
+        job.status = AuditJob.FAILED
+        job.error = str(e)
+
+    job.payload = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+def run_worker(app, poll_interval: float = 1.0, once: bool = False):
+    """Drain the database-backed queue until interrupted (or empty, with once=True)."""
+    with app.app_context():
+        while True:
+            job_id = claim_next_job()
+            if job_id is not None:
+                process_audit_job(job_id, claimed=True)
+                db.session.remove()
+                continue
+            # Jobs of a worker that died mid-audit
+            fail_stale_jobs(app.config.get('AUDIT_JOB_TIMEOUT', 600.0))
+            if once:
+                return
+            time.sleep(poll_interval)
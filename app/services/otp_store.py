@@ -0,0 +1,235 @@
+import hashlib
+import hmac
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from flask import current_app
+from ..models import OTPCode
+from ..models.database import db
+
+# Outcomes of OTPStore.verify
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+class OTPStore(ABC):
+    """Live one-time codes, one per user, kept only as keyed hashes.
+
+    A code is consumed by a successful verification, and discarded after
+    max_attempts wrong guesses or once it expires, so the store never
+    holds more than one code per user with a pending login.
+    """
+
+    name = 'base'
+
+    def __init__(self, secret: str, max_attempts: int = 5, sweep_interval: float = 300.0):
+        self.secret = secret.encode('utf-8')
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def hash_code(self, user_id: int, code: str) -> str:
+        # Keyed and bound to the user, so a leaked table cannot be brute-forced offline
+        return hmac.new(self.secret, f'{user_id}:{code}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _sweep_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return False
+        self._last_sweep = now
+        return True
+
+    @abstractmethod
+    def issue(self, user_id: int, code: str, ttl: float) -> datetime:
+        """Store a user's new code, replacing any earlier one, and return when it expires."""
+
+    @abstractmethod
+    def verify(self, user_id: int, code: str) -> str:
+        """Check a code: VERIFIED consumes it; LOCKED means too many wrong guesses discarded it."""
+
+    def sweep(self) -> int:
+        """Drop expired codes; returns how many were removed."""
+        return 0
+
+class MemoryOTPStore(OTPStore):
+    """Codes in a dict of this process; only for a single worker process."""
+
+    name = 'memory'
+
+    def __init__(self, secret: str, max_attempts: int = 5, sweep_interval: float = 300.0):
+        super().__init__(secret, max_attempts, sweep_interval)
+        # user id -> (code hash, expires at (monotonic), wrong attempts)
+        self._codes: Dict[int, Tuple[str, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def issue(self, user_id: int, code: str, ttl: float) -> datetime:
+        if self._sweep_due():
+            self.sweep()
+        with self._lock:
+            self._codes[user_id] = (self.hash_code(user_id, code), time.monotonic() + ttl, 0)
+        return datetime.utcnow() + timedelta(seconds=ttl)
+
+    def verify(self, user_id: int, code: str) -> str:
+        code_hash = self.hash_code(user_id, code)
+        with self._lock:
+            entry = self._codes.get(user_id)
+            if entry is None:
+                return INVALID
+            stored_hash, expires_at, attempts = entry
+            if time.monotonic() > expires_at:
+                del self._codes[user_id]
+                return EXPIRED
+            if hmac.compare_digest(stored_hash, code_hash):
+                del self._codes[user_id]
+                return VERIFIED
+            if attempts + 1 >= self.max_attempts:
+                del self._codes[user_id]
+                return LOCKED
+            self._codes[user_id] = (stored_hash, expires_at, attempts + 1)
+            return INVALID
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [user_id for user_id, (_, expires_at, _) in self._codes.items() if now > expires_at]
+            for user_id in expired:
+                del self._codes[user_id]
+        return len(expired)
+
+class SQLOTPStore(OTPStore):
+    """Codes in otp_codes, keyed by user id. Needs an app context."""
+
+    name = 'sql'
+
+    def issue(self, user_id: int, code: str, ttl: float) -> datetime:
+        if self._sweep_due():
+            self.sweep()
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        try:
+            OTPCode.replace(user_id, self.hash_code(user_id, code), expires_at)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return expires_at
+
+    def verify(self, user_id: int, code: str) -> str:
+        # Every step is a conditional statement on the row rather than a check of a value
+        # read earlier, so concurrent guesses cannot get past max_attempts between them
+        now = datetime.utcnow()
+        query = OTPCode.query.filter_by(user_id=user_id)
+        live = query.filter(OTPCode.expires_at > now, OTPCode.attempts < self.max_attempts)
+        try:
+            if live.filter_by(code_hash=self.hash_code(user_id, code)).delete(synchronize_session=False):
+                result = VERIFIED
+            elif live.update({OTPCode.attempts: OTPCode.attempts + 1}, synchronize_session=False):
+                # This guess was counted; the one that reaches the limit discards the code
+                locked = query.filter(OTPCode.attempts >= self.max_attempts).delete(synchronize_session=False)
+                result = LOCKED if locked else INVALID
+            else:
+                # No code, an expired one, or one locked by a concurrent guess
+                otp = query.with_entities(OTPCode.expires_at).first()
+                query.delete(synchronize_session=False)
+                if otp is None:
+                    result = INVALID
+                else:
+                    result = EXPIRED if otp.expires_at <= now else LOCKED
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result
+
+    def sweep(self) -> int:
+        removed = OTPCode.query.filter(OTPCode.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+# Check and count a guess atomically. KEYS[1]: code key; ARGV: code hash, max attempts
+_VERIFY_SCRIPT = """
+local stored = redis.call('HGET', KEYS[1], 'hash')
+if not stored then return 'missing' end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 'verified'
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return 'locked'
+end
+return 'invalid'
+"""
+
+class RedisOTPStore(OTPStore):
+    """Codes shared by all workers in Redis, expired by key TTLs.
+
+    While Redis is unreachable codes are issued to and checked against
+    the SQL store instead, so logins keep working.
+    """
+
+    name = 'redis'
+
+    def __init__(self, secret: str, url: str, max_attempts: int = 5, sweep_interval: float = 300.0):
+        import redis
+        super().__init__(secret, max_attempts, sweep_interval)
+        self._errors = (redis.RedisError,)
+        self._client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self._verify = self._client.register_script(_VERIFY_SCRIPT)
+        self.fallback = SQLOTPStore(secret, max_attempts, sweep_interval)
+
+    def _key(self, user_id: int) -> str:
+        return f'otp:{user_id}'
+
+    def issue(self, user_id: int, code: str, ttl: float) -> datetime:
+        key = self._key(user_id)
+        try:
+            with self._client.pipeline() as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping={'hash': self.hash_code(user_id, code), 'attempts': 0})
+                pipe.pexpire(key, int(ttl * 1000))
+                pipe.execute()
+        except self._errors as e:
+            current_app.logger.warning(f"OTP store unavailable, using the database: {e}")
+            return self.fallback.issue(user_id, code, ttl)
+        return datetime.utcnow() + timedelta(seconds=ttl)
+
+    def verify(self, user_id: int, code: str) -> str:
+        try:
+            result = self._verify(keys=[self._key(user_id)], args=[self.hash_code(user_id, code), self.max_attempts])
+        except self._errors as e:
+            current_app.logger.warning(f"OTP store unavailable, using the database: {e}")
+            return self.fallback.verify(user_id, code)
+        result = result.decode() if isinstance(result, bytes) else result
+        if result == 'missing':
+            # Expired, never issued, or issued to the database during an outage
+            return self.fallback.verify(user_id, code)
+        return result
+
+    def sweep(self) -> int:
+        return self.fallback.sweep()
+
+_store: Optional[OTPStore] = None
+_store_lock = threading.Lock()
+
+def get_otp_store() -> OTPStore:
+    """Get the per-process OTP store selected by OTP_STORE_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = current_app.config
+                backend = config.get('OTP_STORE_BACKEND', 'sql')
+                options = {
+                    'max_attempts': config.get('OTP_MAX_ATTEMPTS', 5),
+                    'sweep_interval': config.get('OTP_SWEEP_INTERVAL', 300.0)
+                }
+                if backend == 'redis':
+                    _store = RedisOTPStore(config['SECRET_KEY'], config['OTP_REDIS_URL'], **options)
+                elif backend == 'memory':
+                    _store = MemoryOTPStore(config['SECRET_KEY'], **options)
+                else:
+                    _store = SQLOTPStore(config['SECRET_KEY'], **options)
+    return _store
@@ -0,0 +1,395 @@
+import base64
+import hashlib
+import os
+import random
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional, Tuple
+from cryptography.fernet import Fernet, InvalidToken
+from flask import current_app
+from ..models import OutboxMessage
+from ..models.database import db
+
+class SMTPConnectionPool:
+    """Authenticated SMTP connections kept open between messages.
+
+    The STARTTLS and login handshake costs more than sending a short
+    message, so connections go back to the pool after use. One that sat
+    idle longer than idle_timeout is closed rather than reused, since
+    servers drop idle sessions.
+    """
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', use_tls: bool = True,
+                 size: int = 2, idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        # (connection, returned at), most recently used last
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                conn.starttls()
+            if self.username:
+                conn.login(self.username, self.password)
+        except Exception:
+            _close(conn)
+            raise
+        return conn
+
+    def _take_idle(self) -> Optional[smtplib.SMTP]:
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, returned_at = self._idle.pop()
+                if now - returned_at <= self.idle_timeout:
+                    return conn
+                _close(conn)
+        return None
+
+    @contextmanager
+    def connection(self, fresh: bool = False):
+        """Borrow a connection; it is discarded instead of returned if the block fails on it."""
+        with self._slots:
+            conn = None if fresh else self._take_idle()
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server refused this message and sendmail reset the session, which stays usable
+                self._release(conn)
+                raise
+            except BaseException:
+                _close(conn)
+                raise
+            self._release(conn)
+
+    def _release(self, conn: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def send(self, sender: str, recipient: str, message: str):
+        """Send one message, reconnecting once if a pooled connection turns out to be dead."""
+        try:
+            with self.connection() as conn:
+                conn.sendmail(sender, recipient, message)
+        except smtplib.SMTPServerDisconnected:
+            with self.connection(fresh=True) as conn:
+                conn.sendmail(sender, recipient, message)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close(conn)
+
+def _close(conn: smtplib.SMTP):
+    try:
+        conn.quit()
+    except (smtplib.SMTPException, OSError):
+        conn.close()
+
+def smtp_pool_from_config(config) -> SMTPConnectionPool:
+    return SMTPConnectionPool(
+        config['SMTP_SERVER'],
+        config['SMTP_PORT'],
+        username=config.get('SMTP_USERNAME', ''),
+        password=config.get('SMTP_PASSWORD', ''),
+        use_tls=config.get('SMTP_USE_TLS', True),
+        size=config.get('OUTBOX_SENDER_THREADS', 2),
+        idle_timeout=config.get('SMTP_POOL_IDLE_TIMEOUT', 60.0),
+        timeout=config.get('SMTP_TIMEOUT', 30.0)
+    )
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Whether retrying cannot help: the server rejected the message or recipient with a 5xx."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Bad credentials are fixed in configuration, not by giving up on the message
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter after the given number of failed attempts."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+def _body_cipher(config) -> Fernet:
+    # Derived from SECRET_KEY, which every worker and the standalone sender share
+    key = hashlib.sha256(f"outbox:{config['SECRET_KEY']}".encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def enqueue_email(recipient: str, subject: str, body: str, user_id: Optional[int] = None,
+                  expires_at: Optional[datetime] = None) -> OutboxMessage:
+    """Store a message in the outbox and wake this worker's sender.
+
+    The body is stored encrypted, since it may carry a live OTP, and is only
+    decrypted by the sender when the message goes out.
+    """
+    message = OutboxMessage(
+        user_id=user_id,
+        status=OutboxMessage.QUEUED,
+        recipient=recipient,
+        subject=subject,
+        body=_body_cipher(current_app.config).encrypt(body.encode('utf-8')).decode('ascii'),
+        next_attempt_at=datetime.utcnow(),
+        expires_at=expires_at
+    )
+    db.session.add(message)
+    db.session.commit()
+    if current_app.config.get('OUTBOX_SENDER', True):
+        get_outbox_sender(current_app._get_current_object()).wake()
+    return message
+
+def _due(now: datetime, claim_timeout: float):
+    """Queued messages whose retry time has come, and claims abandoned by a crashed sender."""
+    return (
+        ((OutboxMessage.status == OutboxMessage.QUEUED) & (OutboxMessage.next_attempt_at <= now))
+        | ((OutboxMessage.status == OutboxMessage.SENDING)
+           & (OutboxMessage.claimed_at < now - timedelta(seconds=claim_timeout)))
+    )
+
+def claim_next_message(claim_timeout: float = 120.0) -> Optional[str]:
+    """Claim the next due message for sending, if any."""
+    while True:
+        now = datetime.utcnow()
+        row = db.session.query(OutboxMessage.id)\
+            .filter(_due(now, claim_timeout))\
+            .order_by(OutboxMessage.next_attempt_at)\
+            .first()
+        if row is None:
+            db.session.rollback()
+            return None
+        # Atomic, so two senders never deliver the same message
+        claimed = OutboxMessage.query.filter(OutboxMessage.id == row.id, _due(now, claim_timeout)).update(
+            {'status': OutboxMessage.SENDING, 'claimed_at': now, 'attempts': OutboxMessage.attempts + 1},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if claimed == 1:
+            return row.id
+
+def _mime_message(sender: str, message: OutboxMessage, body: str) -> str:
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = message.recipient
+    msg['Subject'] = message.subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg.as_string()
+
+def deliver_message(message_id: str, pool: SMTPConnectionPool, config, logger=None):
+    """Send one claimed message and record the outcome. Needs an app context."""
+    message = db.session.get(OutboxMessage, message_id)
+    if message is None:
+        return
+    now = datetime.utcnow()
+    if message.expires_at is not None and message.expires_at <= now:
+        message.status = OutboxMessage.EXPIRED
+        message.body = None
+        db.session.commit()
+        return
+
+    try:
+        body = _body_cipher(config).decrypt((message.body or '').encode('ascii')).decode('utf-8')
+    except InvalidToken:
+        # Queued under another SECRET_KEY, or finished with by a sender that lost its claim
+        message.status = OutboxMessage.FAILED
+        message.last_error = 'Message body cannot be decrypted'
+        message.body = None
+        db.session.commit()
+        return
+
+    sender = config.get('SMTP_USERNAME', '')
+    try:
+        pool.send(sender, message.recipient, _mime_message(sender, message, body))
+    except Exception as e:
+        message.last_error = str(e) or type(e).__name__
+        if is_permanent_failure(e) or message.attempts >= config.get('OUTBOX_MAX_ATTEMPTS', 5):
+            message.status = OutboxMessage.FAILED
+            message.body = None
+        else:
+            message.status = OutboxMessage.QUEUED
+            message.next_attempt_at = now + timedelta(seconds=retry_delay(
+                message.attempts,
+                config.get('OUTBOX_RETRY_BASE_DELAY', 2.0),
+                config.get('OUTBOX_RETRY_MAX_DELAY', 300.0)
+            ))
+        if logger:
+            logger.warning(f"Email {message.id} to {message.recipient} failed (attempt {message.attempts}): {e}")
+    else:
+        message.status = OutboxMessage.SENT
+        message.sent_at = datetime.utcnow()
+        message.last_error = None
+        message.body = None
+        if logger:
+            logger.info(f"Email {message.id} sent to {message.recipient}")
+    db.session.commit()
+
+def deliver_due_messages(pool: SMTPConnectionPool, config, logger=None) -> int:
+    """Send due messages until none are left; returns how many were attempted."""
+    attempted = 0
+    claim_timeout = config.get('OUTBOX_CLAIM_TIMEOUT', 120.0)
+    while True:
+        message_id = claim_next_message(claim_timeout)
+        if message_id is None:
+            return attempted
+        deliver_message(message_id, pool, config, logger)
+        attempted += 1
+
+def purge_finished_messages(retention: float) -> int:
+    """Delete sent, failed and expired messages older than `retention` seconds; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    removed = OutboxMessage.query.filter(
+        OutboxMessage.status.in_(OutboxMessage.FINISHED), OutboxMessage.created_at <= cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+def pending_message_count() -> int:
+    """Messages not yet sent, failed or expired."""
+    return OutboxMessage.query.filter(
+        OutboxMessage.status.in_([OutboxMessage.QUEUED, OutboxMessage.SENDING])
+    ).count()
+
+class OutboxSender:
+    """Background threads in one worker process delivering the outbox.
+
+    Each thread drains due messages over the shared connection pool, then
+    sleeps until enqueue_email wakes it or the poll interval passes, which
+    picks up retries and messages queued by other workers. Finished
+    messages are purged once they are older than `retention`, at most
+    every purge_interval. The threads start on first use, after gunicorn
+    has forked the worker.
+    """
+
+    def __init__(self, app, threads: int = 2, poll_interval: float = 5.0,
+                 retention: float = 604800.0, purge_interval: float = 3600.0):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        self.pool: Optional[SMTPConnectionPool] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Connections and threads from a parent process are not ours to use
+            self.pool = smtp_pool_from_config(self.app.config)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'outbox-sender-{i}', daemon=True)
+                for i in range(self.threads)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.pool is not None:
+            self.pool.close()
+
+    def _purge_due(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return False
+            self._last_purge = now
+            return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    deliver_due_messages(self.pool, self.app.config, self.app.logger)
+                    if self._purge_due():
+                        purge_finished_messages(self.retention)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Outbox sender error: {e}")
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+
+_sender: Optional[OutboxSender] = None
+_sender_lock = threading.Lock()
+
+def get_outbox_sender(app) -> OutboxSender:
+    """Get the per-process outbox sender, configured from the app."""
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = OutboxSender(
+                    app,
+                    threads=app.config.get('OUTBOX_SENDER_THREADS', 2),
+                    poll_interval=app.config.get('OUTBOX_POLL_INTERVAL', 5.0),
+                    retention=app.config.get('OUTBOX_RETENTION', 604800.0),
+                    purge_interval=app.config.get('OUTBOX_PURGE_INTERVAL', 3600.0)
+                )
+    return _sender
+
+def init_outbox(app):
+    """Start the worker's sender with its first request, so messages left from before a restart go out."""
+    if not app.config.get('OUTBOX_SENDER', True):
+        return
+
+    @app.before_request
+    def _start_outbox_sender():
+        get_outbox_sender(app).start()
+
+def run_sender(app, poll_interval: float = 1.0, once: bool = False):
+    """Deliver the outbox from this process until interrupted (or empty, with once=True).
+
+    Purges finished messages past OUTBOX_RETENTION on start and every OUTBOX_PURGE_INTERVAL.
+    """
+    pool = smtp_pool_from_config(app.config)
+    retention = app.config.get('OUTBOX_RETENTION', 604800.0)
+    purge_interval = app.config.get('OUTBOX_PURGE_INTERVAL', 3600.0)
+    last_purge = None
+    try:
+        with app.app_context():
+            while True:
+                deliver_due_messages(pool, app.config, app.logger)
+                if last_purge is None or time.monotonic() - last_purge >= purge_interval:
+                    purge_finished_messages(retention)
+                    last_purge = time.monotonic()
+                db.session.remove()
+                if once:
+                    return
+                time.sleep(poll_interval)
+    finally:
+        pool.close()
@@ -0,0 +1,133 @@
+import json
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+
+_WORD_RE = re.compile(r'\w+')
+# \b(alt|alt)\b or \balt\b where every alternative is a plain or escaped literal
+_LITERAL_PATTERN_RE = re.compile(r"^\\b(?:\(((?:\\[^A-Za-z0-9]|[\w'|])+)\)|((?:\\[^A-Za-z0-9]|[\w'])+))\\b$")
+_ESCAPE_RE = re.compile(r'\\(.)')
+# The only non-ASCII characters that IGNORECASE matches to ASCII letters
+_ASCII_FOLDS = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+def _literal_alternatives(pattern: str) -> Optional[List[str]]:
+    """The literal strings a whole-word pattern matches, or None if it is not that simple."""
+    m = _LITERAL_PATTERN_RE.match(pattern)
+    if m is None:
+        return None
+    body = m.group(1) if m.group(1) is not None else m.group(2)
+    return [_ESCAPE_RE.sub(r'\1', alternative) for alternative in body.split('|')]
+
+class CatalogueMatches:
+    """Hits of a catalogue scan, grouped by pattern id."""
+
+    def __init__(self):
+        self.positions: Dict[str, List[Tuple[int, int]]] = {}
+
+    def add(self, pattern_id: str, span: Tuple[int, int]):
+        self.positions.setdefault(pattern_id, []).append(span)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return {pattern_id: len(spans) for pattern_id, spans in self.positions.items()}
+
+    @property
+    def matched_ids(self) -> List[str]:
+        return list(self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+class PatternCatalogue:
+    """A catalogue of regex patterns compiled into one alternation.
+
+    Every entry becomes a named group, so a single scan of the text finds
+    the hits of all entries. Entries should not match the same span: at
+    any position only the first matching entry is reported.
+
+    An alternation still tries every entry at every position, so entries
+    that are whole-word literals (``\\b(your|you're)\\b``) are indexed by
+    their words first. A scan looks up the text's words in that index and
+    runs the alternation of only the entries whose words all occur, plus
+    any entries that are not plain literals. Those entries are the only
+    ones that can match, so the hits are the same as a full scan.
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]], flags: int = re.IGNORECASE):
+        self.entries = entries
+        self.flags = flags
+        self._fold = bool(flags & re.IGNORECASE)
+        self._group_ids = {f'p{i}': entry['id'] for i, entry in enumerate(entries)}
+        # Reject a bad pattern when the catalogue loads; scans compile only the subsets they need
+        for entry in entries:
+            re.compile(entry['pattern'], flags)
+        # First word of a literal alternative -> (entry index, all its words)
+        self._word_index: Dict[str, List[Tuple[int, Set[str]]]] = {}
+        # Entries the index cannot rule out
+        always = []
+        for i, entry in enumerate(entries):
+            alternatives = _literal_alternatives(entry['pattern'])
+            if not alternatives or not all(alternative.isascii() for alternative in alternatives):
+                always.append(i)
+                continue
+            words = [_WORD_RE.findall(self._case(alternative)) for alternative in alternatives]
+            if not all(words):
+                always.append(i)
+                continue
+            for alternative_words in words:
+                self._word_index.setdefault(alternative_words[0], []).append((i, set(alternative_words)))
+        self._always = tuple(always)
+        self._subset_regex = lru_cache(maxsize=256)(self._compile)
+
+    def _case(self, text: str) -> str:
+        if not self._fold:
+            return text
+        return (text if text.isascii() else text.translate(_ASCII_FOLDS)).lower()
+
+    def _compile(self, indices: Tuple[int, ...], grouped: bool = True):
+        if grouped:
+            parts = [f"(?P<p{i}>{self.entries[i]['pattern']})" for i in indices]
+        else:
+            parts = [f"(?:{self.entries[i]['pattern']})" for i in indices]
+        return re.compile('|'.join(parts) or r'(?!)', self.flags)
+
+    def _candidates(self, text: str) -> Tuple[int, ...]:
+        """Indices of the entries that can match the text."""
+        words = set(_WORD_RE.findall(self._case(text)))
+        candidates = set(self._always)
+        for word in words:
+            for i, alternative_words in self._word_index.get(word, ()):
+                if i not in candidates and alternative_words <= words:
+                    candidates.add(i)
+        return tuple(sorted(candidates))
+
+    @classmethod
+    def from_file(cls, path: str, flags: int = re.IGNORECASE) -> 'PatternCatalogue':
+        with open(path, 'r') as f:
+            return cls(json.load(f), flags)
+
+    @classmethod
+    def from_keywords(cls, keywords: Iterable[str], flags: int = 0) -> 'PatternCatalogue':
+        """Build a catalogue of whole-word keywords."""
+        return cls([
+            {'id': keyword, 'pattern': r'\b' + re.escape(keyword) + r'\b', 'description': keyword}
+            for keyword in keywords
+        ], flags)
+
+    def search(self, text: str) -> bool:
+        """Whether any entry matches the text."""
+        candidates = self._candidates(text)
+        if not candidates:
+            return False
+        return self._subset_regex(candidates, False).search(text) is not None
+
+    def scan(self, text: str) -> CatalogueMatches:
+        """Find every entry's hits in a single pass over the text."""
+        matches = CatalogueMatches()
+        candidates = self._candidates(text)
+        if not candidates:
+            return matches
+        group_ids = self._group_ids
+        for m in self._subset_regex(candidates).finditer(text):
+            matches.add(group_ids[m.lastgroup], m.span())
+        return matches
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Any, Callable, Optional
+from sqlalchemy import select, update, func, or_
+from ..models import EmailAudit, AuditRuleResult
+from ..models.database import db
+from .batch_audit import evaluate_sources
+from .audit_store import prepare_reports, save_rule_results, delete_rule_results, stored_result
+from .rollups import record_reaudits
+from .rules_engine import get_rules_engine
+
+def _load_checkpoint(path: Optional[str], rules_version: str) -> Optional[Dict[str, Any]]:
+    """Progress of an interrupted run under the same rules, if any."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('rules_version') == rules_version else None
+
+def _save_checkpoint(path: str, state: Dict[str, Any]):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def stale_audits(rules_version: str):
+    """Filter for audits evaluated under rules other than rules_version."""
+    return or_(EmailAudit.rules_version.is_(None), EmailAudit.rules_version != rules_version)
+
+def reaudit(app, chunk_size: int = 500, max_workers: int = 1, checkpoint_path: Optional[str] = None,
+            restart: bool = False, pause: float = 0.0,
+            on_chunk: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Re-evaluate every stale audit with the active rules and store the new results.
+
+    Audits are read in primary-key order one chunk at a time, evaluated on
+    the process pool from their stored compressed text and written back
+    with one bulk UPDATE per chunk, so no transaction outlives a chunk.
+    After each chunk the progress is written to checkpoint_path; a later
+    run under the same rules resumes after the last finished id. Audits
+    without stored text (thread audits and rows from before the text was
+    kept) cannot be re-run and are only counted.
+    """
+    rules_path = os.path.join(app.root_path, 'rules.json')
+    rules_version = get_rules_engine(rules_path).version
+    state = None if restart else _load_checkpoint(checkpoint_path, rules_version)
+    resumed = state is not None
+    if state is None:
+        state = {'rules_version': rules_version, 'last_id': 0, 'updated': 0, 'failed': 0, 'seconds': 0.0}
+    is_stale = stale_audits(rules_version)
+    min_parallel = app.config.get('AUDIT_POOL_MIN_BATCH', 2)
+
+    while True:
+        started = time.perf_counter()
+        rows = db.session.execute(
+            select(EmailAudit.id, EmailAudit.user_id, EmailAudit.created_at, EmailAudit.score, EmailAudit.source_text)
+            .where(EmailAudit.id > state['last_id'], EmailAudit.source_text.isnot(None), is_stale)
+            .order_by(EmailAudit.id)
+            .limit(chunk_size)
+        ).all()
+        # End the read transaction before the slow part
+        db.session.rollback()
+        if not rows:
+            break
+
+        results = evaluate_sources(rules_path, [row.source_text for row in rows], max_workers, min_parallel)
+        reaudited = [(row.id, result) for row, result in zip(rows, results) if 'error' not in result]
+        reaudited_rows = [row for row, result in zip(rows, results) if 'error' not in result]
+        updates = [
+            {'id': audit_id, 'audit_result': stored_result(report), 'score': report['score'], 'rules_version': rules_version}
+            for audit_id, report in reaudited
+        ]
+        try:
+            prepare_reports(report for _, report in reaudited)
+            if updates:
+                old_rules = {row.id: [] for row in reaudited_rows}
+                for audit_id, rule_text_id, passed, score in db.session.execute(
+                    select(AuditRuleResult.audit_id, AuditRuleResult.rule_text_id, AuditRuleResult.passed, AuditRuleResult.score)
+                    .where(AuditRuleResult.audit_id.in_(list(old_rules)))
+                ):
+                    old_rules[audit_id].append((rule_text_id, passed, score or 0))
+                record_reaudits([
+                    (row.user_id, row.created_at.date(), row.score, old_rules[row.id], report)
+                    for row, (_, report) in zip(reaudited_rows, reaudited) if row.created_at is not None
+                ])
+                db.session.execute(update(EmailAudit), updates)
+                delete_rule_results([audit_id for audit_id, _ in reaudited])
+                save_rule_results(reaudited)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        state['last_id'] = rows[-1].id
+        state['updated'] += len(updates)
+        state['failed'] += len(rows) - len(updates)
+        state['seconds'] += time.perf_counter() - started
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, state)
+        if on_chunk:
+            on_chunk(state)
+        if pause:
+            time.sleep(pause)
+
+    state['skipped'] = db.session.query(func.count(EmailAudit.id))\
+        .filter(EmailAudit.source_text.is_(None), is_stale).scalar()
+    state['resumed'] = resumed
+    db.session.rollback()
+    # A finished run leaves nothing to resume
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return state
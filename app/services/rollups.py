@@ -0,0 +1,160 @@
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, func, case
+from .audit_store import intern_texts, is_normalized
+from ..models import EmailAudit, AuditRuleResult, InternedText, UsageCounter, RuleDailyStat
+from ..models.database import db
+
+# (rule_text_id, passed, score) of one stored rule result
+RuleRow = Tuple[int, bool, int]
+
+def _rule_rows(report: Dict[str, Any]) -> List[RuleRow]:
+    """Rule results of a report keyed by interned rule id; the report must already be interned."""
+    if not is_normalized(report):
+        return []
+    ids = intern_texts(rule['rule_id'] for rule in report['rules'])
+    return [(ids[rule['rule_id']], bool(rule['passed']), rule['score'] or 0) for rule in report['rules']]
+
+def _add_rule_rows(user_id: int, day: date, added: Iterable[RuleRow], removed: Iterable[RuleRow] = ()):
+    totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for sign, rows in ((1, added), (-1, removed)):
+        for rule_text_id, passed, score in rows:
+            total = totals[rule_text_id]
+            total[0] += sign
+            total[1] += sign * passed
+            total[2] += sign * score
+    for rule_text_id, (evaluated, passed, score_sum) in totals.items():
+        if evaluated or passed or score_sum:
+            RuleDailyStat.increment(user_id, day, rule_text_id, evaluated, passed, score_sum)
+
+def record_audits(user_id: int, reports: List[Dict[str, Any]], reserved_on: Optional[date] = None):
+    """Add just-saved audits to today's rollups, in the caller's transaction.
+
+    Their count and scores go to the same day. If they were reserved against
+    the daily limit (RateLimiter.reserve), on reserved_on, those reservations
+    are released. Run prepare_reports on the reports first, as for saving
+    their rule rows.
+    """
+    day = datetime.utcnow().date()
+    UsageCounter.increment(user_id, day, len(reports), sum(report['score'] for report in reports))
+    if reserved_on is not None:
+        UsageCounter.release(user_id, reserved_on, len(reports))
+    rows = [row for report in reports for row in _rule_rows(report)]
+    if rows:
+        _add_rule_rows(user_id, day, rows)
+
+def record_reaudits(audits: List[Tuple[int, date, int, List[RuleRow], Dict[str, Any]]]):
+    """Swap the old results of re-audited audits for new ones in the rollups.
+
+    Takes (user id, day, old score, old rule rows, new report) tuples; the
+    audit counts stay as they are.
+    """
+    score_deltas: Dict[Tuple[int, date], int] = defaultdict(int)
+    for user_id, day, old_score, old_rules, report in audits:
+        score_deltas[user_id, day] += report['score'] - (old_score or 0)
+        _add_rule_rows(user_id, day, _rule_rows(report), old_rules)
+    for (user_id, day), delta in score_deltas.items():
+        if delta:
+            UsageCounter.increment(user_id, day, 0, delta)
+
+def rebuild_rollups() -> Dict[str, int]:
+    """Recompute every rollup row from email_audits and audit_rule_results in one transaction.
+
+    Only the audit counts and score sums are rebuilt; the rate limit
+    reservations of unfinished jobs stay as they are.
+    """
+    day = func.date(EmailAudit.created_at)
+    saved = select(
+        EmailAudit.user_id.label('user_id'), day.label('day'),
+        func.count(EmailAudit.id).label('count'), func.coalesce(func.sum(EmailAudit.score), 0).label('score_sum')
+    ).where(EmailAudit.created_at.isnot(None)).group_by(EmailAudit.user_id, day).subquery()
+    try:
+        db.session.execute(delete(RuleDailyStat))
+        db.session.execute(delete(UsageCounter).where(UsageCounter.reserved == 0))
+        db.session.execute(update(UsageCounter).values(count=0, score_sum=0))
+        db.session.execute(
+            update(UsageCounter)
+            .where(UsageCounter.user_id == saved.c.user_id, UsageCounter.day == saved.c.day)
+            .values(count=saved.c.count, score_sum=saved.c.score_sum)
+        )
+        db.session.execute(insert(UsageCounter).from_select(
+            ['user_id', 'day', 'count', 'score_sum'],
+            select(saved.c.user_id, saved.c.day, saved.c.count, saved.c.score_sum).where(~select(UsageCounter.user_id).where(
+                UsageCounter.user_id == saved.c.user_id, UsageCounter.day == saved.c.day
+            ).exists())
+        ))
+        db.session.execute(insert(RuleDailyStat).from_select(
+            ['user_id', 'day', 'rule_text_id', 'evaluated', 'passed', 'score_sum'],
+            select(
+                EmailAudit.user_id, day, AuditRuleResult.rule_text_id,
+                func.count(),
+                func.sum(case((AuditRuleResult.passed, 1), else_=0)),
+                func.coalesce(func.sum(AuditRuleResult.score), 0)
+            )
+            .join(AuditRuleResult, AuditRuleResult.audit_id == EmailAudit.id)
+            .where(EmailAudit.created_at.isnot(None))
+            .group_by(EmailAudit.user_id, day, AuditRuleResult.rule_text_id)
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {
+        'usage_counters': db.session.query(func.count()).select_from(UsageCounter).scalar(),
+        'rule_daily_stats': db.session.query(func.count()).select_from(RuleDailyStat).scalar(),
+    }
+
+def _average(total: int, count: int):
+    return round(total / count, 2) if count else None
+
+def get_user_stats(user_id: int, days: int = 30) -> Dict[str, Any]:
+    """A user's audit counts and scores over the last `days` days, read from the rollups only."""
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    daily = db.session.query(UsageCounter.day, UsageCounter.count, UsageCounter.score_sum)\
+        .filter(UsageCounter.user_id == user_id, UsageCounter.day >= start)\
+        .order_by(UsageCounter.day).all()
+    rules = db.session.query(
+        InternedText.text,
+        func.sum(RuleDailyStat.evaluated),
+        func.sum(RuleDailyStat.passed),
+        func.sum(RuleDailyStat.score_sum)
+    ).join(InternedText, InternedText.id == RuleDailyStat.rule_text_id)\
+        .filter(RuleDailyStat.user_id == user_id, RuleDailyStat.day >= start)\
+        .group_by(InternedText.text).all()
+
+    audits = sum(count for _, count, _ in daily)
+    return {
+        'since': start.isoformat(),
+        'days': days,
+        'audits': audits,
+        'average_score': _average(sum(score_sum for _, _, score_sum in daily), audits),
+        'daily': [
+            {'day': day.isoformat(), 'audits': count, 'average_score': _average(score_sum, count)}
+            for day, count, score_sum in daily
+        ],
+        'rules': {
+            rule_id: {
+                'evaluated': int(evaluated),
+                'passed': int(passed),
+                'pass_rate': round(passed / evaluated, 4) if evaluated else None,
+                'average_score': _average(score_sum, evaluated)
+            }
+            for rule_id, evaluated, passed, score_sum in rules
+        }
+    }
+
+def get_audit_totals(days: int = 30) -> Dict[str, int]:
+    """Audits stored over the last `days` days and today, summed from the per-user daily counters.
+
+    Only that range of days is read (ix_usage_counters_day), so the cost
+    does not grow with the history kept.
+    """
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    recent, today_total = db.session.query(
+        func.coalesce(func.sum(UsageCounter.count), 0),
+        func.coalesce(func.sum(case((UsageCounter.day == today, UsageCounter.count), else_=0)), 0)
+    ).filter(UsageCounter.day >= start).one()
+    return {'audits_recent': int(recent), 'recent_days': days, 'audits_today': int(today_total)}
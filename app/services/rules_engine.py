@@ -1,21 +1,116 @@
+import hashlib
 import json
-from typing import List, Dict, Any
+import os
+import threading
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from . import rules_impl
+from .text_analysis import analyze
+
+class CompiledRule:
+    """A rule definition with its implementation resolved."""
+
+    __slots__ = ('rule_id', 'description', 'function_name', 'func')
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.rule_id = rule['id']
+        self.description = rule['description']
+        self.function_name = rule['function']
+        self.func: Optional[Callable] = getattr(rules_impl, self.function_name, None)
+
+    def evaluate(self, email_text) -> Dict[str, Any]:
+        if self.func is None:
+            return {
+                'rule_id': self.rule_id,
+                'description': self.description,
+                'passed': False,
+                'score': 0,
+                'justification': f"Rule function {self.function_name} not implemented."
+            }
+        return {
+            'rule_id': self.rule_id,
+            'description': self.description,
+            **self.func(email_text)
+        }
 
 class RulesEngine:
+    """Compiled rule pipeline, reloaded only when the rules file changes."""
+
     def __init__(self, rules_path: str):
-        with open(rules_path, 'r') as f:
-            self.rules = json.load(f)
+        self.rules_path = rules_path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._state: Tuple[str, List[Dict[str, Any]], List[CompiledRule]] = ('', [], [])
+        self._load()
+
+    @property
+    def version(self) -> str:
+        """Identifier of the active rules file content."""
+        return self._state[0]
 
-    def evaluate(self, email_thread: Dict[str, Any]) -> List[Dict[str, Any]]:
+    @property
+    def rules(self) -> List[Dict[str, Any]]:
+        return self._state[1]
+
+    @property
+    def compiled_rules(self) -> List[CompiledRule]:
+        return self._state[2]
+
+    def _load(self, mtime: Optional[float] = None) -> bool:
+        """Read the rules file and recompile if its content changed."""
+        with open(self.rules_path, 'rb') as f:
+            raw = f.read()
+        self._mtime = mtime if mtime is not None else os.path.getmtime(self.rules_path)
+        version = hashlib.sha256(raw).hexdigest()[:16]
+        if version == self._state[0]:
+            return False
+        rules = json.loads(raw)
+        # Swap the whole state at once so concurrent evaluations never see a mix
+        self._state = (version, rules, [CompiledRule(rule) for rule in rules])
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Recompile if the rules file mtime and content hash changed."""
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            return self._load(mtime)
+
+    def evaluate(self, content, on_rule: Optional[Callable[[str, float], None]] = None) -> List[Dict[str, Any]]:
+        """Run every rule against email content (dict with 'text' or a string).
+        
+        on_rule, if given, is called with each rule id and its run time in seconds.
+        """
+        email_text = content['text'] if isinstance(content, dict) else content
+        # Tokenize once; every rule reads from the same analysis
+        analysis = analyze(email_text)
+        if on_rule is None:
+            return [rule.evaluate(analysis) for rule in self.compiled_rules]
         results = []
-        for rule in self.rules:
-            # Placeholder: Each rule should have an 'id', 'description', and 'function' key
-            # Actual evaluation logic will be implemented later
-            result = {
-                'rule_id': rule['id'],
-                'passed': None,
-                'score': 0,
-                'justification': 'Not implemented yet.'
-            }
-            results.append(result)
-        return results 
\ No newline at end of file
+        for rule in self.compiled_rules:
+            start = time.perf_counter()
+            results.append(rule.evaluate(analysis))
+            on_rule(rule.rule_id, time.perf_counter() - start)
+        return results
+
+_engines: Dict[str, RulesEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_rules_engine(rules_path: str) -> RulesEngine:
+    """Get the per-process rules engine for a rules file."""
+    engine = _engines.get(rules_path)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(rules_path)
+            if engine is None:
+                engine = RulesEngine(rules_path)
+                _engines[rules_path] = engine
+                return engine
+    engine.reload_if_changed()
+    return engine
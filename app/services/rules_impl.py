@@ -1,24 +1,46 @@
+import os
 import re
 import math
+from .text_analysis import analyze
+from .pattern_matcher import PatternCatalogue
+
+GRAMMAR_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'grammar_catalogue.json')
+
+GREETINGS = ["hello", "hi", "dear", "greetings", "good morning", "good afternoon", "good evening"]
+
+# Compiled once per process; each check scans the text a single time
+_greeting_matcher = PatternCatalogue.from_keywords(GREETINGS)
+_grammar_catalogue = PatternCatalogue.from_file(GRAMMAR_CATALOGUE_PATH)
+
+ACTION_WORDS = ["please", "request", "need", "require", "action", "follow up", "next steps"]
+PROFESSIONAL_INDICATORS = ["thank you", "regards", "sincerely", "best regards", "kind regards"]
+_ALL_CAPS_RE = re.compile(r'\b[A-Z]{3,}\b')
+
+# Thresholds of the numeric checks, shared with the vectorized batch scorer
+PASS_SCORE = 7
+MAX_GRAMMAR_PENALTY = 3
+MAX_AVG_WORD_LENGTH = 8
+MAX_AVG_SENTENCE_LENGTH = 25
+MIN_WORD_COUNT = 10
+MAX_WORD_COUNT = 500
+MIN_PARAGRAPHS = 2
+MAX_EXCLAMATIONS = 3
 
 def check_greeting(email_text):
     """Check if the email contains an appropriate greeting."""
-    greetings = ["hello", "hi", "dear", "greetings", "good morning", "good afternoon", "good evening"]
-    email_lower = email_text.lower()
+    analysis = analyze(email_text)
     
-    # Check for greetings in the first few lines
-    first_lines = email_lower.split('\n')[:3]
-    for line in first_lines:
-        # Use word boundaries to avoid partial matches
-        for greet in greetings:
-            if re.search(r'\b' + re.escape(greet) + r'\b', line):
-                return {'passed': True, 'score': 10, 'justification': 'Professional greeting found.'}
+    # Check for greetings in the first few lines (keywords match on word boundaries)
+    if _greeting_matcher.search(analysis.head_lower(3)):
+        return {'passed': True, 'score': 10, 'justification': 'Professional greeting found.'}
     
     return {'passed': False, 'score': 0, 'justification': 'No appropriate greeting detected. Consider adding a professional greeting.'}
 
 def check_grammar(email_text):
     """Check grammar quality using multiple metrics."""
-    if not email_text.strip():
+    analysis = analyze(email_text)
+    email_text = analysis.text
+    if analysis.is_blank:
         return {'passed': False, 'score': 0, 'justification': 'Email content is empty.'}
     
     # Basic grammar checks
@@ -26,102 +48,80 @@ def check_grammar(email_text):
     score = 10
     
     # Check for proper sentence endings
-    sentences = re.split(r'[.!?]+', email_text)
-    incomplete_sentences = [s.strip() for s in sentences if s.strip() and not s.strip().endswith(('.', '!', '?'))]
+    incomplete_sentences = [s for s in analysis.sentences if not s.endswith(('.', '!', '?'))]
     if incomplete_sentences:
         issues.append(f"Found {len(incomplete_sentences)} incomplete sentences")
         score -= 2
     
-    # Check for common grammar mistakes
-    common_mistakes = [
-        (r'\b(you\'re|your)\b', 'your/you\'re confusion'),
-        (r'\b(there|their|they\'re)\b', 'there/their/they\'re confusion'),
-        (r'\b(its|it\'s)\b', 'its/it\'s confusion'),
-        (r'\b(loose|lose)\b', 'loose/lose confusion'),
-        (r'\b(affect|effect)\b', 'affect/effect confusion'),
-        (r'\bcant\b', 'missing apostrophe in "can\'t"'),
-        (r'\bdont\b', 'missing apostrophe in "don\'t"'),
-        (r'\bwont\b', 'missing apostrophe in "won\'t"'),
-        (r'\bim\b', 'missing apostrophe in "I\'m"'),
-        (r'\bive\b', 'missing apostrophe in "I\'ve"'),
-        (r'\byouve\b', 'missing apostrophe in "you\'ve"'),
-        (r'\bweve\b', 'missing apostrophe in "we\'ve"'),
-        (r'\btheyve\b', 'missing apostrophe in "they\'ve"')
-    ]
-    
-    mistake_count = 0
-    for pattern, description in common_mistakes:
-        if re.search(pattern, email_text, re.IGNORECASE):
-            mistake_count += 1
+    # Check for common grammar mistakes (catalogue entries found in one scan)
+    mistake_count = len(_grammar_catalogue.scan(email_text))
     
     if mistake_count > 0:
         issues.append(f"Found {mistake_count} potential grammar issues")
-        score -= min(3, mistake_count)
+        score -= min(MAX_GRAMMAR_PENALTY, mistake_count)
     
     # Basic readability check
-    word_count = len(email_text.split())
+    word_count = analysis.word_count
     if word_count > 0:
-        avg_word_length = sum(len(word) for word in email_text.split()) / word_count
-        if avg_word_length > 8:
+        avg_word_length = analysis.total_word_length / word_count
+        if avg_word_length > MAX_AVG_WORD_LENGTH:
             issues.append("Text might be too complex (long average word length)")
             score -= 1
         
         # Check sentence complexity
-        sentences = re.split(r'[.!?]+', email_text)
-        if sentences:
-            avg_sentence_length = word_count / len([s for s in sentences if s.strip()])
-            if avg_sentence_length > 25:
+        if analysis.sentence_count:
+            avg_sentence_length = word_count / analysis.sentence_count
+            if avg_sentence_length > MAX_AVG_SENTENCE_LENGTH:
                 issues.append("Sentences are too long - consider breaking them up")
                 score -= 1
     
     justification = "Grammar quality is good." if not issues else f"Grammar issues found: {'; '.join(issues)}"
-    return {'passed': score >= 7, 'score': max(0, score), 'justification': justification}
+    return {'passed': score >= PASS_SCORE, 'score': max(0, score), 'justification': justification}
 
 def check_clarity(email_text):
     """Check email clarity and structure."""
-    if not email_text.strip():
+    analysis = analyze(email_text)
+    email_text = analysis.text
+    if analysis.is_blank:
         return {'passed': False, 'score': 0, 'justification': 'Email content is empty.'}
     
     issues = []
     score = 10
     
     # Check email length
-    word_count = len(email_text.split())
-    if word_count < 10:
+    word_count = analysis.word_count
+    if word_count < MIN_WORD_COUNT:
         issues.append("Email is too short - may lack necessary detail")
         score -= 3
-    elif word_count > 500:
+    elif word_count > MAX_WORD_COUNT:
         issues.append("Email is very long - consider breaking into smaller parts")
         score -= 2
     
     # Check for clear structure
-    paragraphs = [p.strip() for p in email_text.split('\n\n') if p.strip()]
-    if len(paragraphs) < 2:
+    if len(analysis.paragraphs) < MIN_PARAGRAPHS:
         issues.append("Email lacks clear paragraph structure")
         score -= 2
     
     # Check for action items or clear purpose
-    action_words = ["please", "request", "need", "require", "action", "follow up", "next steps"]
-    if not any(word in email_text.lower() for word in action_words):
+    if not any(word in analysis.lower for word in ACTION_WORDS):
         issues.append("Email may lack clear purpose or action items")
         score -= 1
     
     # Check for professional tone indicators
-    professional_indicators = ["thank you", "regards", "sincerely", "best regards", "kind regards"]
-    if not any(indicator in email_text.lower() for indicator in professional_indicators):
+    if not any(indicator in analysis.lower for indicator in PROFESSIONAL_INDICATORS):
         issues.append("Email may benefit from a professional closing")
         score -= 1
     
     # Check for excessive use of exclamation marks
     exclamation_count = email_text.count('!')
-    if exclamation_count > 3:
+    if exclamation_count > MAX_EXCLAMATIONS:
         issues.append("Too many exclamation marks - may appear unprofessional")
         score -= 2
     
     # Check for all caps (shouting)
-    if re.search(r'\b[A-Z]{3,}\b', email_text):
+    if _ALL_CAPS_RE.search(email_text):
         issues.append("Avoid using ALL CAPS - it appears as shouting")
         score -= 2
     
     justification = "Email is clear and well-structured." if not issues else f"Clarity issues: {'; '.join(issues)}"
-    return {'passed': score >= 7, 'score': max(0, score), 'justification': justification} 
\ No newline at end of file
+    return {'passed': score >= PASS_SCORE, 'score': max(0, score), 'justification': justification} 
\ No newline at end of file
@@ -0,0 +1,96 @@
+import re
+from functools import cached_property
+from typing import List, Tuple, Union
+
+_WORD_RE = re.compile(r'\S+')
+# Sentences are the runs between terminators, matching re.split(r'[.!?]+', text)
+_SENTENCE_RE = re.compile(r'[^.!?]+')
+
+class TextAnalysis:
+    """Precomputed views of an email body, shared by every rule.
+
+    Each view is derived lazily and at most once per body, so rules can
+    ask for whatever they need without re-tokenizing the raw string.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def char_count(self) -> int:
+        return len(self.text)
+
+    @cached_property
+    def is_blank(self) -> bool:
+        return not self.text.strip()
+
+    @cached_property
+    def word_spans(self) -> List[Tuple[int, int]]:
+        """(start, end) offsets of whitespace-separated tokens."""
+        return [m.span() for m in _WORD_RE.finditer(self.text)]
+
+    @cached_property
+    def words(self) -> List[str]:
+        """Word tokens, identical to text.split()."""
+        return self.text.split()
+
+    @cached_property
+    def word_count(self) -> int:
+        return len(self.words)
+
+    @cached_property
+    def word_lengths(self) -> List[int]:
+        return [len(word) for word in self.words]
+
+    @cached_property
+    def total_word_length(self) -> int:
+        return sum(self.word_lengths)
+
+    @cached_property
+    def sentence_spans(self) -> List[Tuple[int, int]]:
+        """(start, end) offsets of non-blank sentences."""
+        text = self.text
+        return [m.span() for m in _SENTENCE_RE.finditer(text) if not text[m.start():m.end()].isspace()]
+
+    @cached_property
+    def sentences(self) -> List[str]:
+        """Non-blank sentences, stripped."""
+        text = self.text
+        return [text[start:end].strip() for start, end in self.sentence_spans]
+
+    @cached_property
+    def sentence_count(self) -> int:
+        return len(self.sentence_spans)
+
+    @cached_property
+    def paragraphs(self) -> List[str]:
+        """Non-blank paragraphs separated by blank lines, stripped."""
+        return [p.strip() for p in self.text.split('\n\n') if p.strip()]
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return self.text.split('\n')
+
+    @cached_property
+    def line_offsets(self) -> List[int]:
+        """Start offset of every line."""
+        offsets = [0]
+        offset = 0
+        for line in self.lines[:-1]:
+            offset += len(line) + 1
+            offsets.append(offset)
+        return offsets
+
+    def head_lower(self, line_count: int) -> str:
+        """The first line_count lines, lowercased."""
+        return '\n'.join(self.lower.split('\n', line_count)[:line_count])
+
+def analyze(email_text: Union[str, TextAnalysis]) -> TextAnalysis:
+    """Wrap raw text in a TextAnalysis, reusing an existing one."""
+    if isinstance(email_text, TextAnalysis):
+        return email_text
+    return TextAnalysis(email_text)
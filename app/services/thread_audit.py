@@ -0,0 +1,81 @@
+import re
+from typing import List, Dict, Any, Tuple
+from .audit_report import ThreadAuditReport
+from .batch_audit import evaluate_texts
+
+# Where the quoted part of a reply starts: an "On ... wrote:" attribution
+# (possibly wrapped onto a second line), an Original/Forwarded message
+# separator, or an Outlook "From:/Sent:" header block
+_QUOTE_START = re.compile(
+    r'^(?:On [^\n]*(?:\n[^\n]*)?\bwrote:[ \t]*$'
+    r'|[ \t]*-{2,}[ \t]*(?:Original|Forwarded)[ \t]+[Mm]essage[ \t]*-{2,}'
+    r'|From:[^\n]*\n(?:(?:To|Cc|Date):[^\n]*\n)*Sent:)',
+    re.MULTILINE
+)
+_QUOTE_PREFIX = re.compile(r'^[ \t>]+', re.MULTILINE)
+
+def split_quoted(text: str) -> Tuple[str, str]:
+    """Split a message body into the sender's own text and the text it quotes."""
+    match = _QUOTE_START.search(text)
+    # The attribution or separator itself belongs to neither part
+    own, quoted = (text[:match.start()], text[match.end():]) if match else (text, '')
+    if '>' in own:
+        # Interleaved replies quote with '>' line prefixes
+        lines = own.split('\n')
+        quoted_lines = [line for line in lines if line.lstrip().startswith('>')]
+        if quoted_lines:
+            own = '\n'.join(line for line in lines if not line.lstrip().startswith('>'))
+            quoted = '\n'.join(quoted_lines) + ('\n' + quoted if quoted else '')
+    return own.rstrip(), quoted
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+# Quoted paragraphs shorter than this ("Thanks,") say nothing about their source
+MIN_QUOTED_PARAGRAPH = 20
+
+def _normalize(text: str) -> str:
+    """Text with quote prefixes and whitespace differences removed, for comparisons."""
+    return ' '.join(_QUOTE_PREFIX.sub('', text).split())
+
+def _quoted_paragraphs(quoted: str) -> List[str]:
+    paragraphs = (_normalize(paragraph) for paragraph in _PARAGRAPH_BREAK.split(_QUOTE_PREFIX.sub('', quoted)))
+    return [paragraph for paragraph in paragraphs if len(paragraph) >= MIN_QUOTED_PARAGRAPH]
+
+def audit_thread(rules_path: str, contents: List[Dict[str, Any]],
+                 max_workers: int = 1, min_parallel: int = 2) -> Dict[str, Any]:
+    """Audit every message of a thread and aggregate a thread score.
+
+    Each message is judged on its own text, without the replies it quotes.
+    Messages whose own text repeats an earlier one are evaluated once and
+    point at it with `duplicate_of`; `quotes` lists the earlier messages
+    whose paragraphs a message quotes. Distinct texts are evaluated on
+    the process pool.
+    """
+    own_texts = []
+    quoted_texts = []
+    for content in contents:
+        own, quoted = split_quoted(content['text'])
+        # A message that only quotes others is judged as it stands
+        own_texts.append(own if own.strip() else content['text'])
+        quoted_texts.append(_quoted_paragraphs(quoted))
+
+    keys = [_normalize(text) for text in own_texts]
+    first_seen: Dict[str, int] = {}
+    for i, key in enumerate(keys):
+        first_seen.setdefault(key, i)
+    unique = sorted(first_seen.values())
+    evaluated = dict(zip(
+        (keys[i] for i in unique),
+        evaluate_texts(rules_path, [own_texts[i] for i in unique], max_workers, min_parallel)
+    ))
+
+    message_reports = []
+    for i, key in enumerate(keys):
+        report = {'index': i, **evaluated[key]}
+        if first_seen[key] != i:
+            report['duplicate_of'] = first_seen[key]
+        report['quotes'] = [
+            j for j in range(i) if any(paragraph in keys[j] for paragraph in quoted_texts[i])
+        ]
+        message_reports.append(report)
+    return ThreadAuditReport(message_reports).to_dict()
@@ -0,0 +1,97 @@
+import re
+from typing import List, Iterator, NamedTuple, Optional, BinaryIO, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Two or more header fields in a row (with folded continuation lines)
+_HEADER_RUN = rb'(?:[A-Za-z][A-Za-z0-9-]*:[^\n]*\n(?:[ \t][^\n]*\n)*){2,}'
+
+_ENVELOPE = rb'From [^\n]*\n'
+_SEPARATOR = rb'[ \t]*-{2,}[ \t]*(?:Original|Forwarded)[ \t]+[Mm]essage[ \t]*-{2,}[^\n]*\n'
+
+# A message starts with a header run after a blank line, optionally behind
+# an mbox "From " envelope line, or right after an "Original/Forwarded
+# message" separator of a quoted reply. Every match begins with the newline
+# ending the previous line, which lets the regex engine skip ahead quickly.
+_BOUNDARY = re.compile(
+    rb'\n(?:\r?\n(?P<envelope>)(?:' + _ENVELOPE + rb')?|(?P<separator>)' + _SEPARATOR + rb')'
+    rb'(?P<headers>' + _HEADER_RUN + rb')'
+)
+
+# The same at the very start of a buffer, which counts as after a blank line
+_TOP = re.compile(
+    rb'(?:\r?\n)?(?:(?P<envelope>)(?:' + _ENVELOPE + rb')?|(?P<separator>)' + _SEPARATOR + rb')'
+    rb'(?P<headers>' + _HEADER_RUN + rb')'
+)
+
+# Only header runs naming an originator start a message; a stray
+# "Subject:"/"To:" pair in a body does not
+_ORIGINATOR = re.compile(rb'^(?:From|Message-ID):', re.MULTILINE | re.IGNORECASE)
+
+_NON_SPACE = re.compile(rb'\S')
+
+class Boundary(NamedTuple):
+    """Where a message starts: the boundary line and its first header."""
+    line_start: int
+    message_start: int
+    kind: str  # 'headers', 'mbox' or 'quote'
+
+def _boundary(buf: Buffer, match) -> Optional[Boundary]:
+    headers_start, headers_end = match.span('headers')
+    if _ORIGINATOR.search(buf, headers_start, headers_end) is None:
+        return None
+    if match.start('separator') >= 0:
+        return Boundary(match.start('separator'), headers_start, 'quote')
+    kind = 'mbox' if match.end('envelope') < headers_start else 'headers'
+    return Boundary(match.start('envelope'), headers_start, kind)
+
+def iter_boundaries(buf: Buffer) -> Iterator[Boundary]:
+    """Find message starts in one pass over the buffer."""
+    match = _TOP.match(buf) or _BOUNDARY.search(buf)
+    while match is not None:
+        boundary = _boundary(buf, match)
+        if boundary is not None:
+            yield boundary
+        # Resume on the newline ending the header run, so a message with an
+        # empty body is still followed by its successor's boundary
+        match = _BOUNDARY.search(buf, match.end() - 1)
+
+def message_offsets(buf: Buffer) -> List[tuple]:
+    """(start, end) offsets of each message, skipping whitespace-only spans.
+
+    Text before the first boundary is a message of its own. The newline
+    ending the line before a boundary belongs to neither message, and
+    envelope and separator lines are dropped.
+    """
+    offsets = []
+    start = 0
+    for boundary in iter_boundaries(buf):
+        end = boundary.line_start
+        if end and buf[end - 1:end] == b'\n':
+            end -= 1
+        if _NON_SPACE.search(buf, start, end):
+            offsets.append((start, end))
+        start = boundary.message_start
+    if _NON_SPACE.search(buf, start, len(buf)):
+        offsets.append((start, len(buf)))
+    return offsets
+
+def split_thread(buf: Buffer) -> List[memoryview]:
+    """Slices of each message in the buffer, without copying."""
+    view = memoryview(buf)
+    return [view[start:end] for start, end in message_offsets(buf)]
+
+def iter_blocks(stream: BinaryIO) -> Iterator[bytes]:
+    """Read a stream in runs of lines ending with a blank line.
+
+    Header runs never cross a blank line, so scanning each block on its
+    own finds the same boundaries as scanning the whole stream.
+    """
+    lines: List[bytes] = []
+    for line in stream:
+        lines.append(line)
+        if line in (b'\n', b'\r\n'):
+            yield b''.join(lines)
+            lines = []
+    if lines:
+        yield b''.join(lines)
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Optional, Dict, Any
+from flask import current_app
+
+ApiIdentity = namedtuple('ApiIdentity', ['id', 'subscription_tier'])
+
+class ApiKeyCache:
+    """Per-worker TTL/LRU map from API key to a lightweight identity.
+
+    Key rotation touches a shared stamp file; every worker compares the
+    stamp on lookup and drops its entries when it changed, so a rotated
+    key stops working everywhere on the next request.
+    """
+
+    def __init__(self, stamp_path: str, max_entries: int = 4096, ttl: int = 60):
+        self.stamp_path = stamp_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = self._read_stamp()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.stamp_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _sync_stamp(self):
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                self._entries.clear()
+                self._stamp = stamp
+
+    def get(self, api_key: str) -> Optional[ApiIdentity]:
+        self._sync_stamp()
+        with self._lock:
+            cached = self._entries.get(api_key)
+            if cached is not None:
+                expires_at, identity = cached
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(api_key)
+                    self.hits += 1
+                    return identity
+                del self._entries[api_key]
+            self.misses += 1
+        return None
+
+    def put(self, api_key: str, identity: ApiIdentity):
+        with self._lock:
+            self._entries[api_key] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, api_key: Optional[str] = None):
+        """Forget a key (or everything) here and signal the other workers."""
+        with self._lock:
+            if api_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(api_key, None)
+        try:
+            directory = os.path.dirname(self.stamp_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(time.time_ns()))
+            # A fresh inode guarantees the stamp differs even within one mtime tick
+            os.replace(tmp_path, self.stamp_path)
+        except OSError as e:
+            current_app.logger.warning(f"Could not update API key cache stamp: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+_cache: Optional[ApiKeyCache] = None
+_cache_lock = threading.Lock()
+
+def get_api_key_cache() -> ApiKeyCache:
+    """Get the per-process API key cache, configured from the current app."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = current_app.config
+                _cache = ApiKeyCache(
+                    stamp_path=config.get('API_KEY_CACHE_STAMP') or os.path.join(
+                        tempfile.gettempdir(), 'email_auditor_api_keys.stamp'),
+                    max_entries=config.get('API_KEY_CACHE_SIZE', 4096),
+                    ttl=config.get('API_KEY_CACHE_TTL', 60)
+                )
+    return _cache
@@ -0,0 +1,201 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from flask import g, has_request_context, request
+
+# Upper bounds in seconds, from fast rule checks to slow multi-megabyte uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = 'email_auditor_stage_seconds'
+RULE_SECONDS = 'email_auditor_rule_seconds'
+REQUEST_SECONDS = 'email_auditor_request_seconds'
+
+HELP = {
+    STAGE_SECONDS: 'Time spent in each audit stage.',
+    RULE_SECONDS: 'Time spent evaluating each rule.',
+    REQUEST_SECONDS: 'Time spent handling each request.',
+}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """Latency histograms of one worker process.
+
+    With a metrics directory each worker periodically writes its histograms
+    to its own file there, and any worker can merge all the files into the
+    totals for the whole server. Files are named by pid and process start,
+    so a new worker that reuses a pid does not overwrite a dead one's file.
+
+    Processes of the audit pool (batch_audit) never write a file, so what
+    they time themselves is not reported; the `batch_audit` stage of the
+    worker that submitted the work covers their wall time.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[Tuple[str, LabelSet], list] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._started = time.time_ns()
+        self._last_flush = 0.0
+
+    def _check_fork(self):
+        # A forked worker must not report (or overwrite) its parent's figures
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._histograms.clear()
+                self._pid = os.getpid()
+                self._started = time.time_ns()
+                self._last_flush = 0.0
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        self._check_fork()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        self._check_fork()
+        with self._lock:
+            return [
+                {'name': name, 'labels': dict(labels), 'buckets': list(counts), 'sum': total, 'count': count}
+                for (name, labels), (counts, total, count) in self._histograms.items()
+            ]
+
+    def _path(self, directory: str) -> str:
+        return os.path.join(directory, f'metrics_{self._pid}_{self._started}.json')
+
+    def flush(self, directory: str, interval: float = 0.0):
+        """Write this worker's histograms to the metrics directory, at most once per interval."""
+        self._check_fork()
+        now = time.monotonic()
+        if self._last_flush and now - self._last_flush < interval:
+            return
+        self._last_flush = now
+        data = json.dumps({'buckets': self.buckets, 'histograms': self.snapshot()})
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(directory))
+
+    def collect(self, directory: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Histograms summed over every worker that wrote to the directory.
+
+        Files of exited workers are kept, so totals never go backwards when
+        gunicorn replaces a worker.
+        """
+        if not directory:
+            return self.snapshot()
+        self.flush(directory)
+        merged: Dict[Tuple[str, LabelSet], Dict[str, Any]] = {}
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if tuple(data.get('buckets', ())) != self.buckets:
+                continue
+            for histogram in data['histograms']:
+                key = (histogram['name'], tuple(sorted(histogram['labels'].items())))
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = {**histogram, 'buckets': list(histogram['buckets'])}
+                else:
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+                    total['sum'] += histogram['sum']
+                    total['count'] += histogram['count']
+        return list(merged.values())
+
+    def render(self, histograms: List[Dict[str, Any]]) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for histogram in histograms:
+            by_name.setdefault(histogram['name'], []).append(histogram)
+        for name in sorted(by_name):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for histogram in sorted(by_name[name], key=lambda h: sorted(h['labels'].items())):
+                labels = ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(histogram['labels'].items()))
+                prefix = f'{labels},' if labels else ''
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f"{name}_sum{suffix} {histogram['sum']}")
+                lines.append(f"{name}_count{suffix} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+registry = MetricsRegistry()
+
+def _add_server_timing(name: str, seconds: float):
+    if has_request_context():
+        timings = g.setdefault('server_timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def record_stage(stage: str, seconds: float):
+    """Record a finished stage in the histograms and the request's Server-Timing."""
+    registry.observe(STAGE_SECONDS, seconds, stage=stage)
+    _add_server_timing(stage, seconds)
+
+def record_rule(rule_id: str, seconds: float):
+    """Record one rule evaluation; matches the RulesEngine.evaluate on_rule callback."""
+    registry.observe(RULE_SECONDS, seconds, rule=rule_id)
+    _add_server_timing(f'rule.{rule_id}', seconds)
+
+@contextmanager
+def timed(stage: str):
+    """Time a block of code as an audit stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def init_metrics(app):
+    """Time every request and add the Server-Timing header."""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_timer(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        registry.observe(
+            REQUEST_SECONDS, elapsed,
+            endpoint=request.endpoint or 'unknown', status=str(response.status_code)
+        )
+        if app.config.get('SERVER_TIMING', True):
+            timings = g.get('server_timings', {})
+            entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items()]
+            entries.append(f'total;dur={elapsed * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+        directory = app.config.get('METRICS_DIR')
+        if directory:
+            try:
+                registry.flush(directory, app.config.get('METRICS_FLUSH_INTERVAL', 5.0))
+            except OSError as e:
+                app.logger.warning(f"Could not write metrics to {directory}: {e}")
+        return response
@@ -1,56 +1,83 @@
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
+from typing import Optional
 from flask import current_app
-from ..models import EmailAudit, User
-from ..models.user import db
+from ..models import User, UsageCounter
+from ..models.database import db
 
 class RateLimiter:
     """Rate limiting utility for API usage."""
-    
-    def check_limit(self, user_id: int) -> bool:
-        """Check if user has exceeded daily limit."""
-        today = datetime.utcnow().date()
+
+    def daily_limit(self, subscription_tier: str) -> int:
+        """Get daily limit based on subscription tier."""
+        if subscription_tier == 'free':
+            return current_app.config['FREE_TIER_DAILY_LIMIT']
+        return current_app.config['PREMIUM_TIER_DAILY_LIMIT']
+
+    @staticmethod
+    def reset_time() -> datetime:
+        """When today's counters roll over (next UTC midnight)."""
+        return datetime.combine(datetime.utcnow().date() + timedelta(days=1), time.min)
+
+    def _subscription_tier(self, user_id: int, subscription_tier: Optional[str]) -> Optional[str]:
+        if subscription_tier is not None:
+            return subscription_tier
         user = User.query.get(user_id)
-        
-        if not user:
+        return user.subscription_tier if user else None
+
+    def check_limit(self, user_id: int, amount: int = 1, subscription_tier: Optional[str] = None) -> bool:
+        """Check if user can run `amount` more audits today."""
+        subscription_tier = self._subscription_tier(user_id, subscription_tier)
+        if subscription_tier is None:
             return False
-        
-        # Get daily limit based on subscription tier
-        if user.subscription_tier == 'free':
-            daily_limit = current_app.config['FREE_TIER_DAILY_LIMIT']
-        else:
-            daily_limit = current_app.config['PREMIUM_TIER_DAILY_LIMIT']
-        
-        # Count today's audits
-        today_audits = EmailAudit.query.filter(
-            EmailAudit.user_id == user_id,
-            db.func.date(EmailAudit.created_at) == today
-        ).count()
-        
-        return today_audits < daily_limit
-    
-    def get_usage(self, user_id: int) -> dict:
+
+        today_audits = UsageCounter.get_count(user_id, datetime.utcnow().date())
+        return today_audits + amount <= self.daily_limit(subscription_tier)
+
+    def reserve(self, user_id: int, amount: int = 1, subscription_tier: Optional[str] = None) -> Optional[date]:
+        """Reserve `amount` audits against today's limit before running them.
+
+        Returns the day they were reserved on, which the save or failure of
+        the audits releases, or None if they do not fit. The check and the
+        reservation are one statement, so concurrent requests cannot both
+        pass on the same remaining quota. Commits the reservation.
+        """
+        subscription_tier = self._subscription_tier(user_id, subscription_tier)
+        if subscription_tier is None:
+            return None
+
+        day = datetime.utcnow().date()
+        try:
+            reserved = UsageCounter.reserve(user_id, day, amount, self.daily_limit(subscription_tier))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return day if reserved else None
+
+    def release(self, user_id: int, amount: int, day: date):
+        """Give back reserved audits that were not saved; commits."""
+        if amount <= 0:
+            return
+        try:
+            UsageCounter.release(user_id, day, amount)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def get_usage(self, user_id: int, subscription_tier: Optional[str] = None) -> dict:
         """Get current usage statistics for user."""
-        today = datetime.utcnow().date()
-        user = User.query.get(user_id)
-        
-        if not user:
+        subscription_tier = self._subscription_tier(user_id, subscription_tier)
+        if subscription_tier is None:
             return {'error': 'User not found'}
-        
-        # Get daily limit based on subscription tier
-        if user.subscription_tier == 'free':
-            daily_limit = current_app.config['FREE_TIER_DAILY_LIMIT']
-        else:
-            daily_limit = current_app.config['PREMIUM_TIER_DAILY_LIMIT']
-        
-        # Count today's audits
-        today_audits = EmailAudit.query.filter(
-            EmailAudit.user_id == user_id,
-            db.func.date(EmailAudit.created_at) == today
-        ).count()
-        
+
+        daily_limit = self.daily_limit(subscription_tier)
+        today_audits = UsageCounter.get_count(user_id, datetime.utcnow().date())
+
         return {
             'today_usage': today_audits,
             'daily_limit': daily_limit,
             'remaining': max(0, daily_limit - today_audits),
-            'subscription_tier': user.subscription_tier
-        } 
\ No newline at end of file
+            'subscription_tier': subscription_tier,
+            'reset_at': self.reset_time().isoformat()
+        }
@@ -1,14 +1,16 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash, current_app
+from flask import render_template, request, jsonify, redirect, url_for, flash, current_app, Response, session
 from flask_login import login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta
 import secrets
 import json
-from sqlalchemy import text
 from . import web_bp
-from ..models import User, OTPCode, EmailAudit
+from ..models import User, EmailAudit, OutboxMessage
 from ..models.database import db
 from ..services.email_service import EmailService
 from ..services.audit_service import AuditService
+from ..services.health import get_health_monitor, check_readiness
+from ..services.otp_store import get_otp_store, VERIFIED, LOCKED
+from ..utils.metrics import registry as metrics_registry
 
 @web_bp.route('/')
 def index():
@@ -56,7 +58,9 @@ def register():
         success = email_service.send_otp(user)
         
         if success:
-            return jsonify({'message': 'OTP sent successfully', 'user_id': user.id})
+            # Whose OTP this browser is waiting for, to look up its delivery
+            session['otp_user_id'] = user.id
+            return jsonify({'message': 'OTP sent successfully', 'user_id': user.id, 'delivery_id': email_service.delivery_id})
         else:
             return jsonify({'error': 'Failed to send OTP'}), 500
     
@@ -73,26 +77,32 @@ def verify_otp():
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    otp = OTPCode.query.filter_by(
-        user_id=user_id,
-        code=otp_code,
-        is_used=False
-    ).filter(OTPCode.expires_at > datetime.utcnow()).first()
-    
-    if not otp:
+    # One keyed lookup; a correct code is consumed by the check
+    result = get_otp_store().verify(user.id, str(otp_code or ''))
+    if result == LOCKED:
+        return jsonify({'error': 'Too many incorrect attempts. Please request a new OTP.'}), 429
+    if result != VERIFIED:
         return jsonify({'error': 'Invalid or expired OTP'}), 400
     
-    # Mark OTP as used
-    otp.is_used = True
     user.is_verified = True
     db.session.commit()
     
     # Log user in
+    session.pop('otp_user_id', None)
     login_user(user)
     
     flash('Login successful! Welcome back.', 'success')
     return jsonify({'message': 'OTP verified successfully'})
 
+@web_bp.route('/otp/delivery/<delivery_id>')
+def otp_delivery_status(delivery_id):
+    """Delivery status of a queued OTP email, for the session that requested it."""
+    user_id = session.get('otp_user_id')
+    message = OutboxMessage.query.filter_by(id=delivery_id, user_id=user_id).first() if user_id else None
+    if not message:
+        return jsonify({'error': 'Delivery not found'}), 404
+    return jsonify(message.to_dict())
+
 @web_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login with OTP."""
@@ -120,7 +130,9 @@ def login():
         success = email_service.send_otp(user)
         
         if success:
-            return jsonify({'message': 'OTP sent successfully', 'user_id': user.id})
+            # Whose OTP this browser is waiting for, to look up its delivery
+            session['otp_user_id'] = user.id
+            return jsonify({'message': 'OTP sent successfully', 'user_id': user.id, 'delivery_id': email_service.delivery_id})
         else:
             return jsonify({'error': 'Failed to send OTP'}), 500
     
@@ -150,40 +162,44 @@ def ping():
     """Simple ping endpoint for basic connectivity testing."""
     return jsonify({'message': 'pong', 'timestamp': datetime.utcnow().isoformat()})
 
+@web_bp.route('/metrics')
+def metrics():
+    """Latency histograms of all workers in Prometheus text format."""
+    body = metrics_registry.render(metrics_registry.collect(current_app.config.get('METRICS_DIR')))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @web_bp.route('/health')
 def health_check():
-    """Health check endpoint for monitoring and deployment platforms."""
-    try:
-        # Check database connection
-        from ..models.database import db
-        db.session.execute(text('SELECT 1'))
-        
-        # Check if all required services are available
-        health_status = {
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '2.0.0',
-            'services': {
-                'database': 'connected',
-                'email_service': 'available',
-                'audit_service': 'available'
-            },
-            'uptime': 'running'
-        }
-        
-        return jsonify(health_status), 200
-        
-    except Exception as e:
-        health_status = {
-            'status': 'unhealthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '2.0.0',
-            'error': str(e),
-            'services': {
-                'database': 'error',
-                'email_service': 'unknown',
-                'audit_service': 'unknown'
-            }
-        }
-        
-        return jsonify(health_status), 503 
\ No newline at end of file
+    """Health check endpoint for monitoring and deployment platforms.
+    
+    Serves the worker's background health snapshot, so probes never touch the database.
+    """
+    snapshot = get_health_monitor(current_app._get_current_object()).snapshot()
+    healthy = snapshot['status'] == 'healthy'
+    health_status = {
+        'status': snapshot['status'],
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '2.0.0',
+        'checked_at': snapshot['checked_at'],
+        'age_seconds': snapshot['age_seconds'],
+        'services': {
+            'database': snapshot['database']['status'],
+            'email_service': 'available' if healthy else 'unknown',
+            'audit_service': 'available' if healthy else 'unknown'
+        },
+        'uptime': 'running'
+    }
+    if not healthy:
+        health_status['error'] = snapshot.get('error')
+    return jsonify(health_status), 200 if healthy else 503
+
+@web_bp.route('/health/live')
+def liveness_check():
+    """Liveness probe: the worker is up and serving requests. Checks nothing else."""
+    return jsonify({'status': 'alive', 'timestamp': datetime.utcnow().isoformat()})
+
+@web_bp.route('/health/ready')
+def readiness_check():
+    """Readiness probe: checks the database, migrations and rules now, bypassing the snapshot."""
+    readiness = check_readiness(current_app._get_current_object())
+    return jsonify(readiness), 200 if readiness['status'] == 'ready' else 503
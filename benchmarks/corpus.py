@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Synthetic email corpus for the benchmarks.
+
+Generates plain-text, HTML-only, multipart-with-attachments and
+long-thread messages. The same seed and size always give the same bytes,
+so benchmark runs on different machines or commits measure the same input.
+
+Usage: python benchmarks/corpus.py [--size small|medium|large] [--seed N] --out DIR
+"""
+
+import argparse
+import os
+import random
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+# Words per message body, thread length and attachment size for each corpus size
+SIZES = {
+    'small': {'words': 80, 'thread_messages': 5, 'attachments': 1, 'attachment_kb': 16},
+    'medium': {'words': 400, 'thread_messages': 20, 'attachments': 2, 'attachment_kb': 128},
+    'large': {'words': 2000, 'thread_messages': 60, 'attachments': 4, 'attachment_kb': 1024},
+}
+
+# Mixes ordinary prose with words the greeting and grammar rules look for
+VOCABULARY = (
+    'the project team update schedule review please could you would we our deadline report '
+    'meeting budget delivery progress timeline customer request integration feature release '
+    'your you\'re their there its it\'s affect effect lose loose cant dont wont im ive '
+    'urgent ASAP thanks regards appreciate issue resolve confirm attached document'
+).split()
+GREETINGS = ['Hello', 'Hi', 'Dear', 'Good morning', 'Greetings']
+START = datetime(2024, 1, 15, 9, 0, tzinfo=timezone.utc)
+
+def _paragraphs(rng: random.Random, words: int) -> str:
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        sentences = []
+        for _ in range(rng.randint(2, 5)):
+            length = min(remaining, rng.randint(6, 20))
+            if length <= 0:
+                break
+            remaining -= length
+            sentence = ' '.join(rng.choice(VOCABULARY) for _ in range(length))
+            sentences.append(sentence[0].upper() + sentence[1:] + rng.choice('...!?'))
+        paragraphs.append(' '.join(sentences))
+    return '\n\n'.join(paragraphs)
+
+def _body(rng: random.Random, words: int, recipient: str) -> str:
+    return f"{rng.choice(GREETINGS)} {recipient},\n\n{_paragraphs(rng, words)}\n\nBest regards,\nAlice\n"
+
+def _message(rng: random.Random, index: int) -> EmailMessage:
+    message = EmailMessage()
+    message['From'] = 'alice.manager@example.com'
+    message['To'] = 'bob.employee@example.com'
+    message['Subject'] = f'Project update {index}'
+    message['Date'] = format_datetime(START + timedelta(hours=index))
+    message['Message-ID'] = f'<{rng.getrandbits(64):016x}@example.com>'
+    return message
+
+def plain_email(rng: random.Random, words: int) -> bytes:
+    message = _message(rng, 0)
+    message.set_content(_body(rng, words, 'Bob'))
+    return message.as_bytes(policy=SMTP)
+
+def html_email(rng: random.Random, words: int) -> bytes:
+    """Newsletter-style HTML with inline CSS, layout tables and a tracking pixel."""
+    paragraphs = _body(rng, words, 'Bob').split('\n\n')
+    cells = ''.join(
+        f'<tr><td style="padding:12px;font-family:Arial;color:#333"><p>{paragraph}</p></td></tr>'
+        for paragraph in paragraphs
+    )
+    html = (
+        '<html><head><style>' + 'td{font-size:14px} a{color:#06c} ' * 20 + '</style></head>'
+        f'<body><table width="100%">{cells}</table>'
+        '<img src="https://t.example.com/open.gif" width="1" height="1"></body></html>'
+    )
+    message = _message(rng, 0)
+    message.set_content(html, subtype='html')
+    return message.as_bytes(policy=SMTP)
+
+def multipart_email(rng: random.Random, words: int, attachments: int, attachment_kb: int) -> bytes:
+    message = _message(rng, 0)
+    body = _body(rng, words, 'Bob')
+    message.set_content(body)
+    message.add_alternative(''.join(f'<p>{p}</p>' for p in body.split('\n\n')), subtype='html')
+    for i in range(attachments):
+        data = rng.randbytes(attachment_kb * 1024)
+        maintype, subtype = ('image', 'png') if i % 2 == 0 else ('application', 'pdf')
+        message.add_attachment(data, maintype=maintype, subtype=subtype, filename=f'attachment_{i}.{subtype}')
+    # The email package picks random MIME boundaries; pin them to the seed
+    for part in message.walk():
+        if part.is_multipart():
+            part.set_boundary(f'=_{rng.getrandbits(64):016x}')
+    return message.as_bytes(policy=SMTP)
+
+def thread_email(rng: random.Random, messages: int, words: int) -> bytes:
+    """A back-and-forth thread in the concatenated .eml layout; each reply quotes the previous message."""
+    parts: List[bytes] = []
+    previous = ''
+    for i in range(messages):
+        message = _message(rng, i)
+        if i % 2:
+            message.replace_header('From', 'bob.employee@example.com')
+            message.replace_header('To', 'alice.manager@example.com')
+            message.replace_header('Subject', f'RE: Project update {i - 1}')
+        own = _body(rng, words, 'Alice' if i % 2 else 'Bob')
+        body = own
+        if previous:
+            quoted = '\n'.join(f'> {line}' if line else '>' for line in previous.splitlines())
+            body += f"\nOn {format_datetime(START + timedelta(hours=i - 1))} someone wrote:\n{quoted}\n"
+        message.set_content(body)
+        parts.append(message.as_bytes(policy=SMTP).replace(b'\r\n', b'\n'))
+        previous = own
+    return b'\n'.join(parts)
+
+def build_corpus(size: str = 'medium', seed: int = 1234) -> Dict[str, bytes]:
+    """The benchmark corpus as {name: raw message}."""
+    params = SIZES[size]
+    rng = random.Random(seed)
+    return {
+        'plain': plain_email(rng, params['words']),
+        'html': html_email(rng, params['words']),
+        'multipart': multipart_email(rng, params['words'], params['attachments'], params['attachment_kb']),
+        'thread': thread_email(rng, params['thread_messages'], params['words'] // 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--out', required=True, help='Directory to write the .eml files to')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, raw in build_corpus(args.size, args.seed).items():
+        path = os.path.join(args.out, f'{name}_{args.size}.eml')
+        with open(path, 'wb') as f:
+            f.write(raw)
+        print(f"{path}: {len(raw)} bytes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Compare HTML-to-text extraction: the stdlib streaming extractor used by
+EmailParser against the BeautifulSoup tree it replaced.
+
+Usage: python benchmarks/html_to_text.py [--rows N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from app.services.html_text import html_to_text
+
+def marketing_html(rows: int) -> str:
+    """Table-heavy newsletter markup with inline CSS and tracking pixels."""
+    row = (
+        '<tr><td style="padding:12px;font-family:Arial,sans-serif;color:#333333">'
+        '<table width="100%" cellpadding="0" cellspacing="0"><tr>'
+        '<td><img src="https://t.example.com/px/{i}.gif" width="1" height="1" alt=""></td>'
+        '<td><h2 style="margin:0">Offer {i}</h2><p>Dear customer, save {i}% on your next order.'
+        '<br>Use code SAVE{i} at checkout &amp; enjoy free shipping.</p>'
+        '<a href="https://example.com/o/{i}" style="color:#0066cc">Shop now</a></td>'
+        '</tr></table></td></tr>'
+    )
+    return (
+        '<html><head><title>Newsletter</title><style>'
+        + 'td{font-size:14px} .btn{background:#0066cc} ' * 50
+        + '</style><script>var tracking = {};</script></head><body><table>'
+        + ''.join(row.format(i=i) for i in range(rows))
+        + '</table></body></html>'
+    )
+
+def beautifulsoup_text(html: str) -> str:
+    return BeautifulSoup(html, 'html.parser').get_text()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'bytes':>10} {'beautifulsoup ms':>17} {'html_to_text ms':>16} {'speedup':>8}")
+    for rows in args.rows:
+        html = marketing_html(rows)
+        number = max(1, 1000 // rows)
+        soup_ms = min(timeit.repeat(lambda: beautifulsoup_text(html), number=number, repeat=args.repeat)) / number * 1000
+        fast_ms = min(timeit.repeat(lambda: html_to_text(html), number=number, repeat=args.repeat)) / number * 1000
+        print(f"{rows:>6} {len(html):>10} {soup_ms:>17.2f} {fast_ms:>16.2f} {soup_ms / fast_ms:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for EmailAuditor.
+
+Runs micro-benchmarks of EmailParser, each rule function, the rules engine,
+AuditReport and the vectorized batch scorer on the synthetic corpus, plus end-to-end POST /api/audit
+requests through the Flask test client against a SQLite database. Results
+are written as JSON; pass --compare with an earlier result file to flag
+regressions (exit status 1).
+
+Usage:
+    python benchmarks/run.py [--size medium] [--only parser,rules] --out results.json
+    python benchmarks/run.py --out new.json --compare baseline.json [--threshold 0.10]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config class attributes are read when `config` is first imported, by whichever
+# group imports `app` first, so the e2e settings must be in place before that
+DATABASE_DIR = tempfile.mkdtemp(prefix='email-auditor-bench-')
+DATABASE_PATH = os.path.join(DATABASE_DIR, 'benchmark.db')
+os.environ['FLASK_ENV'] = 'testing'
+os.environ['TEST_DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['AUDIT_CACHE_PERSIST'] = 'false'
+os.environ.setdefault('AUDIT_POOL_WORKERS', '1')
+
+from corpus import SIZES, build_corpus
+
+GROUPS = ('parser', 'rules', 'report', 'scoring', 'e2e')
+
+def measure(func: Callable[[], Any], repeat: int, min_round_time: float) -> Dict[str, Any]:
+    """Per-call timings over `repeat` rounds, each long enough to time reliably."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_round_time:
+        number *= 2
+    rounds = [t / number * 1000 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_ms': round(min(rounds), 4),
+        'median_ms': round(statistics.median(rounds), 4),
+        'mean_ms': round(statistics.mean(rounds), 4),
+        'stdev_ms': round(statistics.stdev(rounds), 4) if len(rounds) > 1 else 0.0,
+        'ops_per_sec': round(1000 / statistics.median(rounds), 2),
+    }
+
+def parser_benchmarks(corpus: Dict[str, bytes]) -> Dict[str, Callable[[], Any]]:
+    from app.services.email_parser import EmailParser
+
+    benchmarks = {}
+    for name, raw in corpus.items():
+        benchmarks[f'parser.get_content.{name}'] = lambda raw=raw: EmailParser(raw).get_content()
+    benchmarks['parser.get_thread_summary.thread'] = lambda: EmailParser(corpus['thread']).get_thread_summary()
+    return benchmarks
+
+def _texts(corpus: Dict[str, bytes]) -> Dict[str, str]:
+    from app.services.email_parser import EmailParser
+    return {name: EmailParser(raw).get_content()['text'] for name, raw in corpus.items() if name != 'multipart'}
+
+def rules_benchmarks(corpus: Dict[str, bytes]) -> Dict[str, Callable[[], Any]]:
+    from app.services import rules_impl
+    from app.services.rules_engine import RulesEngine
+
+    engine = RulesEngine(os.path.join(ROOT, 'app', 'rules.json'))
+    benchmarks = {}
+    for name, text in _texts(corpus).items():
+        for rule in engine.rules:
+            func = getattr(rules_impl, rule['function'])
+            benchmarks[f"rules.{rule['function']}.{name}"] = lambda func=func, text=text: func(text)
+        benchmarks[f'rules.engine.{name}'] = lambda text=text: engine.evaluate(text)
+    return benchmarks
+
+def report_benchmarks(corpus: Dict[str, bytes]) -> Dict[str, Callable[[], Any]]:
+    from app.services.audit_report import AuditReport
+    from app.services.rules_engine import RulesEngine
+
+    engine = RulesEngine(os.path.join(ROOT, 'app', 'rules.json'))
+    benchmarks = {}
+    for name, text in _texts(corpus).items():
+        results = engine.evaluate(text)
+        benchmarks[f'report.to_dict.{name}'] = lambda results=results: AuditReport(results).to_dict()
+    return benchmarks
+
+def scoring_benchmarks(corpus: Dict[str, bytes], batch_size: int = 1000) -> Dict[str, Callable[[], Any]]:
+    """A batch of stored texts scored by the scalar rules, and re-scored from extracted features."""
+    from app.services import rules_impl
+    from app.services.batch_scoring import SCORED_FUNCTIONS, BatchScores, extract_features
+
+    texts = list(_texts(corpus).values())
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    funcs = [getattr(rules_impl, name) for name in SCORED_FUNCTIONS]
+    features = extract_features(batch)
+    return {
+        f'scoring.scalar.{batch_size}': lambda: [[func(text) for func in funcs] for text in batch],
+        f'scoring.extract.{batch_size}': lambda: extract_features(batch),
+        f'scoring.rescore.{batch_size}': lambda: BatchScores(features, {'max_word_count': 300}),
+    }
+
+def e2e_benchmarks(corpus: Dict[str, bytes]) -> Dict[str, Callable[[], Any]]:
+    """POST /api/audit for each corpus message, with the audit cache cold and warm."""
+    import logging
+    from io import BytesIO
+    from app import create_app
+    from app.models import User
+    from app.models.database import db
+    from app.services.audit_cache import get_audit_cache
+
+    app = create_app()
+    app.logger.setLevel(logging.WARNING)
+    app.config['PREMIUM_TIER_DAILY_LIMIT'] = 10 ** 9
+    with app.app_context():
+        # Cold runs are only cold without the persistent tier, on the file database set up above
+        assert db.engine.url.database == DATABASE_PATH, f"benchmarking against {db.engine.url}"
+        assert not get_audit_cache().persist, "AUDIT_CACHE_PERSIST must be off for cold runs"
+        db.create_all()
+        user = User(email='benchmark@example.com', subscription_tier='premium')
+        db.session.add(user)
+        db.session.commit()
+        api_key = user.api_key
+    client = app.test_client()
+
+    def post(raw: bytes, mode: str, cold: bool):
+        cache = get_audit_cache()
+        if cold:
+            cache.clear()
+            hits = cache.stats()['hits']
+        response = client.post(
+            f'/api/audit?mode={mode}',
+            headers={'X-API-Key': api_key},
+            data={'file': (BytesIO(raw), 'benchmark.eml')},
+            content_type='multipart/form-data'
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/audit returned {response.status_code}: {response.get_data(as_text=True)}")
+        if cold and cache.stats()['hits'] != hits:
+            raise RuntimeError("A cold /api/audit run was served from the audit cache")
+
+    benchmarks = {}
+    for name, raw in corpus.items():
+        benchmarks[f'e2e.audit.{name}'] = lambda raw=raw: post(raw, 'message', cold=True)
+        benchmarks[f'e2e.audit_cached.{name}'] = lambda raw=raw: post(raw, 'message', cold=False)
+    benchmarks['e2e.audit_thread.thread'] = lambda: post(corpus['thread'], 'thread', cold=True)
+    return benchmarks
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the change of every benchmark present in both runs and return the regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<44} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<44} {previous['median_ms']:>12.3f} {current['median_ms']:>12.3f} {change:>+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--only', help=f"Comma-separated groups to run ({', '.join(GROUPS)})")
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds per timing round')
+    parser.add_argument('--out', required=True, help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Median slowdown that counts as a regression (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    groups = args.only.split(',') if args.only else list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))}")
+
+    corpus = build_corpus(args.size, args.seed)
+    benchmarks: Dict[str, Callable[[], Any]] = {}
+    try:
+        if 'parser' in groups:
+            benchmarks.update(parser_benchmarks(corpus))
+        if 'rules' in groups:
+            benchmarks.update(rules_benchmarks(corpus))
+        if 'report' in groups:
+            benchmarks.update(report_benchmarks(corpus))
+        if 'scoring' in groups:
+            benchmarks.update(scoring_benchmarks(corpus))
+        if 'e2e' in groups:
+            benchmarks.update(e2e_benchmarks(corpus))
+
+        results = {
+            'meta': {
+                'timestamp': datetime.utcnow().isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'size': args.size,
+                'seed': args.seed,
+                'corpus_bytes': {name: len(raw) for name, raw in corpus.items()},
+            },
+            'results': {}
+        }
+        for name, func in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            results['results'][name] = measure(func, args.repeat, args.min_time)
+            timing = results['results'][name]
+            print(f"{name:<44} {timing['median_ms']:>10.3f} ms  ({timing['ops_per_sec']} ops/s)")
+    finally:
+        shutil.rmtree(DATABASE_DIR, ignore_errors=True)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('size') != args.size or baseline['meta'].get('seed') != args.seed:
+            print("Warning: baseline was run on a different corpus size or seed")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
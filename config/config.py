@@ -19,6 +19,26 @@ class Config:
     SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
     SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
+    SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))  # seconds
+    SMTP_POOL_IDLE_TIMEOUT = float(os.environ.get('SMTP_POOL_IDLE_TIMEOUT', 60))  # seconds a pooled connection may sit unused
+    
+    # Email Outbox
+    OUTBOX_SENDER = os.environ.get('OUTBOX_SENDER', 'true').lower() == 'true'  # false leaves delivery to `manage_db.py outbox`
+    OUTBOX_SENDER_THREADS = int(os.environ.get('OUTBOX_SENDER_THREADS', 2))  # also the SMTP connection pool size
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 5))  # seconds
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_RETRY_BASE_DELAY = float(os.environ.get('OUTBOX_RETRY_BASE_DELAY', 2))  # seconds, doubled per failed attempt
+    OUTBOX_RETRY_MAX_DELAY = float(os.environ.get('OUTBOX_RETRY_MAX_DELAY', 300))  # seconds
+    OUTBOX_CLAIM_TIMEOUT = float(os.environ.get('OUTBOX_CLAIM_TIMEOUT', 120))  # seconds before a stuck send is retried
+    OUTBOX_RETENTION = float(os.environ.get('OUTBOX_RETENTION', 7 * 86400))  # seconds finished messages are kept
+    OUTBOX_PURGE_INTERVAL = float(os.environ.get('OUTBOX_PURGE_INTERVAL', 3600))  # seconds between purges of finished messages
+    
+    # One-Time Codes
+    OTP_STORE_BACKEND = os.environ.get('OTP_STORE_BACKEND', 'sql')  # sql, redis (falls back to sql) or memory (single process only)
+    OTP_REDIS_URL = os.environ.get('OTP_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    OTP_TTL = int(os.environ.get('OTP_TTL', 600))  # seconds
+    OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))  # wrong guesses before a code is discarded
+    OTP_SWEEP_INTERVAL = float(os.environ.get('OTP_SWEEP_INTERVAL', 300))  # seconds between expired-code sweeps
     
     # Rate Limiting
     FREE_TIER_DAILY_LIMIT = int(os.environ.get('FREE_TIER_DAILY_LIMIT', 5))
@@ -29,6 +49,40 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     ALLOWED_EXTENSIONS = {'eml'}
     
+    # Batch Auditing
+    BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+    AUDIT_POOL_WORKERS = int(os.environ.get('AUDIT_POOL_WORKERS', os.cpu_count() or 1))
+    AUDIT_POOL_MIN_BATCH = int(os.environ.get('AUDIT_POOL_MIN_BATCH', 8))
+    AUDIT_BATCH_WINDOW = int(os.environ.get('AUDIT_BATCH_WINDOW', 64))  # messages held in memory at once
+    
+    # Audit Result Cache
+    AUDIT_CACHE_SIZE = int(os.environ.get('AUDIT_CACHE_SIZE', 1024))
+    AUDIT_CACHE_TTL = int(os.environ.get('AUDIT_CACHE_TTL', 3600))  # seconds, in-process tier
+    AUDIT_CACHE_DB_TTL = int(os.environ.get('AUDIT_CACHE_DB_TTL', 30 * 86400))  # seconds, table tier
+    AUDIT_CACHE_PERSIST = os.environ.get('AUDIT_CACHE_PERSIST', 'true').lower() == 'true'
+    AUDIT_CACHE_SWEEP_INTERVAL = float(os.environ.get('AUDIT_CACHE_SWEEP_INTERVAL', 3600))  # seconds between deletes of expired rows
+    
+    # Audit History
+    AUDIT_PAGE_MAX_SIZE = int(os.environ.get('AUDIT_PAGE_MAX_SIZE', 100))
+    
+    # Asynchronous Audits
+    AUDIT_QUEUE_BACKEND = os.environ.get('AUDIT_QUEUE_BACKEND', 'inprocess')  # inprocess, database or celery
+    AUDIT_QUEUE_THREADS = int(os.environ.get('AUDIT_QUEUE_THREADS', 2))
+    AUDIT_JOB_TIMEOUT = float(os.environ.get('AUDIT_JOB_TIMEOUT', 600))  # seconds without a heartbeat before a running job is failed as lost
+    AUDIT_JOB_HEARTBEAT_INTERVAL = float(os.environ.get('AUDIT_JOB_HEARTBEAT_INTERVAL', 30))  # seconds between heartbeats of a running job
+    AUDIT_JOB_SWEEP_INTERVAL = float(os.environ.get('AUDIT_JOB_SWEEP_INTERVAL', 60))  # seconds between recovery passes (inprocess)
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Metrics
+    METRICS_DIR = os.environ.get('METRICS_DIR')  # shared by all workers; empty means this process only
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # seconds
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() == 'true'
+    
+    # Health Checks
+    HEALTH_REFRESH_INTERVAL = float(os.environ.get('HEALTH_REFRESH_INTERVAL', 5))  # seconds
+    HEALTH_STALE_AFTER = float(os.environ.get('HEALTH_STALE_AFTER', 30))  # seconds before a snapshot counts as unhealthy
+    HEALTH_AUDIT_DAYS = int(os.environ.get('HEALTH_AUDIT_DAYS', 30))  # days of audits summed into the snapshot
+    
     # Security
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'false').lower() == 'true'
     SESSION_COOKIE_HTTPONLY = True
@@ -40,6 +94,9 @@ class Config:
     
     # API Settings
     API_RATE_LIMIT = os.environ.get('API_RATE_LIMIT', '100 per minute')
+    API_KEY_CACHE_SIZE = int(os.environ.get('API_KEY_CACHE_SIZE', 4096))
+    API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', 60))  # seconds
+    API_KEY_CACHE_STAMP = os.environ.get('API_KEY_CACHE_STAMP')  # shared by all workers on a host
     
     @staticmethod
     def init_app(app):
@@ -96,7 +153,7 @@ class TestingConfig(Config):
     DEBUG = True
     
     # Testing-specific settings
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
     WTF_CSRF_ENABLED = False
 
 config = {
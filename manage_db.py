@@ -12,7 +12,7 @@ from app.models import User, OTPCode
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python manage_db.py [init|reset|check|create-admin]")
+        print("Usage: python manage_db.py [init|reset|check|create-admin|worker|outbox|migrate|explain|rescore|reaudit|rollups]")
         sys.exit(1)
     
     command = sys.argv[1]
@@ -53,7 +53,7 @@ def main():
                     
                 if 'otp_codes' in tables:
                     otp_count = OTPCode.query.count()
-                    print(f"OTP codes in database: {otp_count}")
+                    print(f"Live OTP codes in database: {otp_count}")
                     
             except Exception as e:
                 print(f"Error checking database: {e}")
@@ -91,9 +91,166 @@ def main():
                 db.session.rollback()
                 sys.exit(1)
                 
+        elif command == "worker":
+            from app.services.job_queue import run_worker
+            once = '--once' in sys.argv
+            print("Processing queued audit jobs..." if once else "Processing queued audit jobs (Ctrl+C to stop)...")
+            try:
+                run_worker(app, poll_interval=1.0, once=once)
+            except KeyboardInterrupt:
+                print("Worker stopped.")
+                
+        elif command == "outbox":
+            from app.services.outbox import run_sender, purge_finished_messages
+            if sys.argv[2:3] == ['purge']:
+                retention = app.config.get('OUTBOX_RETENTION', 604800.0)
+                removed = purge_finished_messages(retention)
+                print(f"Deleted {removed} finished messages older than {retention / 86400:g} days.")
+            else:
+                once = '--once' in sys.argv
+                print("Sending queued emails..." if once else "Sending queued emails (Ctrl+C to stop)...")
+                try:
+                    run_sender(app, poll_interval=1.0, once=once)
+                except KeyboardInterrupt:
+                    print("Sender stopped.")
+                
+        elif command == "migrate":
+            from app.models.migrations import MIGRATIONS, applied_migrations, run_migrations
+            if '--list' in sys.argv:
+                applied = applied_migrations()
+                for migration_id, description, _ in MIGRATIONS:
+                    status = "applied" if migration_id in applied else "pending"
+                    print(f"[{status:>7}] {migration_id}: {description}")
+            else:
+                print("Applying pending migrations...")
+                try:
+                    done = run_migrations(app)
+                except Exception as e:
+                    print(f"Migration failed: {e}")
+                    db.session.rollback()
+                    sys.exit(1)
+                for migration_id in done:
+                    print(f"Applied {migration_id}")
+                print("Database schema is up to date!" if done else "No pending migrations.")
+                
+        elif command == "explain":
+            from app.models.migrations import hot_queries, explain
+            print(f"Query plans ({db.engine.dialect.name}):")
+            for name, statement in hot_queries():
+                print(f"\n-- {name}")
+                print(statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True}))
+                for line in explain(statement):
+                    print(f"   {line}")
+                
+        elif command == "rescore":
+            from app.services.batch_scoring import (
+                DEFAULT_THRESHOLDS, SCORED_FUNCTIONS, BatchScores,
+                extract_features, concat_features, save_features, load_features
+            )
+            from app.services.batch_audit import decompress_text
+            from app.models import EmailAudit
+            from sqlalchemy import func
+            import numpy as np
+            args = sys.argv[2:]
+            features_path = args[args.index('--features') + 1] if '--features' in args else None
+            workers = int(args[args.index('--workers') + 1]) if '--workers' in args else app.config.get('AUDIT_POOL_WORKERS', 1)
+            thresholds = {}
+            for arg in args:
+                if '=' in arg:
+                    name, value = arg.split('=', 1)
+                    thresholds[name] = float(value) if '.' in value else int(value)
+            unknown = set(thresholds) - set(DEFAULT_THRESHOLDS)
+            if unknown:
+                print(f"Unknown thresholds: {', '.join(sorted(unknown))}")
+                print(f"Available thresholds: {', '.join(DEFAULT_THRESHOLDS)}")
+                sys.exit(1)
+            
+            if features_path and os.path.exists(features_path):
+                features = load_features(features_path)
+                print(f"Loaded features of {len(features['ids'])} audits from {features_path}")
+            else:
+                # Stream stored audits in id order so memory holds one chunk of text at a time.
+                # Score the full stored text: email_content is a 500-character preview.
+                parts, ids, last_id = [], [], 0
+                while True:
+                    rows = (db.session.query(EmailAudit.id, EmailAudit.source_text)
+                            .filter(EmailAudit.id > last_id, EmailAudit.source_text.isnot(None))
+                            .order_by(EmailAudit.id).limit(5000).all())
+                    if not rows:
+                        break
+                    parts.append(extract_features((decompress_text(text) for _, text in rows), max_workers=workers))
+                    ids.extend(audit_id for audit_id, _ in rows)
+                    last_id = rows[-1][0]
+                    print(f"Extracted features of {len(ids)} audits...")
+                skipped = db.session.query(func.count(EmailAudit.id)).filter(EmailAudit.source_text.is_(None)).scalar()
+                if skipped:
+                    print(f"Skipped {skipped} audits without stored text (thread audits and audits from before migration 0005).")
+                features = concat_features(parts)
+                features['ids'] = np.array(ids, dtype=np.int64)
+                if features_path:
+                    save_features(features_path, features)
+                    print(f"Saved features to {features_path}")
+            
+            count = len(features['ids'])
+            if not count:
+                print("No audits to rescore.")
+                sys.exit(0)
+            baseline = BatchScores(features)
+            tuned = BatchScores(features, thresholds)
+            print(f"\nRescored {count} audits with {thresholds or 'the default thresholds'}")
+            print(f"{'rule':<16} {'pass rate':>10} {'tuned':>8} {'mean score':>11} {'tuned':>8}")
+            for name in SCORED_FUNCTIONS:
+                print(f"{name:<16} {baseline.passed[name].mean():>10.1%} {tuned.passed[name].mean():>8.1%} "
+                      f"{baseline.scores[name].mean():>11.2f} {tuned.scores[name].mean():>8.2f}")
+            changed = int(np.count_nonzero(baseline.overall() != tuned.overall()))
+            print(f"Report scores changed: {changed} of {count} ({changed / count:.1%})")
+                
+        elif command == "reaudit":
+            from app.services.reaudit import reaudit
+            args = sys.argv[2:]
+            
+            def option(name, default, cast):
+                return cast(args[args.index(name) + 1]) if name in args else default
+            
+            def progress(state):
+                rate = state['updated'] / state['seconds'] if state['seconds'] else 0.0
+                print(f"Re-audited {state['updated']} audits ({rate:.1f}/s), "
+                      f"{state['failed']} failed, up to id {state['last_id']}")
+            
+            checkpoint = option('--checkpoint', 'reaudit.checkpoint.json', str)
+            print("Re-auditing audits evaluated under older rules (Ctrl+C to pause)...")
+            try:
+                state = reaudit(
+                    app,
+                    chunk_size=option('--chunk', 500, int),
+                    max_workers=option('--workers', app.config.get('AUDIT_POOL_WORKERS', 1), int),
+                    checkpoint_path=checkpoint,
+                    restart='--restart' in args,
+                    pause=option('--pause', 0.0, float),
+                    on_chunk=progress
+                )
+            except KeyboardInterrupt:
+                print(f"Interrupted; run the same command again to resume from {checkpoint}.")
+                sys.exit(1)
+            if state['resumed']:
+                print("Resumed from the checkpoint of an earlier run.")
+            rate = state['updated'] / state['seconds'] if state['seconds'] else 0.0
+            print(f"Done: {state['updated']} re-audited, {state['failed']} failed, "
+                  f"{state['skipped']} without stored text skipped, {state['seconds']:.1f}s ({rate:.1f} audits/s)")
+                
+        elif command == "rollups":
+            from app.services.rollups import rebuild_rollups
+            print("Rebuilding usage and rule rollups from stored audits...")
+            try:
+                counts = rebuild_rollups()
+            except Exception as e:
+                print(f"Rebuild failed: {e}")
+                sys.exit(1)
+            print(f"Rebuilt {counts['usage_counters']} daily usage rows and {counts['rule_daily_stats']} daily rule rows.")
+                
         else:
             print(f"Unknown command: {command}")
-            print("Available commands: init, reset, check, create-admin")
+            print("Available commands: init, reset, check, create-admin, worker, outbox, migrate, explain, rescore, reaudit, rollups")
             sys.exit(1)
 
 if __name__ == "__main__":
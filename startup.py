@@ -73,6 +73,23 @@ def ensure_database_ready():
         print(f"Error checking database: {e}")
         return False
 
+def apply_migrations():
+    """Bring an existing database up to the current schema before workers start."""
+    print("🔧 Applying pending migrations...")
+    try:
+        from app import create_app
+        from app.models.migrations import run_migrations
+        app = create_app()
+        with app.app_context():
+            done = run_migrations(app)
+        for migration_id in done:
+            print(f"Applied {migration_id}")
+        print("Database schema is up to date!" if done else "No pending migrations.")
+        return True
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        return False
+
 def main():
     """Main startup function."""
     print("Email Auditor Startup Script")
@@ -86,6 +103,11 @@ def main():
         print("Database initialization failed, exiting...")
         sys.exit(1)
     
+    # Once, here, rather than racing in every worker
+    if not apply_migrations():
+        print("Database migration failed, exiting...")
+        sys.exit(1)
+    
     print("Database is ready!")
     print("Starting Email Auditor application with Gunicorn...")
     print("=" * 40)
@@ -93,6 +115,14 @@ def main():
     # Start gunicorn server
     import subprocess
     import sys
+    import shutil
+    import tempfile
+    
+    # Workers merge their latency histograms through this directory; start
+    # every deployment with empty histograms
+    metrics_dir = os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'email_auditor_metrics'))
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
     
     # Gunicorn command
     cmd = [
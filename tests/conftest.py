@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# Before the app (and config) are imported: a file database, shared by the sender threads
+os.environ['FLASK_ENV'] = 'testing'
+os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+import pytest
+from app import create_app
+from app.models.database import db
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config.update(OUTBOX_SENDER=False)
+    return app
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
@@ -0,0 +1,197 @@
+import email
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import OutboxMessage
+from app.models.database import db
+from app.services.outbox import (
+    claim_next_message, deliver_due_messages, deliver_message, enqueue_email, purge_finished_messages,
+    smtp_pool_from_config
+)
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+class SinkHandler:
+    """Collects messages; answers with queued reply codes instead while there are any."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+        self.replies = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append((envelope.rcpt_tos, email.message_from_bytes(envelope.content)))
+        return '250 OK'
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def sink():
+    handler = SinkHandler()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+@pytest.fixture
+def config(app, sink):
+    saved = dict(app.config)
+    app.config.update(
+        SMTP_SERVER=sink.hostname, SMTP_PORT=sink.port, SMTP_USE_TLS=False, SMTP_USERNAME='', SMTP_PASSWORD='',
+        OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE_DELAY=10.0, OUTBOX_RETRY_MAX_DELAY=60.0, OUTBOX_CLAIM_TIMEOUT=120.0
+    )
+    yield app.config
+    app.config.clear()
+    app.config.update(saved)
+
+@pytest.fixture
+def pool(config):
+    pool = smtp_pool_from_config(config)
+    yield pool
+    pool.close()
+
+@pytest.fixture(autouse=True)
+def empty_outbox(app_context):
+    OutboxMessage.query.delete()
+    db.session.commit()
+
+def _reload(message_id):
+    db.session.expire_all()
+    return db.session.get(OutboxMessage, message_id)
+
+def test_claim_takes_each_due_message_once(config):
+    message = enqueue_email('a@example.com', 'Subject', 'Body')
+    assert claim_next_message() == message.id
+    assert claim_next_message() is None
+    claimed = _reload(message.id)
+    assert claimed.status == OutboxMessage.SENDING
+    assert claimed.attempts == 1
+
+def test_body_is_encrypted_until_delivered(config, pool, sink):
+    message = enqueue_email('a@example.com', 'Your code', 'Your OTP code is: 123456')
+    assert '123456' not in _reload(message.id).body
+
+    assert deliver_due_messages(pool, config) == 1
+    delivered = _reload(message.id)
+    assert delivered.status == OutboxMessage.SENT
+    assert delivered.sent_at is not None
+    assert delivered.body is None
+
+    [(recipients, received)] = sink.handler.messages
+    assert recipients == ['a@example.com']
+    assert received['Subject'] == 'Your code'
+    assert 'Your OTP code is: 123456' in received.get_payload()[0].get_payload()
+
+def test_temporary_failure_is_retried_with_backoff(config, pool, sink):
+    sink.handler.replies.append('451 Try again later')
+    message = enqueue_email('a@example.com', 'Subject', 'Body')
+    before = datetime.utcnow()
+    assert deliver_due_messages(pool, config) == 1
+
+    failed = _reload(message.id)
+    assert failed.status == OutboxMessage.QUEUED
+    assert '451' in failed.last_error
+    # First retry after half to all of the base delay
+    assert before + timedelta(seconds=4) <= failed.next_attempt_at <= datetime.utcnow() + timedelta(seconds=10)
+    assert claim_next_message() is None
+
+    failed.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    assert deliver_due_messages(pool, config) == 1
+    retried = _reload(message.id)
+    assert retried.status == OutboxMessage.SENT
+    assert retried.attempts == 2
+    assert retried.last_error is None
+    assert len(sink.handler.messages) == 1
+
+def test_gives_up_after_max_attempts_or_permanent_failure(config, pool, sink):
+    sink.handler.replies.append('550 No such user')
+    rejected = enqueue_email('nobody@example.com', 'Subject', 'Body')
+    deliver_due_messages(pool, config)
+    assert _reload(rejected.id).status == OutboxMessage.FAILED
+    assert _reload(rejected.id).body is None
+
+    sink.handler.replies.extend(['451 Try again later'] * 3)
+    message = enqueue_email('a@example.com', 'Subject', 'Body')
+    for _ in range(3):
+        assert claim_next_message() == message.id
+        deliver_message(message.id, pool, config)
+        OutboxMessage.query.filter_by(id=message.id).update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+    exhausted = _reload(message.id)
+    assert exhausted.status == OutboxMessage.FAILED
+    assert exhausted.attempts == 3
+    assert not sink.handler.messages
+
+def test_expired_message_is_not_sent(config, pool, sink):
+    message = enqueue_email('a@example.com', 'Subject', 'Body', expires_at=datetime.utcnow() - timedelta(seconds=1))
+    deliver_due_messages(pool, config)
+    expired = _reload(message.id)
+    assert expired.status == OutboxMessage.EXPIRED
+    assert expired.body is None
+    assert not sink.handler.messages
+
+def test_stale_claim_is_recovered(config, pool, sink):
+    message = enqueue_email('a@example.com', 'Subject', 'Body')
+    assert claim_next_message(claim_timeout=120) == message.id
+    # The sender that claimed it never finishes
+    assert claim_next_message(claim_timeout=120) is None
+
+    OutboxMessage.query.filter_by(id=message.id).update({'claimed_at': datetime.utcnow() - timedelta(seconds=121)})
+    db.session.commit()
+    assert claim_next_message(claim_timeout=120) == message.id
+    deliver_message(message.id, pool, config)
+    recovered = _reload(message.id)
+    assert recovered.status == OutboxMessage.SENT
+    assert recovered.attempts == 2
+    assert len(sink.handler.messages) == 1
+
+def test_pool_reuses_connections(config, pool, sink):
+    for i in range(3):
+        enqueue_email(f'user{i}@example.com', 'Subject', 'Body')
+    assert deliver_due_messages(pool, config) == 3
+    assert len(sink.handler.messages) == 3
+    assert sink.handler.sessions == 1
+
+def test_pool_reconnects_after_idle_timeout_and_dead_connections(config, pool, sink):
+    pool.send('', 'a@example.com', 'Subject: one\n\nBody')
+    [(conn, _)] = pool._idle
+    conn.close()
+    pool.send('', 'a@example.com', 'Subject: two\n\nBody')
+    assert sink.handler.sessions == 2
+
+    pool.idle_timeout = -1
+    pool.send('', 'a@example.com', 'Subject: three\n\nBody')
+    assert sink.handler.sessions == 3
+    assert len(sink.handler.messages) == 3
+
+def test_purge_deletes_only_old_finished_messages(config):
+    old = datetime.utcnow() - timedelta(days=8)
+    for status in (OutboxMessage.SENT, OutboxMessage.FAILED, OutboxMessage.EXPIRED, OutboxMessage.QUEUED):
+        db.session.add(OutboxMessage(status=status, recipient='a@example.com', subject='Old', created_at=old))
+    db.session.add(OutboxMessage(status=OutboxMessage.SENT, recipient='a@example.com', subject='New'))
+    db.session.commit()
+
+    assert purge_finished_messages(7 * 86400) == 3
+    assert sorted(m.subject + ':' + m.status for m in OutboxMessage.query) == ['New:sent', 'Old:queued']
+
+def test_delivery_status_is_only_shown_to_the_requesting_session(app, config):
+    client, other = app.test_client(), app.test_client()
+    sent = client.post('/register', json={'email': 'delivery@example.com'}).get_json()
+    url = f"/otp/delivery/{sent['delivery_id']}"
+
+    assert client.get(url).get_json()['status'] == OutboxMessage.QUEUED
+    assert other.get(url).status_code == 404
+    assert other.get(f"{url}?user_id={sent['user_id']}").status_code == 404
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from app.models import AuditJob, EmailAudit, UsageCounter, User
+from app.models.database import db
+from app.services import job_queue
+from app.services.rollups import get_user_stats, rebuild_rollups
+from app.utils.rate_limiter import RateLimiter
+
+class HeldBroker(job_queue.JobBroker):
+    """Keeps submitted jobs queued."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, job_id: int):
+        self.submitted.append(job_id)
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = HeldBroker()
+    monkeypatch.setattr(job_queue, '_broker', broker)
+    return broker
+
+@pytest.fixture
+def user(app_context):
+    user = User(email='rollups@example.com')
+    db.session.add(user)
+    db.session.commit()
+    yield user
+    for model in (AuditJob, EmailAudit, UsageCounter):
+        model.query.filter_by(user_id=user.id).delete()
+    db.session.delete(user)
+    db.session.commit()
+
+def _save_audit(user_id: int, score: int):
+    db.session.add(EmailAudit(
+        user_id=user_id, email_content='Body', audit_result='{}', score=score, file_name='saved.eml',
+        created_at=datetime.utcnow()
+    ))
+    UsageCounter.increment(user_id, datetime.utcnow().date(), 1, score)
+    db.session.commit()
+
+def _counter(user_id: int) -> UsageCounter:
+    db.session.expire_all()
+    return UsageCounter.query.filter_by(user_id=user_id, day=datetime.utcnow().date()).one()
+
+def test_rebuild_keeps_reservations_of_queued_jobs(user, broker):
+    _save_audit(user.id, 7)
+    reserved_on = RateLimiter().reserve(user.id, 1)
+    job = job_queue.enqueue_audit(user.id, 'queued.eml', b'Subject: queued\n\nBody', reserved_on=reserved_on)
+    assert broker.submitted == [job.id]
+
+    rebuild_rollups()
+
+    counter = _counter(user.id)
+    assert (counter.count, counter.score_sum, counter.reserved) == (1, 7, 1)
+    assert UsageCounter.get_count(user.id, reserved_on) == 2
+    assert get_user_stats(user.id, days=1)['audits'] == 1
+
+def test_rebuild_keeps_reservations_of_days_without_audits(user, broker):
+    reserved_on = RateLimiter().reserve(user.id, 2)
+    job_queue.enqueue_audit(user.id, 'queued.eml', b'Subject: queued\n\nBody', reserved_on=reserved_on)
+
+    rebuild_rollups()
+
+    counter = _counter(user.id)
+    assert (counter.count, counter.score_sum, counter.reserved) == (0, 0, 2)
+    assert get_user_stats(user.id, days=1)['audits'] == 0